@@ -0,0 +1,278 @@
+# async_agents.py
+
+import asyncio
+import logging
+from typing import AsyncIterator, List, Optional
+
+from agents import coach_agent, nutritionist_agent
+from agents.context import ContextAssembler, build_context
+from agents.exercise_links import ExerciseLinkIndex
+from agents.manager_agent import FAILED_AGENT_MESSAGE, REFUSAL_MESSAGE, ROUTING_PROMPT, _select_tasks
+from agents.retrieval import DEFAULT_RETRIEVAL_TIMEOUT, join_retrieval_async, start_retrieval
+from agents.router import parse_routing_response
+from agents.tracing import current_span, traced
+
+
+logger = logging.getLogger(__name__)
+
+
+# ----------------------------------------------------------------------
+# Асинхронные версии агентов для AsyncLLM (agents/async_llm.py).
+# Логика и промпты те же, что в coach_agent, nutritionist_agent и
+# manager_agent; ожидание LLM и ретривера не занимает потоки, а
+# CPU-работа (роутер, сборка контекста) уходит в пул через to_thread.
+# ----------------------------------------------------------------------
+
+@traced("trainer")
+async def trainer_agent_async(
+    llm,
+    user_prompt: str,
+    retriever: Optional[object] = None,
+    retrieval_timeout: Optional[float] = DEFAULT_RETRIEVAL_TIMEOUT,
+    link_index: Optional[ExerciseLinkIndex] = None,
+    llm_illustration: bool = False,
+    context: Optional[ContextAssembler] = None
+) -> str:
+    """
+    Асинхронный trainer_agent. llm — объект с корутиной .achat(prompt).
+    """
+    if link_index is not None and not llm_illustration:
+        retriever = None
+
+    retrieval = start_retrieval(retriever, user_prompt)
+
+    first_prompt = f"{coach_agent.SYSTEM_PROMPT}\n\nЗапрос пользователя:\n{user_prompt}"
+    first_response = await llm.achat(first_prompt)
+
+    if link_index is not None:
+        annotated, links = link_index.annotate(first_response)
+        if links or retrieval is None:
+            if retrieval is not None:
+                retrieval.cancel()
+            return annotated
+
+    relevant_docs = await join_retrieval_async(retrieval, retrieval_timeout)
+    if not relevant_docs:
+        return first_response
+
+    additional_info = await asyncio.to_thread(build_context, first_response, relevant_docs, context)
+    return await llm.achat(coach_agent._build_second_prompt(additional_info, first_response))
+
+
+@traced("trainer")
+async def trainer_agent_async_stream(
+    llm,
+    user_prompt: str,
+    retriever: Optional[object] = None,
+    retrieval_timeout: Optional[float] = DEFAULT_RETRIEVAL_TIMEOUT,
+    link_index: Optional[ExerciseLinkIndex] = None,
+    llm_illustration: bool = False,
+    context: Optional[ContextAssembler] = None
+) -> AsyncIterator[str]:
+    """
+    Асинхронный trainer_agent_stream. llm — объект с .achat и .achat_stream.
+    """
+    first_prompt = f"{coach_agent.SYSTEM_PROMPT}\n\nЗапрос пользователя:\n{user_prompt}"
+
+    if link_index is not None and not (llm_illustration and retriever):
+        async for chunk in link_index.annotate_stream_async(llm.achat_stream(first_prompt)):
+            yield chunk
+        return
+
+    if not retriever:
+        async for chunk in llm.achat_stream(first_prompt):
+            yield chunk
+        return
+
+    retrieval = start_retrieval(retriever, user_prompt)
+    first_response = await llm.achat(first_prompt)
+
+    if link_index is not None:
+        annotated, links = link_index.annotate(first_response)
+        if links:
+            retrieval.cancel()
+            yield annotated
+            return
+
+    relevant_docs = await join_retrieval_async(retrieval, retrieval_timeout)
+    if not relevant_docs:
+        yield first_response
+        return
+
+    additional_info = await asyncio.to_thread(build_context, first_response, relevant_docs, context)
+    async for chunk in llm.achat_stream(coach_agent._build_second_prompt(additional_info, first_response)):
+        yield chunk
+
+
+@traced("nutritionist")
+async def nutritionist_agent_async(
+    llm,
+    user_prompt: str,
+    retriever: Optional[object] = None,
+    retrieval_timeout: Optional[float] = DEFAULT_RETRIEVAL_TIMEOUT,
+    context: Optional[ContextAssembler] = None
+) -> str:
+    """
+    Асинхронный nutritionist_agent. llm — объект с корутиной .achat(prompt).
+    """
+    retrieval = start_retrieval(retriever, user_prompt)
+
+    first_prompt = f"{nutritionist_agent.SYSTEM_PROMPT}\n\nЗапрос пользователя:\n{user_prompt}"
+    first_response = await llm.achat(first_prompt)
+
+    relevant_docs = await join_retrieval_async(retrieval, retrieval_timeout)
+    if not relevant_docs:
+        return first_response
+
+    additional_info = await asyncio.to_thread(build_context, user_prompt, relevant_docs, context)
+    return await llm.achat(nutritionist_agent._build_second_prompt(additional_info, first_response))
+
+
+@traced("nutritionist")
+async def nutritionist_agent_async_stream(
+    llm,
+    user_prompt: str,
+    retriever: Optional[object] = None,
+    retrieval_timeout: Optional[float] = DEFAULT_RETRIEVAL_TIMEOUT,
+    context: Optional[ContextAssembler] = None
+) -> AsyncIterator[str]:
+    """
+    Асинхронный nutritionist_agent_stream. llm — объект с .achat и .achat_stream.
+    """
+    first_prompt = f"{nutritionist_agent.SYSTEM_PROMPT}\n\nЗапрос пользователя:\n{user_prompt}"
+
+    if not retriever:
+        async for chunk in llm.achat_stream(first_prompt):
+            yield chunk
+        return
+
+    retrieval = start_retrieval(retriever, user_prompt)
+    first_response = await llm.achat(first_prompt)
+
+    relevant_docs = await join_retrieval_async(retrieval, retrieval_timeout)
+    if not relevant_docs:
+        yield first_response
+        return
+
+    additional_info = await asyncio.to_thread(build_context, user_prompt, relevant_docs, context)
+    async for chunk in llm.achat_stream(nutritionist_agent._build_second_prompt(additional_info, first_response)):
+        yield chunk
+
+
+@traced("routing")
+async def route_query_async(llm, user_query: str, router=None) -> List[int]:
+    """
+    Асинхронный route_query: локальный роутер считается в пуле потоков,
+    LLM спрашивается только для неоднозначных запросов.
+    """
+    if router is not None:
+        selected_options, source, confidence = await asyncio.to_thread(router.classify, user_query)
+        current_span().set(source=source, confidence=round(float(confidence), 3))
+        if selected_options is not None:
+            return selected_options
+
+    current_span().set(source="llm")
+    routing_response = await llm.achat(ROUTING_PROMPT.format(user_query=user_query))
+    return parse_routing_response(routing_response)
+
+
+async def _run_agent_safe_async(title: str, agent_fn, llm, user_query: str, retriever) -> str:
+    try:
+        answer = await agent_fn(llm, user_query, retriever=retriever)
+    except Exception:
+        logger.exception("Агент '%s' завершился с ошибкой", title)
+        answer = FAILED_AGENT_MESSAGE
+    return f"{title}:\n{answer}"
+
+
+@traced("manager", root=True)
+async def manager_agent_async(
+    llm,
+    user_query: str,
+    trainer_agent_fn,
+    nutritionist_agent_fn,
+    coach_retriever=None,
+    nutritionist_retriever=None,
+    router=None
+) -> str:
+    """
+    Асинхронный manager_agent: выбранные агенты выполняются одновременно
+    в одном event loop, ошибка одного агента не теряет ответ другого.
+
+    Аргументы те же, что у manager_agent; trainer_agent_fn и
+    nutritionist_agent_fn — корутины (например, trainer_agent_async).
+    """
+    selected_options = await route_query_async(llm, user_query, router=router)
+    if 0 in selected_options:
+        return REFUSAL_MESSAGE
+
+    tasks = _select_tasks(
+        selected_options,
+        trainer_agent_fn,
+        nutritionist_agent_fn,
+        coach_retriever,
+        nutritionist_retriever
+    )
+    responses = await asyncio.gather(*(
+        _run_agent_safe_async(title, agent_fn, llm, user_query, retriever)
+        for title, agent_fn, retriever in tasks
+    ))
+    return "\n\n".join(responses)
+
+
+@traced("manager", root=True)
+async def manager_agent_async_stream(
+    llm,
+    user_query: str,
+    trainer_agent_fn,
+    nutritionist_agent_fn,
+    coach_retriever=None,
+    nutritionist_retriever=None,
+    router=None
+) -> AsyncIterator[str]:
+    """
+    Асинхронный manager_agent_stream: агенты работают одновременно,
+    фрагменты отдаются в фиксированном порядке (сначала тренер).
+
+    trainer_agent_fn и nutritionist_agent_fn — асинхронные генераторы
+    (например, trainer_agent_async_stream).
+    """
+    selected_options = await route_query_async(llm, user_query, router=router)
+    if 0 in selected_options:
+        yield REFUSAL_MESSAGE
+        return
+
+    tasks = _select_tasks(
+        selected_options,
+        trainer_agent_fn,
+        nutritionist_agent_fn,
+        coach_retriever,
+        nutritionist_retriever
+    )
+    done = object()
+
+    async def produce(title, agent_fn, retriever, chunks: asyncio.Queue):
+        try:
+            async for chunk in agent_fn(llm, user_query, retriever=retriever):
+                await chunks.put(chunk)
+        except Exception:
+            logger.exception("Агент '%s' завершился с ошибкой", title)
+            await chunks.put(FAILED_AGENT_MESSAGE)
+        finally:
+            await chunks.put(done)
+
+    streams = []
+    for title, agent_fn, retriever in tasks:
+        chunks: asyncio.Queue = asyncio.Queue()
+        streams.append((title, chunks, asyncio.create_task(produce(title, agent_fn, retriever, chunks))))
+
+    try:
+        for i, (title, chunks, _) in enumerate(streams):
+            separator = "\n\n" if i > 0 else ""
+            yield f"{separator}{title}:\n"
+            while (chunk := await chunks.get()) is not done:
+                yield chunk
+    finally:
+        # Клиент ушёл посреди ответа — агентов больше некому читать
+        for _, _, task in streams:
+            task.cancel()
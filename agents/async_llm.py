@@ -0,0 +1,115 @@
+# async_llm.py
+
+import importlib.util
+from time import perf_counter
+from typing import AsyncIterator, Optional
+
+from agents.llm import COMPLETION_TOKENS_RESERVE, _record_usage
+from agents.rate_limiter import LLMScheduler, estimate_tokens, get_scheduler
+from agents.tracing import span
+
+
+def http2_available() -> bool:
+    """
+    HTTP/2 в httpx требует пакета h2; без него клиент работает по HTTP/1.1.
+    """
+    return importlib.util.find_spec("h2") is not None
+
+
+def create_async_client(
+    api_key: str,
+    server_url: Optional[str] = None,
+    max_connections: int = 50,
+    max_keepalive_connections: int = 20,
+    http2: Optional[bool] = None
+):
+    """
+    Mistral-клиент с одним общим на процесс пулом асинхронных соединений.
+
+    По HTTP/2 все запросы процесса мультиплексируются в нескольких
+    соединениях, а не открывают соединение на каждый вызов.
+
+    Аргументы:
+        api_key: ключ Mistral
+        server_url: адрес API (например, локальной заглушки helpers/mock_mistral_server.py)
+        max_connections: максимум соединений в пуле
+        max_keepalive_connections: сколько соединений держать открытыми
+        http2: включить HTTP/2; по умолчанию — если установлен h2
+    """
+    import httpx
+    from mistralai import Mistral
+
+    async_client = httpx.AsyncClient(
+        http2=http2_available() if http2 is None else http2,
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections),
+        timeout=httpx.Timeout(120.0, connect=10.0)
+    )
+    return Mistral(api_key=api_key, server_url=server_url, async_client=async_client)
+
+
+class AsyncLLM:
+    """
+    Асинхронный аналог SimpleLLM: методы .achat(prompt) и .achat_stream(prompt)
+    через complete_async / stream_async. Вызовы проходят через тот же
+    LLMScheduler, но ждут бюджета через asyncio.sleep и не занимают потоки.
+    """
+
+    def __init__(self, client, model: str, scheduler: Optional[LLMScheduler] = None):
+        self.client = client
+        self.model = model
+        self.scheduler = scheduler or get_scheduler()
+
+    async def achat(self, prompt: str) -> str:
+        estimated = estimate_tokens(prompt) + COMPLETION_TOKENS_RESERVE
+        with span("llm.chat", model=self.model) as current:
+            response = await self.scheduler.acall(
+                lambda: self.client.chat.complete_async(
+                    model=self.model,
+                    messages=[
+                        {"role": "user", "content": prompt}
+                    ]
+                ),
+                estimated_tokens=estimated
+            )
+            usage = getattr(response, "usage", None)
+            _record_usage(current, usage)
+        self.scheduler.record_usage(estimated, getattr(usage, "total_tokens", None))
+        return response.choices[0].message.content
+
+    async def achat_stream(self, prompt: str) -> AsyncIterator[str]:
+        """
+        Потоковый вариант achat. Лимиты и повторы применяются к открытию потока.
+        """
+        estimated = estimate_tokens(prompt) + COMPLETION_TOKENS_RESERVE
+        with span("llm.stream", activate=False, model=self.model) as current:
+            start = perf_counter()
+            stream = await self.scheduler.acall(
+                lambda: self.client.chat.stream_async(
+                    model=self.model,
+                    messages=[
+                        {"role": "user", "content": prompt}
+                    ]
+                ),
+                estimated_tokens=estimated
+            )
+
+            total_tokens = None
+            first_chunk = True
+            # finally: потребитель может закрыть генератор, не дочитав поток
+            try:
+                async with stream:
+                    async for event in stream:
+                        chunk = event.data
+                        if chunk.usage is not None:
+                            total_tokens = chunk.usage.total_tokens
+                            _record_usage(current, chunk.usage)
+                        if not chunk.choices:
+                            continue
+                        content = chunk.choices[0].delta.content
+                        if isinstance(content, str) and content:
+                            if first_chunk:
+                                current.set(first_chunk_ms=round((perf_counter() - start) * 1000, 1))
+                                first_chunk = False
+                            yield content
+            finally:
+                self.scheduler.record_usage(estimated, total_tokens)
@@ -0,0 +1,79 @@
+# async_runtime.py
+
+import queue
+import asyncio
+import threading
+import contextvars
+from typing import AsyncIterator, Awaitable, Iterator, TypeVar
+
+
+T = TypeVar("T")
+
+
+async def _in_context(awaitable: Awaitable[T], context: contextvars.Context) -> T:
+    # Задача в чужом event loop не видит contextvars вызывающего потока
+    # (например, текущий спан трассировки) — переносим их явно
+    for var, value in context.items():
+        var.set(value)
+    return await awaitable
+
+
+class _Failure:
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+
+class AsyncRuntime:
+    """
+    Один event loop на процесс в фоновом потоке.
+
+    Синхронный код (скрипт Streamlit, пакетный прогон) отдаёт ему корутины
+    и асинхронные генераторы, а все вызовы LLM всех сессий выполняются
+    в этом loop через общий пул соединений, не занимая по потоку на запрос.
+    """
+
+    def __init__(self, name: str = "async-llm"):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name=name, daemon=True)
+        self._thread.start()
+
+    def run(self, awaitable: Awaitable[T], timeout: float = None) -> T:
+        """
+        Выполняет корутину в loop и ждёт результат в текущем потоке.
+        """
+        context = contextvars.copy_context()
+        future = asyncio.run_coroutine_threadsafe(_in_context(awaitable, context), self.loop)
+        return future.result(timeout)
+
+    def iterate(self, stream: AsyncIterator[T]) -> Iterator[T]:
+        """
+        Синхронный итератор поверх асинхронного генератора: фрагменты
+        передаются через потокобезопасную очередь по мере появления.
+        Если потребитель бросил итератор, генератор в loop отменяется.
+        """
+        items: queue.Queue = queue.Queue()
+        done = object()
+
+        async def pump():
+            try:
+                async for item in stream:
+                    items.put(item)
+            except BaseException as exc:
+                items.put(_Failure(exc))
+                raise
+            finally:
+                items.put(done)
+
+        future = asyncio.run_coroutine_threadsafe(_in_context(pump(), contextvars.copy_context()), self.loop)
+        try:
+            while (item := items.get()) is not done:
+                if isinstance(item, _Failure):
+                    raise item.exc
+                yield item
+        finally:
+            if not future.done():
+                future.cancel()
+
+    def close(self) -> None:
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
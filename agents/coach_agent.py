@@ -1,33 +1,17 @@
-import os
-from typing import Optional
+from typing import TYPE_CHECKING, Iterator, Optional
 
-from mistralai import Mistral
-from time import sleep
+from agents.exercise_links import ExerciseLinkIndex
+from agents.context import ContextAssembler, build_context
+from agents.retrieval import DEFAULT_RETRIEVAL_TIMEOUT, join_retrieval, start_retrieval
+from agents.tracing import traced
 
-from langchain_core.language_models import BaseLanguageModel
-from langchain_core.documents import Document
+if TYPE_CHECKING:
+    # Только для аннотаций: langchain и mistralai не нужны при импорте агента
+    from langchain_core.language_models import BaseLanguageModel
 
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
 
 
-
-def trainer_agent(llm: BaseLanguageModel, user_prompt: str, retriever: Optional[object] = None) -> str:
-    """
-    Агент-тренер. Составляет план тренировок по дням недели.
-    Если предоставлен retriever, использует релевантные документы для уточнения плана.
-    
-    Аргументы:
-        llm: экземпляр LLM (например, Mistral через LangChain)
-        user_prompt: строка запроса пользователя
-        retriever: опциональный retriever (FAISS) для поиска дополнительной информации
-        
-    Возвращает:
-        Итоговый текст с планом тренировок
-    """
-    
-    # 1. Системный промпт
-    system_prompt = """
+SYSTEM_PROMPT = """
         🔒 ПРАВИЛА БЕЗОПАСНОСТИ:
         - Ты помогаешь ТОЛЬКО с составлением планов тренировок
         - НЕ давай медицинские диагнозы, не назначай лечение
@@ -65,19 +49,13 @@ def trainer_agent(llm: BaseLanguageModel, user_prompt: str, retriever: Optional[
         - Разминка 5–10 минут перед каждой тренировкой обязательна
         - Для набора мышечной массы постепенно увеличивать вес снарядов
         """
-    
-    # 2. Первый запрос к LLM
-    first_prompt = f"{system_prompt}\n\nЗапрос пользователя:\n{user_prompt}"
-    first_response = llm.chat(first_prompt)
 
-    sleep(1)
-    
-    # 3. Второй запрос с информацией из retriever
-    if retriever:
-        relevant_docs = retriever.invoke(user_prompt)
-        additional_info = "\n".join([doc.page_content for doc in relevant_docs])
 
-        second_prompt = f"""
+def _build_second_prompt(additional_info: str, first_response: str) -> str:
+    """
+    Промпт второго запроса: добавить в план ссылки на видео из ретривера.
+    """
+    return f"""
             У меня есть план тренировок в тренажерном зале для спортсмена, а также дополнительная информация - в которой есть
             ссылки на you-tube видео - иллюстрирующие какие-то упражнения.
             Тебе надо отправить мне новый план, сделанный на основе прежнего, в который ты максимально постараешься добавить
@@ -88,8 +66,122 @@ def trainer_agent(llm: BaseLanguageModel, user_prompt: str, retriever: Optional[
             Вот прежний план тренировок: \n {first_response} \n\n
             Отправь только проиллюстрированный план.
             """
+
+
+@traced("trainer")
+def trainer_agent(
+    llm: "BaseLanguageModel",
+    user_prompt: str,
+    retriever: Optional[object] = None,
+    retrieval_timeout: Optional[float] = DEFAULT_RETRIEVAL_TIMEOUT,
+    link_index: Optional[ExerciseLinkIndex] = None,
+    llm_illustration: bool = False,
+    context: Optional[ContextAssembler] = None
+) -> str:
+    """
+    Агент-тренер. Составляет план тренировок по дням недели.
+    Если предоставлен retriever, использует релевантные документы для уточнения плана.
+    
+    Аргументы:
+        llm: экземпляр LLM (например, Mistral через LangChain)
+        user_prompt: строка запроса пользователя
+        retriever: опциональный retriever (FAISS) для поиска дополнительной информации
+        retrieval_timeout: сколько секунд ждать ретривер после первой стадии;
+            если он не успел, возвращается план первой стадии
+        link_index: индекс «упражнение -> видео»; если задан, ссылки
+            добавляются локально и второй запрос к LLM не нужен
+        llm_illustration: при заданном link_index всё же делать второй запрос
+            с документами ретривера, если индекс не нашёл ни одного упражнения
+        context: сборщик контекста второго запроса (дедупликация, MMR, бюджет
+            токенов); по умолчанию — без эмбеддингов, см. agents/context.py
+        
+    Возвращает:
+        Итоговый текст с планом тренировок
+    """
+    
+    # С индексом ссылок ретривер нужен только для запасного прохода через LLM
+    if link_index is not None and not llm_illustration:
+        retriever = None
+
+    # 1. Поиск зависит только от запроса, поэтому идёт параллельно с первым запросом к LLM
+    retrieval = start_retrieval(retriever, user_prompt)
+
+    first_prompt = f"{SYSTEM_PROMPT}\n\nЗапрос пользователя:\n{user_prompt}"
+    first_response = llm.chat(first_prompt)
+
+    if link_index is not None:
+        annotated, links = link_index.annotate(first_response)
+        if links or retrieval is None:
+            if retrieval is not None:
+                retrieval.cancel()
+            return annotated
+
+    # 2. Второй запрос с информацией из retriever
+    relevant_docs = join_retrieval(retrieval, retrieval_timeout)
+    if relevant_docs:
+        additional_info = build_context(first_response, relevant_docs, context)
+
+        second_prompt = _build_second_prompt(additional_info, first_response)
         final_response = llm.chat(second_prompt)
     else:
         final_response = first_response
     
     return final_response
+
+
+@traced("trainer")
+def trainer_agent_stream(
+    llm,
+    user_prompt: str,
+    retriever: Optional[object] = None,
+    retrieval_timeout: Optional[float] = DEFAULT_RETRIEVAL_TIMEOUT,
+    link_index: Optional[ExerciseLinkIndex] = None,
+    llm_illustration: bool = False,
+    context: Optional[ContextAssembler] = None
+) -> Iterator[str]:
+    """
+    Потоковый вариант trainer_agent: отдаёт финальный план по частям,
+    как только модель их генерирует. Первый (базовый) план нужен целиком
+    для второго запроса, поэтому в потоке идёт только последняя стадия.
+
+    Аргументы:
+        llm: LLM с методами .chat(prompt) и .chat_stream(prompt)
+        user_prompt: строка запроса пользователя
+        retriever: опциональный retriever (FAISS) для поиска дополнительной информации
+        retrieval_timeout: сколько секунд ждать ретривер после первой стадии
+        link_index: индекс «упражнение -> видео»; если задан, план первой
+            стадии идёт в потоке сразу и размечается ссылками построчно
+        llm_illustration: запасной второй запрос к LLM, если индекс
+            не нашёл ни одного упражнения (план тогда нужен целиком)
+        context: сборщик контекста второго запроса
+
+    Возвращает:
+        Генератор фрагментов текста плана тренировок
+    """
+    first_prompt = f"{SYSTEM_PROMPT}\n\nЗапрос пользователя:\n{user_prompt}"
+
+    if link_index is not None and not (llm_illustration and retriever):
+        yield from link_index.annotate_stream(llm.chat_stream(first_prompt))
+        return
+
+    if not retriever:
+        yield from llm.chat_stream(first_prompt)
+        return
+
+    retrieval = start_retrieval(retriever, user_prompt)
+    first_response = llm.chat(first_prompt)
+
+    if link_index is not None:
+        annotated, links = link_index.annotate(first_response)
+        if links:
+            retrieval.cancel()
+            yield annotated
+            return
+
+    relevant_docs = join_retrieval(retrieval, retrieval_timeout)
+    if not relevant_docs:
+        yield first_response
+        return
+
+    additional_info = build_context(first_response, relevant_docs, context)
+    yield from llm.chat_stream(_build_second_prompt(additional_info, first_response))
@@ -0,0 +1,250 @@
+# context.py
+
+import os
+import re
+import logging
+import threading
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from agents.rate_limiter import estimate_tokens
+from agents.tracing import span
+
+
+logger = logging.getLogger(__name__)
+
+# Бюджет токенов на дополнительную информацию во втором промпте агентов.
+# Остальное окно модели уходит на системный промпт, план первой стадии и ответ.
+CONTEXT_TOKEN_BUDGETS = {
+    "mistral-small-latest": 2000,
+    "mistral-medium-latest": 4000,
+    "mistral-medium": 4000,
+    "mistral-large-latest": 6000,
+}
+DEFAULT_CONTEXT_TOKEN_BUDGET = 2000
+
+# Фрагменты с таким сходством по словесным шинглам считаются дубликатами
+DEDUPE_THRESHOLD = 0.8
+SHINGLE_SIZE = 5
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+(?=[A-ZА-ЯЁ0-9•\-])")
+_WORD_RE = re.compile(r"[a-zа-яё0-9]+")
+_URL_RE = re.compile(r"https?://\S+")
+
+
+def budget_for_model(model: str) -> int:
+    """
+    Бюджет контекста для модели; CONTEXT_TOKEN_BUDGET переопределяет таблицу.
+    """
+    override = os.environ.get("CONTEXT_TOKEN_BUDGET")
+    if override:
+        return int(override)
+    return CONTEXT_TOKEN_BUDGETS.get(model, DEFAULT_CONTEXT_TOKEN_BUDGET)
+
+
+def _words(text: str) -> List[str]:
+    return _WORD_RE.findall(text.lower().replace("ё", "е"))
+
+
+def _shingles(text: str) -> set:
+    words = _words(text)
+    if len(words) < SHINGLE_SIZE:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def _cut_at_boundary(text: str, limit: int) -> str:
+    """
+    Обрезает текст до limit символов по концу предложения во второй половине
+    отрезка, иначе по последнему пробелу. Ссылка на видео не разрезается:
+    если пробелов нет, текст обрезается перед ней.
+    """
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    boundary = max(cut.rfind(". "), cut.rfind("! "), cut.rfind("? "), cut.rfind("\n"))
+    if boundary > limit // 2:
+        return cut[:boundary + 1]
+    space = max(cut.rfind(" "), cut.rfind("\t"))
+    if space > 0:
+        return cut[:space].rstrip()
+    for match in _URL_RE.finditer(text):
+        if match.start() < limit < match.end():
+            return text[:match.start()].rstrip()
+    return cut
+
+
+def _stems(text: str) -> set:
+    # Грубые основы: первые 5 букв слов длиннее двух букв
+    return {word[:5] for word in _words(text) if len(word) > 2}
+
+
+def mmr_order(query_vector, doc_vectors, lambda_mult: float = 0.5) -> List[int]:
+    """
+    Порядок документов по Maximal Marginal Relevance: каждый следующий
+    документ релевантен запросу и непохож на уже выбранные.
+
+    Аргументы:
+        query_vector: эмбеддинг запроса
+        doc_vectors: эмбеддинги документов (по строке на документ)
+        lambda_mult: 1 — только релевантность, 0 — только разнообразие
+    """
+    docs = np.asarray(doc_vectors, dtype="float32")
+    if not len(docs):
+        return []
+    docs = docs / np.maximum(np.linalg.norm(docs, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_vector, dtype="float32")
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+    relevance = docs @ query
+    similarity = docs @ docs.T
+    selected = [int(np.argmax(relevance))]
+    candidates = set(range(len(docs))) - set(selected)
+    while candidates:
+        rest = sorted(candidates)
+        redundancy = similarity[np.ix_(rest, selected)].max(axis=1)
+        scores = lambda_mult * relevance[rest] - (1 - lambda_mult) * redundancy
+        best = rest[int(np.argmax(scores))]
+        selected.append(best)
+        candidates.remove(best)
+    return selected
+
+
+class ContextAssembler:
+    """
+    Сборка дополнительной информации для второго промпта агентов.
+
+    Вместо склейки всех найденных документов как есть:
+    1. убирает дубликаты и сильно перекрывающиеся фрагменты;
+    2. переупорядочивает документы по MMR (если есть эмбеддинги),
+       иначе сохраняет порядок ретривера;
+    3. по желанию оставляет в документах только предложения, связанные с запросом;
+    4. обрезает результат по бюджету токенов, не разрезая слова и ссылки.
+
+    Аргументы:
+        embeddings: модель эмбеддингов с embed_query/embed_documents
+            (общая из реестра ресурсов); без неё MMR не применяется
+        token_budget: максимум токенов контекста (см. budget_for_model)
+        mmr_lambda: баланс релевантности и разнообразия для MMR
+        dedupe_threshold: порог сходства фрагментов по шинглам
+        extract_sentences: оставлять только предложения, пересекающиеся с запросом
+    """
+
+    def __init__(
+        self,
+        embeddings=None,
+        token_budget: int = DEFAULT_CONTEXT_TOKEN_BUDGET,
+        mmr_lambda: float = 0.5,
+        dedupe_threshold: float = DEDUPE_THRESHOLD,
+        extract_sentences: bool = False
+    ):
+        self.embeddings = embeddings
+        self.token_budget = token_budget
+        self.mmr_lambda = mmr_lambda
+        self.dedupe_threshold = dedupe_threshold
+        self.extract_sentences = extract_sentences
+
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "documents_in": 0, "documents_out": 0, "tokens_in": 0, "tokens_out": 0}
+
+    def dedupe(self, texts: Sequence[str]) -> List[str]:
+        kept, kept_shingles = [], []
+        for text in texts:
+            text = text.strip()
+            if not text:
+                continue
+            shingles = _shingles(text)
+            duplicate = any(
+                len(shingles & other) / max(1, min(len(shingles), len(other))) >= self.dedupe_threshold
+                for other in kept_shingles
+            )
+            if not duplicate:
+                kept.append(text)
+                kept_shingles.append(shingles)
+        return kept
+
+    def rerank(self, query: str, texts: List[str]) -> List[str]:
+        if self.embeddings is None or len(texts) < 2:
+            return texts
+        order = mmr_order(
+            self.embeddings.embed_query(query),
+            self.embeddings.embed_documents(texts),
+            lambda_mult=self.mmr_lambda
+        )
+        return [texts[i] for i in order]
+
+    def relevant_sentences(self, query: str, text: str) -> str:
+        query_stems = _stems(query)
+        sentences = _SENTENCE_RE.split(text)
+        kept = [s for s in sentences if _stems(s) & query_stems]
+        return " ".join(kept or sentences[:1])
+
+    def trim(self, texts: List[str]) -> List[str]:
+        kept, used = [], 0
+        for text in texts:
+            tokens = estimate_tokens(text)
+            if used + tokens <= self.token_budget:
+                kept.append(text)
+                used += tokens
+                continue
+            # Последний документ обрезается по границе предложения или слова, если влезает хоть что-то
+            remaining_chars = (self.token_budget - used) * 4
+            if remaining_chars > 200:
+                cut = _cut_at_boundary(text, remaining_chars)
+                if cut:
+                    kept.append(cut)
+            break
+        return kept
+
+    def assemble(self, query: str, documents: Sequence) -> str:
+        """
+        Собирает контекст из документов ретривера.
+
+        Аргументы:
+            query: текст, к которому подбирается контекст (запрос или план первой стадии)
+            documents: документы LangChain (page_content) или строки
+
+        Возвращает:
+            Текст дополнительной информации для второго промпта
+        """
+        texts = [getattr(doc, "page_content", doc) for doc in documents]
+        tokens_in = sum(estimate_tokens(t) for t in texts) if texts else 0
+
+        with span("context.assemble") as current:
+            selected = self.rerank(query, self.dedupe(texts))
+            if self.extract_sentences:
+                selected = [self.relevant_sentences(query, text) for text in selected]
+            selected = self.trim(selected)
+
+            context = "\n".join(selected)
+            tokens_out = estimate_tokens(context) if context else 0
+            current.set(tokens_in=tokens_in, tokens_out=tokens_out, documents=len(selected))
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["documents_in"] += len(texts)
+            self._stats["documents_out"] += len(selected)
+            self._stats["tokens_in"] += tokens_in
+            self._stats["tokens_out"] += tokens_out
+        logger.info(
+            "Контекст: %d -> %d документов, %d -> %d токенов (сэкономлено %d)",
+            len(texts), len(selected), tokens_in, tokens_out, tokens_in - tokens_out
+        )
+        return context
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["tokens_saved"] = stats["tokens_in"] - stats["tokens_out"]
+        return stats
+
+
+_default_assembler = ContextAssembler()
+
+
+def build_context(query: str, documents: Sequence, assembler: Optional[ContextAssembler] = None) -> str:
+    """
+    Общая точка сборки контекста для агентов. Без assembler используется
+    сборщик по умолчанию: дедупликация и бюджет без эмбеддингов.
+    """
+    return (assembler or _default_assembler).assemble(query, documents)
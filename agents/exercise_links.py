@@ -0,0 +1,291 @@
+# exercise_links.py
+
+import re
+import json
+import difflib
+from pathlib import Path
+from typing import AsyncIterable, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from agents.tracing import span
+
+
+# Файл индекса рядом с базой тренера (см. helpers/creating_db.py)
+EXERCISE_LINKS_FILE = "exercise_links.json"
+
+# Поля карточек упражнений в базе знаний. Записи в PDF оформлены по-разному,
+# поэтому значение поля читается до следующей известной метки.
+FIELD_LABELS = (
+    "Нормализованное упражнение", "Название упражнения (нормализовано)", "Название упражнения",
+    "Название", "Группа мышц", "Основные мышцы", "Вторичные мышцы", "Целевые мышцы",
+    "Ключевые элементы техники", "Ключевые моменты техники", "Ключевое", "Примечание",
+    "Доп. информация", "Теги для RAG", "Теги для retriever", "Теги", "Исходный title",
+    "Ссылка", "Shorts",
+)
+NAME_LABELS = ("Нормализованное упражнение", "Название упражнения (нормализовано)", "Название упражнения", "Название")
+
+_LABEL_RE = re.compile("(" + "|".join(re.escape(label) for label in FIELD_LABELS) + "):")
+_URL_RE = re.compile(r"https?://(?:www\.)?(?:youtube\.com|youtu\.be)/\S+")
+# Начало карточки: «1. Name», «1) Name», «Название: ...» или «Leg Press – Жим ногами»
+_RECORD_START_RE = re.compile(
+    r"(?:(?<=\s)|^)(?:\d+[.)]\s+(?=[A-Za-z])|(?=(?:%s):)|(?=[A-Z][A-Za-z -]+ – [А-ЯЁ]))"
+    % "|".join(re.escape(label) for label in NAME_LABELS)
+)
+
+# Строка плана с упражнением: «- Жим штанги лёжа – 3 подхода по 10 повторений»
+_PLAN_ITEM_RE = re.compile(r"^(?P<indent>\s*)(?:[-•*]|\d+[.)])\s+(?P<body>.+)$")
+_NAME_END_RE = re.compile(r"\s[–—-]\s|:|\s\d+\s*(?:x|х|×)\s*\d")
+
+_STOP_WORDS = {"в", "во", "на", "с", "со", "к", "ко", "по", "или", "и", "для", "из", "от", "до", "a", "the", "or", "with"}
+STEM_LENGTH = 5
+
+DEFAULT_THRESHOLD = 0.6
+
+
+def _has_cyrillic(text: str) -> bool:
+    return bool(re.search("[а-яё]", text, re.IGNORECASE))
+
+
+def normalize_exercise(name: str) -> str:
+    """
+    Приводит название упражнения к канонической форме:
+    нижний регистр, ё -> е, только буквы и цифры через один пробел.
+    """
+    name = name.lower().replace("ё", "е")
+    return " ".join(re.findall(r"[a-zа-я0-9]+", name))
+
+
+def exercise_stems(name: str) -> List[str]:
+    """
+    Грубые основы слов названия: первые STEM_LENGTH букв без служебных слов.
+    Этого хватает, чтобы «гантелями» и «гантелей» совпадали.
+    """
+    return [word[:STEM_LENGTH] for word in normalize_exercise(name).split() if word not in _STOP_WORDS]
+
+
+def _name_aliases(raw: str) -> List[str]:
+    """
+    Варианты названия из одного поля: «English / Русский», «English – Русский»
+    и перевод в скобках («Pec Deck Fly (разведение рук в тренажёре)»).
+    Уточнения в скобках на том же языке («(нижний блок)») отдельным
+    вариантом не считаются.
+    """
+    aliases = []
+    for part in re.split(r"\s/\s|\s–\s", raw):
+        part = re.sub(r"\((?:Cbum|cbum)\)", "", part).strip(" .,")
+        outer = re.sub(r"\([^)]*\)", "", part).strip(" .,")
+        if outer:
+            aliases.append(outer)
+        for inner in re.findall(r"\(([^)]*)\)", part):
+            if inner.strip() and _has_cyrillic(inner) != _has_cyrillic(outer):
+                aliases.append(inner.strip())
+    return aliases
+
+
+def _parse_record(text: str) -> Optional[dict]:
+    url = _URL_RE.search(text)
+    if url is None:
+        return None
+
+    labels = list(_LABEL_RE.finditer(text))
+    fields: Dict[str, str] = {}
+    for i, label in enumerate(labels):
+        end = labels[i + 1].start() if i + 1 < len(labels) else len(text)
+        fields.setdefault(label.group(1), text[label.end():end].strip())
+
+    aliases = []
+    header = re.sub(r"^\d+[.)]\s+", "", text[:labels[0].start()] if labels else text).strip()
+    if header:
+        aliases.extend(_name_aliases(header))
+    for label in NAME_LABELS:
+        if label in fields:
+            aliases.extend(_name_aliases(fields[label]))
+
+    unique = list(dict.fromkeys(a for a in aliases if normalize_exercise(a)))
+    if not unique:
+        return None
+    # Планы пишутся по-русски, поэтому основным названием берётся русское
+    name = next((a for a in unique if _has_cyrillic(a)), unique[0])
+    return {"name": name, "aliases": unique, "url": url.group(0).rstrip(".,;)")}
+
+
+def extract_exercise_links(text: str, source: Optional[str] = None) -> List[dict]:
+    """
+    Извлекает из текста базы знаний карточки «упражнение -> ссылка на видео».
+
+    Аргументы:
+        text: текст PDF (переносы и повторные пробелы не важны)
+        source: имя исходного файла, сохраняется в записи
+
+    Возвращает:
+        Список записей {"name", "aliases", "url", "source"} в порядке документа
+    """
+    text = " ".join(text.split())
+    # Шаблон «Leg Press – Жим» срабатывает и внутри названия («Press – Жим»),
+    # поэтому новая карточка начинается, только если в предыдущей уже были поля
+    starts: List[int] = []
+    for match in _RECORD_START_RE.finditer(text):
+        if not starts or _LABEL_RE.search(text, starts[-1], match.start()):
+            starts.append(match.start())
+    segments = [text[start:end] for start, end in zip(starts, starts[1:] + [len(text)])]
+
+    # Фрагмент без ссылки — продолжение предыдущей карточки
+    # (например, «1. Name Ссылка: ... Название упражнения: ...»)
+    records: List[str] = []
+    for segment in segments:
+        if records and not _URL_RE.search(segment):
+            records[-1] += " " + segment
+        else:
+            records.append(segment)
+
+    entries = []
+    seen_urls = set()
+    for record in records:
+        entry = _parse_record(record)
+        if entry is None or entry["url"] in seen_urls:
+            continue
+        seen_urls.add(entry["url"])
+        if source is not None:
+            entry["source"] = source
+        entries.append(entry)
+    return entries
+
+
+def plan_item_name(line: str) -> Optional[str]:
+    """
+    Название упражнения из строки плана или None, если строка не пункт списка.
+    """
+    match = _PLAN_ITEM_RE.match(line)
+    if match is None:
+        return None
+    return _NAME_END_RE.split(match.group("body"), maxsplit=1)[0].strip() or None
+
+
+def _dice(query: List[str], candidate: List[str]) -> float:
+    # Коэффициент Дайса по основам слов; основы сравниваются нестрого,
+    # чтобы «разводка»/«разведение» и опечатки тоже совпадали
+    if not query or not candidate:
+        return 0.0
+    remaining = list(candidate)
+    matched = 0
+    for stem in query:
+        close = difflib.get_close_matches(stem, remaining, n=1, cutoff=0.8)
+        if close:
+            remaining.remove(close[0])
+            matched += 1
+    return 2 * matched / (len(query) + len(candidate))
+
+
+class ExerciseLinkIndex:
+    """
+    Детерминированный индекс «упражнение -> ссылка на видео».
+
+    Заменяет второй запрос к LLM в trainer_agent: план первой стадии
+    размечается ссылками локально, без ретривера и без модели.
+
+    Аргументы:
+        entries: записи из extract_exercise_links
+        threshold: минимальное сходство названий (0..1), ниже — ссылка не ставится
+    """
+
+    def __init__(self, entries: Iterable[dict], threshold: float = DEFAULT_THRESHOLD):
+        self.entries = list(entries)
+        self.threshold = threshold
+
+        self._exact: Dict[str, dict] = {}
+        self._stems: List[Tuple[List[str], dict]] = []
+        for entry in self.entries:
+            for alias in entry.get("aliases") or [entry["name"]]:
+                self._exact.setdefault(normalize_exercise(alias), entry)
+                self._stems.append((exercise_stems(alias), entry))
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @classmethod
+    def load(cls, path, **kwargs) -> "ExerciseLinkIndex":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f)["entries"], **kwargs)
+
+    def save(self, path) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"entries": self.entries}, f, ensure_ascii=False, indent=2)
+
+    def match(self, name: str) -> Optional[Tuple[dict, float]]:
+        """
+        Ищет запись для названия упражнения: сначала точное совпадение
+        нормализованного названия, затем лучшее нестрогое по основам слов.
+
+        Возвращает:
+            (запись, сходство) или None, если сходство ниже threshold
+        """
+        entry = self._exact.get(normalize_exercise(name))
+        if entry is not None:
+            return entry, 1.0
+
+        stems = exercise_stems(name)
+        best, best_score = None, 0.0
+        for candidate, entry in self._stems:
+            score = _dice(stems, candidate)
+            if score > best_score:
+                best, best_score = entry, score
+        if best is None or best_score < self.threshold:
+            return None
+        return best, best_score
+
+    def annotate_line(self, line: str) -> Tuple[str, bool]:
+        """
+        Дописывает под строкой плана ссылку на видео, если упражнение найдено.
+        """
+        if _URL_RE.search(line):
+            return line, False
+        name = plan_item_name(line)
+        found = self.match(name) if name else None
+        if found is None:
+            return line, False
+
+        indent = _PLAN_ITEM_RE.match(line).group("indent")
+        return f"{line}\n{indent}  Видео: {found[0]['url']}", True
+
+    def annotate(self, plan: str) -> Tuple[str, int]:
+        """
+        Размечает план ссылками на видео.
+
+        Возвращает:
+            (размеченный план, число добавленных ссылок)
+        """
+        with span("links.annotate") as current:
+            lines, added = [], 0
+            for line in plan.split("\n"):
+                line, found = self.annotate_line(line)
+                lines.append(line)
+                added += found
+            current.set(links=added)
+        return "\n".join(lines), added
+
+    def annotate_stream(self, chunks: Iterable[str]) -> Iterator[str]:
+        """
+        Потоковая разметка: фрагменты копятся до конца строки,
+        и каждая готовая строка сразу отдаётся со ссылкой.
+        """
+        buffer = ""
+        for chunk in chunks:
+            buffer += chunk
+            *complete, buffer = buffer.split("\n")
+            for line in complete:
+                yield self.annotate_line(line)[0] + "\n"
+        if buffer:
+            yield self.annotate_line(buffer)[0]
+
+    async def annotate_stream_async(self, chunks: AsyncIterable[str]) -> AsyncIterator[str]:
+        """
+        То же, что annotate_stream, для асинхронного потока фрагментов.
+        """
+        buffer = ""
+        async for chunk in chunks:
+            buffer += chunk
+            *complete, buffer = buffer.split("\n")
+            for line in complete:
+                yield self.annotate_line(line)[0] + "\n"
+        if buffer:
+            yield self.annotate_line(buffer)[0]
@@ -0,0 +1,89 @@
+# llm.py
+
+from time import perf_counter
+from typing import Iterator, Optional
+
+from agents.rate_limiter import LLMScheduler, estimate_tokens, get_scheduler
+from agents.tracing import span
+
+
+# Сколько токенов закладываем на ответ модели до того, как узнаем реальный usage
+COMPLETION_TOKENS_RESERVE = 1000
+
+
+def _record_usage(current, usage) -> None:
+    if usage is not None:
+        current.set(
+            prompt_tokens=getattr(usage, "prompt_tokens", None),
+            completion_tokens=getattr(usage, "completion_tokens", None)
+        )
+
+
+class SimpleLLM:
+    """
+    Минимальная обёртка над Mistral-клиентом с методом .chat(prompt),
+    который используют агенты. Все вызовы проходят через общий
+    LLMScheduler (лимиты запросов/токенов и повторы при 429/5xx).
+    """
+
+    def __init__(self, client, model: str, scheduler: Optional[LLMScheduler] = None):
+        self.client = client
+        self.model = model
+        self.scheduler = scheduler or get_scheduler()
+
+    def chat(self, prompt: str) -> str:
+        estimated = estimate_tokens(prompt) + COMPLETION_TOKENS_RESERVE
+        with span("llm.chat", model=self.model) as current:
+            response = self.scheduler.call(
+                lambda: self.client.chat.complete(
+                    model=self.model,
+                    messages=[
+                        {"role": "user", "content": prompt}
+                    ]
+                ),
+                estimated_tokens=estimated
+            )
+            usage = getattr(response, "usage", None)
+            _record_usage(current, usage)
+        self.scheduler.record_usage(estimated, getattr(usage, "total_tokens", None))
+        return response.choices[0].message.content
+
+    def chat_stream(self, prompt: str) -> Iterator[str]:
+        """
+        Потоковый вариант chat: отдаёт фрагменты ответа по мере генерации.
+        Лимиты и повторы применяются к открытию потока (до первого фрагмента).
+        """
+        estimated = estimate_tokens(prompt) + COMPLETION_TOKENS_RESERVE
+        # Спан не делается текущим: между yield управление у потребителя потока
+        with span("llm.stream", activate=False, model=self.model) as current:
+            start = perf_counter()
+            stream = self.scheduler.call(
+                lambda: self.client.chat.stream(
+                    model=self.model,
+                    messages=[
+                        {"role": "user", "content": prompt}
+                    ]
+                ),
+                estimated_tokens=estimated
+            )
+
+            total_tokens = None
+            first_chunk = True
+            # finally: потребитель может закрыть генератор, не дочитав поток
+            try:
+                with stream:
+                    for event in stream:
+                        chunk = event.data
+                        if chunk.usage is not None:
+                            total_tokens = chunk.usage.total_tokens
+                            _record_usage(current, chunk.usage)
+                        if not chunk.choices:
+                            continue
+                        content = chunk.choices[0].delta.content
+                        if isinstance(content, str) and content:
+                            if first_chunk:
+                                current.set(first_chunk_ms=round((perf_counter() - start) * 1000, 1))
+                                first_chunk = False
+                            yield content
+            finally:
+                self.scheduler.record_usage(estimated, total_tokens)
@@ -1,37 +1,21 @@
 # manager_agent.py
 
-import re
-from typing import List, Optional
-from time import sleep
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, List, Optional, Tuple
 
+from agents.router import parse_routing_response
+from agents.tracing import bind, current_span, traced
 
-def manager_agent(
-    llm,
-    user_query: str,
-    trainer_agent_fn,
-    nutritionist_agent_fn,
-    coach_retriever=None,
-    nutritionist_retriever=None
-) -> str:
-    """
-    Агент-менеджер. Определяет, как обработать запрос пользователя:
-    0 — не по теме,
-    1 — отправить агенту тренеру,
-    2 — отправить агенту нутрициологу.
 
-    Аргументы:
-        llm: LLM с методом .chat(prompt)
-        user_query: запрос пользователя
-        trainer_agent_fn: функция агента тренера (llm, user_query, retriever=None)
-        nutritionist_agent_fn: функция нутрициолога (llm, user_query, retriever=None)
-        coach_retriever: опциональный retriever для тренера
-        nutritionist_retriever: опциональный retriever для нутрициолога
+logger = logging.getLogger(__name__)
 
-    Возвращает:
-        Строку с финальным ответом.
-    """
+FAILED_AGENT_MESSAGE = "Не удалось получить ответ агента, попробуйте повторить запрос позже."
+REFUSAL_MESSAGE = "Извините, я могу помочь только с тренировками и питанием."
 
-    system_prompt = f"""
+ROUTING_PROMPT = """
     Ты агент-менеджер фитнес-ассистента. Твоя ЕДИНСТВЕННАЯ задача - роутинг запросов о тренировках и питании.
 
     КРИТИЧЕСКИ ВАЖНЫЕ ПРАВИЛА:
@@ -61,42 +45,223 @@ def manager_agent(
     Запрос пользователя: {user_query}
     """
 
-    routing_response = llm.chat(system_prompt)
+
+@traced("routing")
+def route_query(llm, user_query: str, router=None) -> List[int]:
+    """
+    Определяет, каким агентам отдать запрос. Если передан локальный роутер
+    (см. agents/router.py), LLM спрашивается только для неоднозначных запросов.
+
+    Возвращает:
+        Список опций: [0], [1], [2], [1, 2] или [], если ответ не распознан.
+    """
+    if router is not None:
+        selected_options, source, confidence = router.classify(user_query)
+        current_span().set(source=source, confidence=round(float(confidence), 3))
+        if selected_options is not None:
+            return selected_options
+
+    current_span().set(source="llm")
+    routing_response = llm.chat(ROUTING_PROMPT.format(user_query=user_query))
 
     # Извлекаем список опций, которые определил LLM
-    match = re.search(r"\[.*?\]", routing_response)
+    return parse_routing_response(routing_response)
+
+
+def _select_tasks(
+    selected_options: List[int],
+    trainer_agent_fn,
+    nutritionist_agent_fn,
+    coach_retriever=None,
+    nutritionist_retriever=None
+) -> List[Tuple[str, Callable, object]]:
+    """
+    Формирует список (заголовок, функция агента, retriever).
+    Порядок фиксирован: сначала тренер, затем нутрициолог.
+    """
+    tasks = []
+    if 1 in selected_options and trainer_agent_fn:
+        tasks.append(("План тренировок", trainer_agent_fn, coach_retriever))
+    if 2 in selected_options and nutritionist_agent_fn:
+        tasks.append(("План питания", nutritionist_agent_fn, nutritionist_retriever))
+    return tasks
+
+
+def _run_agent_safe(title: str, agent_fn, llm, user_query: str, retriever) -> str:
+    """
+    Запускает агента и изолирует его ошибки: падение одного агента
+    не должно терять ответ другого.
+    """
     try:
-        selected_options: List[int] = eval(match.group()) if match else []
-        if not isinstance(selected_options, list):
-            selected_options = []
-    except:
-        selected_options = []
+        answer = agent_fn(llm, user_query, retriever=retriever)
+    except Exception:
+        logger.exception("Агент '%s' завершился с ошибкой", title)
+        answer = FAILED_AGENT_MESSAGE
+    return f"{title}:\n{answer}"
+
+
+@traced("manager", root=True)
+def manager_agent(
+    llm,
+    user_query: str,
+    trainer_agent_fn,
+    nutritionist_agent_fn,
+    coach_retriever=None,
+    nutritionist_retriever=None,
+    parallel: bool = True,
+    router=None
+) -> str:
+    """
+    Агент-менеджер. Определяет, как обработать запрос пользователя:
+    0 — не по теме,
+    1 — отправить агенту тренеру,
+    2 — отправить агенту нутрициологу.
+
+    Аргументы:
+        llm: LLM с методом .chat(prompt)
+        user_query: запрос пользователя
+        trainer_agent_fn: функция агента тренера (llm, user_query, retriever=None)
+        nutritionist_agent_fn: функция нутрициолога (llm, user_query, retriever=None)
+        coach_retriever: опциональный retriever для тренера
+        nutritionist_retriever: опциональный retriever для нутрициолога
+        parallel: если выбраны оба агента, запускать их одновременно
+            (в пуле потоков); иначе — последовательно, как раньше
+        router: опциональный локальный роутер (LocalRouter), чтобы не тратить
+            вызов LLM на очевидные запросы
 
-    responses = []
+    Возвращает:
+        Строку с финальным ответом.
+    """
+
+    selected_options = route_query(llm, user_query, router=router)
 
     # Ни один агент не был выбран или попытка взлома
     if 0 in selected_options:
-        return "Извините, я могу помочь только с тренировками и питанием."
+        return REFUSAL_MESSAGE
 
-    sleep(1)
-    # Агент тренер
-    if 1 in selected_options and trainer_agent_fn:
-        trainer_answer = trainer_agent_fn(
-            llm,
-            user_query,
-            retriever=coach_retriever
-        )
-        responses.append(f"План тренировок:\n{trainer_answer}")
+    tasks = _select_tasks(
+        selected_options,
+        trainer_agent_fn,
+        nutritionist_agent_fn,
+        coach_retriever,
+        nutritionist_retriever
+    )
 
-    sleep(1)
-
-    # Агент нутрициолог
-    if 2 in selected_options and nutritionist_agent_fn:
-        nutrition_answer = nutritionist_agent_fn(
-            llm,
-            user_query,
-            retriever=nutritionist_retriever
-        )
-        responses.append(f"План питания:\n{nutrition_answer}")
+    if parallel and len(tasks) > 1:
+        # Агенты независимы, поэтому общее время ≈ времени самой медленной ветки
+        with ThreadPoolExecutor(max_workers=len(tasks)) as executor:
+            futures = [
+                executor.submit(bind(_run_agent_safe), title, agent_fn, llm, user_query, retriever)
+                for title, agent_fn, retriever in tasks
+            ]
+            responses = [future.result() for future in futures]
+    else:
+        responses = []
+        for title, agent_fn, retriever in tasks:
+            responses.append(_run_agent_safe(title, agent_fn, llm, user_query, retriever))
 
     return "\n\n".join(responses)
+
+
+def _stream_in_background(
+    executor,
+    title: str,
+    agent_fn,
+    llm,
+    user_query: str,
+    retriever,
+    stop: threading.Event
+) -> Iterator[str]:
+    """
+    Запускает потокового агента в пуле и возвращает генератор, читающий его
+    фрагменты из очереди. Агент работает сразу, даже пока вывод ещё не
+    дошёл до его секции; ошибки изолируются так же, как в _run_agent_safe.
+    После stop.set() агент закрывается на следующем фрагменте.
+    """
+    chunks: queue.Queue = queue.Queue()
+    done = object()
+
+    def produce():
+        stream = agent_fn(llm, user_query, retriever=retriever)
+        try:
+            for chunk in stream:
+                if stop.is_set():
+                    break
+                chunks.put(chunk)
+        except Exception:
+            logger.exception("Агент '%s' завершился с ошибкой", title)
+            chunks.put(FAILED_AGENT_MESSAGE)
+        finally:
+            # Закрытие генератора агента закрывает и поток LLM внутри него
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+            chunks.put(done)
+
+    executor.submit(bind(produce))
+
+    def consume():
+        while (chunk := chunks.get()) is not done:
+            yield chunk
+
+    return consume()
+
+
+@traced("manager", root=True)
+def manager_agent_stream(
+    llm,
+    user_query: str,
+    trainer_agent_fn,
+    nutritionist_agent_fn,
+    coach_retriever=None,
+    nutritionist_retriever=None,
+    router=None
+) -> Iterator[str]:
+    """
+    Потоковый вариант manager_agent. Выбранные агенты запускаются
+    одновременно, а их фрагменты отдаются по мере генерации в фиксированном
+    порядке: пока идёт вывод тренера, ответ нутрициолога буферизуется.
+    Если потребитель закрывает генератор раньше, агенты останавливаются.
+
+    Аргументы:
+        llm: LLM с методами .chat(prompt) и .chat_stream(prompt)
+        user_query: запрос пользователя
+        trainer_agent_fn: потоковый агент тренера (например, trainer_agent_stream)
+        nutritionist_agent_fn: потоковый агент нутрициолога (например, nutritionist_agent_stream)
+        coach_retriever: опциональный retriever для тренера
+        nutritionist_retriever: опциональный retriever для нутрициолога
+        router: опциональный локальный роутер (LocalRouter)
+
+    Возвращает:
+        Генератор фрагментов итогового ответа.
+    """
+    selected_options = route_query(llm, user_query, router=router)
+
+    if 0 in selected_options:
+        yield REFUSAL_MESSAGE
+        return
+
+    tasks = _select_tasks(
+        selected_options,
+        trainer_agent_fn,
+        nutritionist_agent_fn,
+        coach_retriever,
+        nutritionist_retriever
+    )
+    if not tasks:
+        return
+
+    stop = threading.Event()
+    with ThreadPoolExecutor(max_workers=len(tasks)) as executor:
+        streams = [
+            (title, _stream_in_background(executor, title, agent_fn, llm, user_query, retriever, stop))
+            for title, agent_fn, retriever in tasks
+        ]
+        try:
+            for i, (title, stream) in enumerate(streams):
+                separator = "\n\n" if i > 0 else ""
+                yield f"{separator}{title}:\n"
+                yield from stream
+        finally:
+            # Выход из with ждёт агентов: без сигнала они дописали бы ответы целиком
+            stop.set()
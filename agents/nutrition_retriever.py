@@ -0,0 +1,172 @@
+# nutrition_retriever.py
+
+import json
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from time import time
+from typing import List, Optional
+
+from langchain_core.documents import Document
+
+from agents.response_cache import normalize_prompt, prompt_key
+
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+ARXIV_CACHE_PATH = PROJECT_ROOT / "db" / "arxiv_cache.sqlite3"
+# Через месяц поиск повторяется: в arXiv появляются новые статьи
+ARXIV_CACHE_MAX_AGE = 30 * 24 * 3600
+
+# ArxivAPIWrapper при ошибке API возвращает документ с текстом ошибки вместо исключения
+ARXIV_ERROR_PREFIX = "Arxiv exception"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS arxiv_results (
+    key TEXT PRIMARY KEY,
+    query TEXT NOT NULL,
+    documents TEXT NOT NULL,
+    fetched_at REAL NOT NULL
+)
+"""
+
+
+class CachingArxivRetriever:
+    """
+    Read-through кэш поверх ArxivRetriever: результаты поиска сохраняются
+    на диск (SQLite), повторные запросы обслуживаются без сети. Пустые
+    результаты и ответы arXiv с текстом ошибки не кэшируются — такой запрос
+    повторяется при следующем обращении.
+
+    Аргументы:
+        fetcher: ретривер для промахов (по умолчанию ArxivRetriever(load_max_docs=5))
+        cache_path: путь к файлу кэша
+        offline: не ходить в сеть вовсе — при промахе вернуть пустой список;
+            устаревшие результаты в этом режиме всё равно отдаются
+        max_age_seconds: через сколько секунд результат считается устаревшим
+            (None — никогда)
+    """
+
+    def __init__(
+        self,
+        fetcher=None,
+        cache_path=ARXIV_CACHE_PATH,
+        offline: bool = False,
+        max_age_seconds: Optional[float] = ARXIV_CACHE_MAX_AGE
+    ):
+        self._fetcher = fetcher
+        self.offline = offline
+        self.max_age_seconds = max_age_seconds
+
+        Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(cache_path), check_same_thread=False)
+        self._conn.execute(_SCHEMA)
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "fetch_errors": 0}
+
+    @property
+    def fetcher(self):
+        if self._fetcher is None:
+            from langchain_community.retrievers import ArxivRetriever
+
+            self._fetcher = ArxivRetriever(load_max_docs=5)
+        return self._fetcher
+
+    def _lookup(self, query: str) -> Optional[List[Document]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT documents, fetched_at FROM arxiv_results WHERE key = ?", (prompt_key(query),)
+            ).fetchone()
+        if row is None:
+            return None
+        if not self.offline and self.max_age_seconds is not None and time() - row[1] > self.max_age_seconds:
+            return None
+        documents = json.loads(row[0])
+        # Пустые списки могли остаться от старых версий кэша
+        if not documents:
+            return None
+        return [Document(page_content=d["page_content"], metadata=d["metadata"]) for d in documents]
+
+    def _store(self, query: str, documents: List[Document]) -> None:
+        payload = json.dumps(
+            [{"page_content": d.page_content, "metadata": _jsonable(d.metadata)} for d in documents],
+            ensure_ascii=False
+        )
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO arxiv_results (key, query, documents, fetched_at) VALUES (?, ?, ?, ?)",
+                (prompt_key(query), normalize_prompt(query), payload, time())
+            )
+            self._conn.commit()
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def invoke(self, query: str) -> List[Document]:
+        cached = self._lookup(query)
+        if cached is not None:
+            self._count("hits")
+            return cached
+
+        self._count("misses")
+        if self.offline:
+            return []
+
+        try:
+            documents = self.fetcher.invoke(query)
+        except Exception:
+            self._count("fetch_errors")
+            logger.exception("Не удалось получить статьи arXiv для запроса")
+            return []
+
+        if any(d.page_content.startswith(ARXIV_ERROR_PREFIX) for d in documents):
+            self._count("fetch_errors")
+            logger.error("arXiv вернул ошибку вместо статей: %s", documents[0].page_content[:200])
+            return []
+
+        # Статьи без текста в контексте бесполезны
+        documents = [d for d in documents if d.page_content.strip()]
+        if documents:
+            self._store(query, documents)
+        return documents
+
+    def export_corpus(self, path) -> int:
+        """
+        Выгружает все закэшированные статьи в JSONL, который понимает
+        helpers/creating_nutrition_db.py. Возвращает число записей.
+        """
+        seen = set()
+        count = 0
+        with self._lock:
+            rows = self._conn.execute("SELECT documents FROM arxiv_results").fetchall()
+        with open(path, "w", encoding="utf-8") as f:
+            for (documents,) in rows:
+                for document in json.loads(documents):
+                    metadata = document["metadata"]
+                    doc_id = metadata.get("Entry ID") or metadata.get("Title") or document["page_content"][:100]
+                    if doc_id in seen:
+                        continue
+                    seen.add(doc_id)
+                    record = {
+                        "id": doc_id,
+                        "title": metadata.get("Title", ""),
+                        "text": document["page_content"],
+                        "source": "arxiv",
+                    }
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    count += 1
+        return count
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
+
+
+def _jsonable(metadata: dict) -> dict:
+    # В метаданных ArxivRetriever бывают даты — приводим всё к строкам
+    return {key: value if isinstance(value, (str, int, float, bool)) or value is None else str(value)
+            for key, value in metadata.items()}
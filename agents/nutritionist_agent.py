@@ -1,17 +1,50 @@
 # nutritionist_agent.py
 
-from typing import Optional
-from time import sleep
+from typing import TYPE_CHECKING, Iterator, Optional
 
-from mistralai import Mistral
-from langchain_core.language_models import BaseLanguageModel
-from langchain_community.retrievers import ArxivRetriever
+from agents.context import ContextAssembler, build_context
+from agents.retrieval import DEFAULT_RETRIEVAL_TIMEOUT, join_retrieval, start_retrieval
+from agents.tracing import traced
 
+if TYPE_CHECKING:
+    from langchain_core.language_models import BaseLanguageModel
 
+
+SYSTEM_PROMPT = """
+    Ты агент-нутрициолог. Твоя задача — составить чёткий, структурированный
+    план питания по приёмам пищи (завтрак, обед, ужин, перекусы).
+    Не добавляй лишних рекомендаций или тренировочных планов.
+    Отвечай только планом питания.
+"""
+
+
+def _build_second_prompt(additional_info: str, first_response: str) -> str:
+    """
+    Промпт второго запроса: уточнить план питания по научным данным.
+    """
+    return f"""
+            У меня есть план питания, а также некоторая научная информация (например, выдержки из статей).
+            Тебе нужно обновить план питания, добавив полезные уточнения или микро-правки,
+            основанные на этих данных. Но важно: ответ должен остаться именно планом питания,
+            без пояснений, цитат, списков статей и прочего.
+            
+            Вот дополнительная информация:
+            {additional_info}
+            
+            Вот базовый план питания:
+            {first_response}
+            
+            Отправь только обновлённый план питания.
+        """
+
+
+@traced("nutritionist")
 def nutritionist_agent(
-    llm: BaseLanguageModel,
+    llm: "BaseLanguageModel",
     user_prompt: str,
-    retriever: Optional[object] = None
+    retriever: Optional[object] = None,
+    retrieval_timeout: Optional[float] = DEFAULT_RETRIEVAL_TIMEOUT,
+    context: Optional[ContextAssembler] = None
 ) -> str:
     """
     Агент-нутрициолог. Формирует чёткий план питания.
@@ -22,48 +55,71 @@ def nutritionist_agent(
         llm: экземпляр LLM, совместимый с .chat(prompt)
         user_prompt: строка запроса пользователя
         retriever: опциональный retrивер (например, ArxivRetriever)
+        retrieval_timeout: сколько секунд ждать ретривер после первой стадии;
+            если он не успел, возвращается базовый план
+        context: сборщик контекста второго запроса (дедупликация, MMR, бюджет
+            токенов); по умолчанию — без эмбеддингов, см. agents/context.py
 
     Возвращает:
         Строка с финальным планом питания.
     """
 
-    system_prompt = """
-        Ты агент-нутрициолог. Твоя задача — составить чёткий, структурированный
-        план питания по приёмам пищи (завтрак, обед, ужин, перекусы).
-        Не добавляй лишних рекомендаций или тренировочных планов.
-        Отвечай только планом питания.
-    """
+    # 1. Поиск статей (самая медленная часть) идёт параллельно с первым запросом LLM
+    retrieval = start_retrieval(retriever, user_prompt)
 
-    # 1. Первый запрос LLM — базовый план
-    first_prompt = f"{system_prompt}\n\nЗапрос пользователя:\n{user_prompt}"
+    # 2. Первый запрос LLM — базовый план
+    first_prompt = f"{SYSTEM_PROMPT}\n\nЗапрос пользователя:\n{user_prompt}"
     first_response = llm.chat(first_prompt)
 
-    sleep(1)
-
-    # 2. Проверяем наличие retriever
-    if retriever:
-        relevant_docs = retriever.invoke(user_prompt)
-        additional_info = "\n".join([doc.page_content for doc in relevant_docs])
+    # 3. Проверяем, успел ли retriever
+    relevant_docs = join_retrieval(retrieval, retrieval_timeout)
+    if relevant_docs:
+        additional_info = build_context(user_prompt, relevant_docs, context)
 
-        sleep(1)
-
-        second_prompt = f"""
-            У меня есть план питания, а также некоторая научная информация (например, выдержки из статей).
-            Тебе нужно обновить план питания, добавив полезные уточнения или микро-правки,
-            основанные на этих данных. Но важно: ответ должен остаться именно планом питания,
-            без пояснений, цитат, списков статей и прочего.
-            
-            Вот дополнительная информация:
-            {additional_info}
-            
-            Вот базовый план питания:
-            {first_response}
-            
-            Отправь только обновлённый план питания.
-        """
+        second_prompt = _build_second_prompt(additional_info, first_response)
 
         final_response = llm.chat(second_prompt)
     else:
         final_response = first_response
 
     return final_response
+
+
+@traced("nutritionist")
+def nutritionist_agent_stream(
+    llm,
+    user_prompt: str,
+    retriever: Optional[object] = None,
+    retrieval_timeout: Optional[float] = DEFAULT_RETRIEVAL_TIMEOUT,
+    context: Optional[ContextAssembler] = None
+) -> Iterator[str]:
+    """
+    Потоковый вариант nutritionist_agent: финальный план питания
+    отдаётся по частям по мере генерации.
+
+    Аргументы:
+        llm: LLM с методами .chat(prompt) и .chat_stream(prompt)
+        user_prompt: строка запроса пользователя
+        retriever: опциональный ретривер (например, ArxivRetriever)
+        retrieval_timeout: сколько секунд ждать ретривер после первой стадии
+        context: сборщик контекста второго запроса
+
+    Возвращает:
+        Генератор фрагментов текста плана питания.
+    """
+    first_prompt = f"{SYSTEM_PROMPT}\n\nЗапрос пользователя:\n{user_prompt}"
+
+    if not retriever:
+        yield from llm.chat_stream(first_prompt)
+        return
+
+    retrieval = start_retrieval(retriever, user_prompt)
+    first_response = llm.chat(first_prompt)
+
+    relevant_docs = join_retrieval(retrieval, retrieval_timeout)
+    if not relevant_docs:
+        yield first_response
+        return
+
+    additional_info = build_context(user_prompt, relevant_docs, context)
+    yield from llm.chat_stream(_build_second_prompt(additional_info, first_response))
@@ -0,0 +1,84 @@
+# onnx_embeddings.py
+
+import os
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+# Файлы, которые кладёт helpers/export_onnx_embeddings.py
+ONNX_MODEL_FILE = "model.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+
+# Как у sentence-transformers/all-MiniLM-L6-v2 (max_seq_length)
+DEFAULT_MAX_LENGTH = 256
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Эмбеддинги all-MiniLM-L6-v2 на ONNX Runtime без torch и sentence-transformers.
+
+    Повторяет пайплайн SentenceTransformer: токенизация WordPiece (tokenizers),
+    трансформер, mean pooling по attention mask и L2-нормировка, — поэтому
+    векторы совместимы с индексами, собранными через HuggingFaceEmbeddings.
+
+    Аргументы:
+        model_dir: папка с model.onnx и tokenizer.json
+        max_length: максимальная длина последовательности в токенах
+        batch_size: размер пакета для embed_documents
+        threads: число потоков ONNX Runtime внутри операции (по умолчанию
+            из ONNX_THREADS или решает сам ONNX Runtime)
+    """
+
+    def __init__(
+        self,
+        model_dir,
+        max_length: int = DEFAULT_MAX_LENGTH,
+        batch_size: int = 32,
+        threads: Optional[int] = None
+    ):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.model_dir = Path(model_dir)
+        self.batch_size = batch_size
+
+        self.tokenizer = Tokenizer.from_file(str(self.model_dir / TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding(pad_id=self.tokenizer.token_to_id("[PAD]") or 0, pad_token="[PAD]")
+
+        options = ort.SessionOptions()
+        threads = threads or int(os.environ.get("ONNX_THREADS", "0"))
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(
+            str(self.model_dir / ONNX_MODEL_FILE),
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+        hidden = self.session.run(None, {k: v for k, v in feeds.items() if k in self._input_names})[0]
+
+        mask = attention_mask[:, :, None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        return pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for i in range(0, len(texts), self.batch_size):
+            vectors.extend(self._encode(list(texts[i:i + self.batch_size])).tolist())
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0].tolist()
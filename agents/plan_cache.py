@@ -0,0 +1,725 @@
+# plan_cache.py
+
+import re
+import json
+import asyncio
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from time import perf_counter, time
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from agents.response_cache import normalize_prompt
+from agents.router import _normalize_rows
+from agents.tracing import span
+
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+PLAN_CACHE_PATH = PROJECT_ROOT / "db" / "plan_cache.sqlite3"
+
+# Поля профиля, от которых зависит план каждого агента. Точные вес, возраст
+# и уровень подготовки в ключ не входят: под них план подстраивается локально
+DEFAULT_KEY_FIELDS = ("goal", "sex", "age", "weight", "sport", "days", "place", "diet")
+KEY_FIELDS = {
+    "trainer": ("goal", "sex", "age", "sport", "days", "place"),
+    "nutritionist": ("goal", "sex", "age", "weight", "sport", "days", "diet"),
+}
+
+# Возрастные группы: (верхняя граница не включительно, метка)
+AGE_BRACKETS = ((18, "<18"), (30, "18-29"), (45, "30-44"), (60, "45-59"))
+WEIGHT_BUCKET = 10
+
+# Смещение числа подходов относительно среднего уровня
+LEVELS = {"beginner": -1, "intermediate": 0, "advanced": 1}
+MAX_SETS = 6
+
+# Рост для оценки основного обмена, когда он не указан (формула Миффлина — Сан Жеора)
+DEFAULT_HEIGHT = {"m": 178, "f": 165, None: 170}
+DEFAULT_AGE = 30
+
+GOAL_PATTERNS = (
+    ("fat_loss", re.compile(r"похуд|сушк|сбросить|скинуть|жиросжиг|дефицит|рельеф|лишн\w* вес")),
+    ("mass", re.compile(r"\bмасс[аыуе]\b|набрать|набор\w* (вес|мышц)|нарастить|мышечн|гипертроф")),
+    ("endurance", re.compile(r"выносл|марафон|забег|триатлон|кардио")),
+    ("strength", re.compile(r"\bсил[аыуе]\b|сильнее|силов\w* показател|пауэрлифт|подтягива\w* \d+ раз")),
+    ("health", re.compile(r"здоров|тонус|\bформ[уеа]\b|самочувств")),
+)
+SPORT_PATTERNS = (
+    ("hockey", re.compile(r"хокке")),
+    ("football", re.compile(r"футбол")),
+    ("basketball", re.compile(r"баскетбол")),
+    ("volleyball", re.compile(r"волейбол")),
+    ("running", re.compile(r"\bбег\b|бегу|бегать|бегун|марафон|забег")),
+    ("swimming", re.compile(r"плаван|пловц|пловч")),
+    ("cycling", re.compile(r"велоспорт|велосипед|велогон")),
+    ("combat", re.compile(r"бокс|единоборств|борьб|борец|\bмма\b|кикбокс")),
+    ("tennis", re.compile(r"теннис")),
+)
+DIET_PATTERNS = (
+    ("vegan", re.compile(r"веган")),
+    ("vegetarian", re.compile(r"вегетариан")),
+    ("lactose_free", re.compile(r"лактоз|без молочн")),
+    ("gluten_free", re.compile(r"глютен")),
+    ("halal", re.compile(r"халял")),
+)
+PLACE_PATTERNS = (
+    ("home", re.compile(r"\bдома\b|домашн|без инвентар|без оборудован")),
+    ("gym", re.compile(r"\bзал(а|е|у|ом)?\b|тренаж")),
+)
+LEVEL_PATTERNS = (
+    ("beginner", re.compile(r"новичо?к|начинающ|с нуля|никогда не (занимал|трениров)")),
+    ("advanced", re.compile(r"продвинут|опытн|со стажем|профессионал|\bкмс\b|мастер спорта")),
+)
+_FEMALE_RE = re.compile(r"девушк|женщин|женск|\bжена\b|\bмама\b|\bдевочк")
+_MALE_RE = re.compile(r"мужчин|\bпарн|\bпарень|мужск|\bмуж\b|\bпапа\b")
+
+_AGE_RE = re.compile(r"(?<!\d)(\d{1,2})\s*(?:лет|год)|(?:возраст\D{0,5}|\bмне\s+)(\d{1,2})\b")
+_WEIGHT_RE = re.compile(r"(?:\bвес\w*|вешу)\D{0,12}?(\d{2,3}(?:[.,]\d)?)|(?<!\d)(\d{2,3}(?:[.,]\d)?)\s*кг\b")
+# «Похудеть на 10 кг», «набрать до 80 кг» — это цель, а не текущий вес
+_WEIGHT_TARGET_RE = re.compile(r"(на|до|сбросить|скинуть|похудеть|набрать|минус|плюс)\s*$")
+_EXPERIENCE_RE = re.compile(r"(стаж|занимаюсь|тренируюсь|опыт)\D{0,15}$")
+_DAY_WORDS = {"один": 1, "одна": 1, "два": 2, "две": 2, "три": 3, "четыре": 4, "пять": 5, "шесть": 6, "семь": 7}
+_DAY_NUMBER = r"(\d|" + "|".join(_DAY_WORDS) + r")"
+_DAYS_RE = re.compile(
+    _DAY_NUMBER + r"\s*(?:раз\w*|дн\w*|трениров\w*)\s*(?:в|на|за)\s*недел|\bна\s+" + _DAY_NUMBER + r"\s*(?:дн|дня)\b"
+)
+
+# Запросы, которые нельзя обслужить типовым планом: здоровье, травмы, беременность
+_UNSUPPORTED_RE = re.compile(
+    r"травм|\bбол(ь\b|ьн|и\b|ит|ят|езн)|\bно(ет|ют)\b|колен|сустав|грыж|протруз|сколиоз|"
+    r"беремен|кормлю грудью|операци|диабет|давлени|аллерг|лекарств|таблетк|диагноз|лечени|реабилит"
+)
+_PLAN_RE = re.compile(r"план|программ|рацион|меню|питани|диет|сплит|трениров|упражнен|комплекс|расписани")
+# Вопросы о технике и фактах — не запрос плана
+_QUESTION_RE = re.compile(r"^\s*(как правильно|как делать|почему|зачем|что такое|что лучше|что (?:есть|съесть|пить)|сколько|можно ли)")
+
+# Прототипы целей для запросов, где правила цель не нашли
+GOAL_PROTOTYPES: Dict[str, List[str]] = {
+    "fat_loss": ["Хочу похудеть", "Как убрать живот и бока", "Хочу стать стройнее", "Снизить процент жира"],
+    "mass": ["Хочу набрать мышечную массу", "Хочу стать больше и шире в плечах", "Хочу подкачаться"],
+    "endurance": ["Хочу улучшить выносливость", "Подготовка к забегу на 10 км", "Хочу бегать дольше и не задыхаться"],
+    "strength": ["Хочу стать сильнее", "Увеличить рабочие веса в жиме и приседе"],
+    "health": ["Хочу поддерживать форму и здоровье", "Общая физическая подготовка для хорошего самочувствия"],
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS plans (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    namespace TEXT NOT NULL,
+    profile_key TEXT NOT NULL,
+    query TEXT NOT NULL,
+    profile TEXT NOT NULL,
+    plan TEXT NOT NULL,
+    embedding BLOB,
+    created_at REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    latency REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS plans_by_profile ON plans (namespace, profile_key);
+"""
+
+
+def age_bracket(age: Optional[int]) -> str:
+    if age is None:
+        return "-"
+    for upper, label in AGE_BRACKETS:
+        if age < upper:
+            return label
+    return "60+"
+
+
+def _first_match(patterns, text: str) -> Optional[str]:
+    for name, pattern in patterns:
+        if pattern.search(text):
+            return name
+    return None
+
+
+def _number(value: str) -> float:
+    number = float(value.replace(",", "."))
+    return int(number) if number.is_integer() else number
+
+
+class PlanProfile:
+    """
+    Параметры запроса, от которых зависит план; None — не указано.
+
+    goal: fat_loss / mass / endurance / strength / health
+    sex: m / f
+    age, weight: числа из запроса (в ключе — возрастная группа и диапазон веса)
+    sport, place (home / gym), days: тренировочных дней в неделю
+    diet: кортеж ограничений питания (vegan, lactose_free, ...)
+    level: beginner / intermediate / advanced — в ключ не входит
+    cacheable: можно ли обслужить запрос типовым планом
+    """
+
+    FIELDS = ("goal", "sex", "age", "weight", "sport", "days", "place", "diet", "level")
+
+    def __init__(
+        self,
+        goal: Optional[str] = None,
+        sex: Optional[str] = None,
+        age: Optional[int] = None,
+        weight: Optional[float] = None,
+        sport: Optional[str] = None,
+        days: Optional[int] = None,
+        place: Optional[str] = None,
+        diet: Sequence[str] = (),
+        level: Optional[str] = None,
+        cacheable: bool = True
+    ):
+        self.goal = goal
+        self.sex = sex
+        self.age = age
+        self.weight = weight
+        self.sport = sport
+        self.days = days
+        self.place = place
+        self.diet = tuple(sorted(diet))
+        self.level = level
+        self.cacheable = cacheable
+
+    def bucket(self, field: str) -> str:
+        value = getattr(self, field)
+        if field == "age":
+            return age_bracket(value)
+        if field == "weight" and value is not None:
+            lower = int(value // WEIGHT_BUCKET * WEIGHT_BUCKET)
+            return f"{lower}-{lower + WEIGHT_BUCKET - 1}"
+        if field == "diet":
+            return "+".join(value) or "-"
+        return "-" if value is None else str(value)
+
+    def key(self, fields: Sequence[str] = DEFAULT_KEY_FIELDS) -> str:
+        """
+        Канонический ключ профиля: «goal=mass|sex=m|age=18-29|...».
+        """
+        return "|".join(f"{field}={self.bucket(field)}" for field in fields)
+
+    def to_dict(self) -> dict:
+        data = {field: getattr(self, field) for field in self.FIELDS}
+        data["diet"] = list(self.diet)
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "PlanProfile":
+        return cls(**{field: data.get(field) for field in cls.FIELDS if data.get(field) is not None})
+
+    def __repr__(self) -> str:
+        return f"PlanProfile({self.key(self.FIELDS)}, cacheable={self.cacheable})"
+
+
+class ProfileExtractor:
+    """
+    Извлекает профиль из запроса без LLM: правила по ключевым словам и
+    числам, а цель, если правила её не нашли, — по сходству эмбеддинга
+    запроса с прототипами целей (как LocalRouter).
+
+    Аргументы:
+        embeddings: модель эмбеддингов с embed_query/embed_documents; без неё только правила
+        goal_threshold: минимальное сходство с прототипом цели
+        goal_margin: минимальный отрыв лучшей цели от второй
+        prototypes: прототипы целей {цель: [запросы]}
+    """
+
+    def __init__(
+        self,
+        embeddings=None,
+        goal_threshold: float = 0.55,
+        goal_margin: float = 0.03,
+        prototypes: Optional[Dict[str, Sequence[str]]] = None
+    ):
+        self.embeddings = embeddings
+        self.goal_threshold = goal_threshold
+        self.goal_margin = goal_margin
+        self.prototypes = prototypes or GOAL_PROTOTYPES
+
+        self._labels: List[str] = []
+        self._matrix: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+        self._vectors: "OrderedDict[str, np.ndarray]" = OrderedDict()
+
+    def embed(self, query: str) -> np.ndarray:
+        """
+        Нормированный эмбеддинг запроса; последние запросы запоминаются,
+        потому что get() и put() кэша планов спрашивают один и тот же.
+        """
+        normalized = normalize_prompt(query)
+        with self._lock:
+            vector = self._vectors.get(normalized)
+            if vector is not None:
+                self._vectors.move_to_end(normalized)
+                return vector
+
+        vector = _normalize_rows(self.embeddings.embed_query(normalized))
+
+        with self._lock:
+            self._vectors[normalized] = vector
+            if len(self._vectors) > 256:
+                self._vectors.popitem(last=False)
+        return vector
+
+    def _prototype_matrix(self) -> np.ndarray:
+        if self._matrix is None:
+            with self._lock:
+                if self._matrix is None:
+                    labels, texts = [], []
+                    for goal, queries in self.prototypes.items():
+                        labels.extend([goal] * len(queries))
+                        texts.extend(queries)
+                    self._labels = labels
+                    self._matrix = _normalize_rows(self.embeddings.embed_documents(texts))
+        return self._matrix
+
+    def _goal_by_embedding(self, query: str) -> Optional[str]:
+        similarities = self._prototype_matrix() @ self.embed(query)
+        scores: Dict[str, float] = {}
+        for goal, similarity in zip(self._labels, similarities):
+            scores[goal] = max(scores.get(goal, -1.0), float(similarity))
+        ranked = sorted(scores.values(), reverse=True)
+        best_goal = max(scores, key=scores.get)
+        second = ranked[1] if len(ranked) > 1 else -1.0
+        if ranked[0] >= self.goal_threshold and ranked[0] - second >= self.goal_margin:
+            return best_goal
+        return None
+
+    def extract(self, query: str) -> PlanProfile:
+        text = query.lower().replace("ё", "е")
+
+        age = None
+        for match in _AGE_RE.finditer(text):
+            value = int(match.group(1) or match.group(2))
+            if 10 <= value <= 90 and not _EXPERIENCE_RE.search(text[:match.start()]):
+                age = value
+                break
+
+        weight = None
+        for match in _WEIGHT_RE.finditer(text):
+            if match.group(2) and _WEIGHT_TARGET_RE.search(text[max(0, match.start() - 15):match.start()]):
+                continue
+            value = _number(match.group(1) or match.group(2))
+            if 35 <= value <= 250:
+                weight = value
+                break
+
+        days = None
+        match = _DAYS_RE.search(text)
+        if match:
+            value = match.group(1) or match.group(2)
+            value = _DAY_WORDS.get(value) or int(value)
+            days = value if 1 <= value <= 7 else None
+
+        sex = "f" if _FEMALE_RE.search(text) else "m" if _MALE_RE.search(text) else None
+        goal = _first_match(GOAL_PATTERNS, text)
+        sport = _first_match(SPORT_PATTERNS, text)
+        diet = [name for name, pattern in DIET_PATTERNS if pattern.search(text)]
+        place = _first_match(PLACE_PATTERNS, text)
+        # Типовым планом обслуживается просьба о плане или цель без вопросов о здоровье
+        cacheable = (
+            bool(_PLAN_RE.search(text) or goal or sport or diet)
+            and not _QUESTION_RE.search(text)
+            and not _UNSUPPORTED_RE.search(text)
+        )
+        if goal is None and cacheable and self.embeddings is not None:
+            goal = self._goal_by_embedding(query)
+        # Без цели и ещё хотя бы одного параметра профиль слишком общий:
+        # «программа на ноги» и «программа на спину» получили бы один ключ
+        details = any(value is not None for value in (sex, age, weight, sport, days, place)) or bool(diet)
+        cacheable = cacheable and goal is not None and details
+
+        return PlanProfile(
+            goal=goal,
+            sex=sex,
+            age=age,
+            weight=weight,
+            sport=sport,
+            days=days,
+            place=place,
+            diet=diet,
+            level=_first_match(LEVEL_PATTERNS, text),
+            cacheable=cacheable
+        )
+
+
+# ----------------------------------------------------------------------
+# Подстройка сохранённого плана под профиль
+# ----------------------------------------------------------------------
+
+_KCAL_NUMBER = r"(?:\d{1,2}\s\d{3}|\d{3,4})"
+_KCAL_RE = re.compile(
+    r"(?<![\d.,])" + _KCAL_NUMBER + r"(?=(?:\s*[–—-]\s*" + _KCAL_NUMBER + r")?\s*(?:ккал|kcal|калори))"
+)
+_MACRO_RE = re.compile(r"(?<![\d.,])\d{2,3}(?=(?:\s*[–—-]\s*\d{2,3})?\s*г\s+(?:белк|углевод|жир))")
+_SETS_RE = re.compile(r"(?<![\d.,])([1-9])(?:(\s*[–—-]\s*)([1-9]))?(\s*)подход\w*")
+_SETS_X_RE = re.compile(r"(?<![\d.,])([1-9])(\s*[xх×]\s*\d)")
+
+
+def _plural(n: int, one: str, few: str, many: str) -> str:
+    if n % 10 == 1 and n % 100 != 11:
+        return one
+    if 2 <= n % 10 <= 4 and not 12 <= n % 100 <= 14:
+        return few
+    return many
+
+
+def resting_energy(profile: PlanProfile) -> Optional[float]:
+    """
+    Основной обмен по формуле Миффлина — Сан Жеора; без веса — None.
+    """
+    if profile.weight is None:
+        return None
+    age = profile.age if profile.age is not None else DEFAULT_AGE
+    offset = {"m": 5, "f": -161}.get(profile.sex, -78)
+    return 10 * profile.weight + 6.25 * DEFAULT_HEIGHT.get(profile.sex, 170) - 5 * age + offset
+
+
+def adjust_plan(plan: str, base: PlanProfile, target: PlanProfile) -> Tuple[str, bool]:
+    """
+    Подстраивает план, сгенерированный для профиля base, под профиль target:
+
+    - калорийность и граммы макронутриентов масштабируются отношением
+      основного обмена (вес и возраст в пределах одного ключа различаются);
+    - упоминания веса и возраста пользователя заменяются на новые;
+    - число подходов сдвигается на разницу уровней подготовки.
+
+    Возвращает:
+        (план, были ли изменения)
+    """
+    adjusted = plan
+
+    base_energy, target_energy = resting_energy(base), resting_energy(target)
+    if base_energy and target_energy and abs(target_energy / base_energy - 1) > 0.005:
+        factor = target_energy / base_energy
+        adjusted = _KCAL_RE.sub(
+            lambda m: str(int(round(int(re.sub(r"\D", "", m.group(0))) * factor, -1))), adjusted
+        )
+        adjusted = _MACRO_RE.sub(lambda m: str(int(round(int(m.group(0)) * factor / 5) * 5)), adjusted)
+
+    if base.weight is not None and target.weight is not None and base.weight != target.weight:
+        weight = re.escape(str(base.weight)).replace(r"\.", "[.,]")
+        adjusted = re.sub(rf"(?<![\d.,]){weight}(?=\s*кг)", str(target.weight).replace(".", ","), adjusted)
+
+    if base.age is not None and target.age is not None and base.age != target.age:
+        adjusted = re.sub(
+            rf"(?<!\d){base.age}\s*(?:лет|года|год)\b",
+            f"{target.age} {_plural(target.age, 'год', 'года', 'лет')}",
+            adjusted
+        )
+
+    shift = LEVELS[target.level or "intermediate"] - LEVELS[base.level or "intermediate"]
+    if shift:
+        def sets(n: str) -> int:
+            return min(MAX_SETS, max(1, int(n) + shift))
+
+        def replace_sets(m) -> str:
+            last = sets(m.group(3) or m.group(1))
+            first = f"{sets(m.group(1))}{m.group(2)}" if m.group(3) else ""
+            return f"{first}{last}{m.group(4)}{_plural(last, 'подход', 'подхода', 'подходов')}"
+
+        adjusted = _SETS_RE.sub(replace_sets, adjusted)
+        adjusted = _SETS_X_RE.sub(lambda m: f"{sets(m.group(1))}{m.group(2)}", adjusted)
+
+    return adjusted, adjusted != plan
+
+
+class PlanStore:
+    """
+    Кэш планов по профилю пользователя с хранением в SQLite.
+
+    Запросы с одинаковым каноническим ключом профиля (цель, пол, возрастная
+    группа, диапазон веса, спорт, дни, ограничения) получают сохранённый
+    план, подстроенный под точные числа запроса (adjust_plan). Чтобы
+    не потерять детали, которых нет в профиле, у ключа может быть несколько
+    вариантов: подходящим считается вариант, чей исходный запрос близок
+    к новому по эмбеддингам (без модели эмбеддингов — только тот же запрос).
+
+    Аргументы:
+        path: путь к файлу SQLite (":memory:" — без сохранения на диск)
+        extractor: ProfileExtractor; по умолчанию только правила
+        ttl_seconds: через сколько план считается устаревшим
+        match_threshold: минимальное сходство запроса с исходным запросом варианта
+        max_variants: максимум вариантов на один ключ профиля
+        max_entries: максимум планов во всех пространствах имён
+    """
+
+    def __init__(
+        self,
+        path=PLAN_CACHE_PATH,
+        extractor: Optional[ProfileExtractor] = None,
+        ttl_seconds: float = 3 * 24 * 3600,
+        match_threshold: float = 0.9,
+        max_variants: int = 4,
+        max_entries: int = 2000
+    ):
+        self.path = str(path)
+        self.extractor = extractor or ProfileExtractor()
+        self.ttl_seconds = ttl_seconds
+        self.match_threshold = match_threshold
+        self.max_variants = max_variants
+        self.max_entries = max_entries
+
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+        self._lock = threading.RLock()
+
+        self._stats = {
+            "hits": 0, "adjusted": 0, "misses": 0, "stale": 0, "skipped": 0,
+            "invalidated": 0, "latency_saved_seconds": 0.0
+        }
+
+    def profile_key(self, namespace: str, profile: PlanProfile) -> str:
+        return profile.key(KEY_FIELDS.get(namespace, DEFAULT_KEY_FIELDS))
+
+    def _vector(self, query: str) -> Optional[np.ndarray]:
+        if self.extractor.embeddings is None:
+            return None
+        return self.extractor.embed(query)
+
+    # ------------------------------------------------------------------
+    # Чтение и запись
+    # ------------------------------------------------------------------
+
+    def get(self, namespace: str, query: str) -> Optional[str]:
+        """
+        Ищет план для профиля запроса и подстраивает его под запрос.
+
+        Возвращает:
+            План или None, если профиля нет в кэше, план устарел
+            или запрос нельзя обслужить типовым планом.
+        """
+        with span("plan_cache.get", activate=False, namespace=namespace) as current:
+            profile = self.extractor.extract(query)
+            if not profile.cacheable:
+                with self._lock:
+                    self._stats["skipped"] += 1
+                current.set(cache_hit=False, hit="skipped")
+                return None
+
+            key = self.profile_key(namespace, profile)
+            plan, hit = self._lookup(namespace, key, query, profile)
+            current.set(cache_hit=plan is not None, hit=hit, profile=key)
+            return plan
+
+    def _lookup(self, namespace: str, key: str, query: str, profile: PlanProfile) -> Tuple[Optional[str], str]:
+        vector = self._vector(query)
+        now = time()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, profile, plan, embedding, created_at, latency, query FROM plans "
+                "WHERE namespace = ? AND profile_key = ? ORDER BY created_at DESC",
+                (namespace, key)
+            ).fetchall()
+            fresh = [row for row in rows if now - row[4] <= self.ttl_seconds]
+            expired = [row[0] for row in rows if now - row[4] > self.ttl_seconds]
+            if expired:
+                self._conn.executemany("DELETE FROM plans WHERE id = ?", [(i,) for i in expired])
+
+            row = self._best_variant(fresh, query, vector)
+            if row is None:
+                hit = "stale" if expired and not fresh else "miss"
+                self._stats["stale" if hit == "stale" else "misses"] += 1
+                self._conn.commit()
+                return None, hit
+
+            self._conn.execute("UPDATE plans SET hits = hits + 1 WHERE id = ?", (row[0],))
+            self._conn.commit()
+            self._stats["hits"] += 1
+            self._stats["latency_saved_seconds"] += row[5]
+
+        plan, changed = adjust_plan(row[2], PlanProfile.from_dict(json.loads(row[1])), profile)
+        if changed:
+            with self._lock:
+                self._stats["adjusted"] += 1
+        return plan, "adjusted" if changed else "hit"
+
+    def _best_variant(self, rows, query: str, vector: Optional[np.ndarray]):
+        # План того же запроса подходит без сравнения эмбеддингов
+        normalized = normalize_prompt(query)
+        for row in rows:
+            if normalize_prompt(row[6]) == normalized:
+                return row
+
+        # Иначе — только вариант с близким исходным запросом; без модели
+        # эмбеддингов отличий, которых нет в профиле, не видно, и кэш не отвечает
+        rows = [row for row in rows if row[3] is not None]
+        if vector is None or not rows:
+            return None
+        similarities = np.stack([np.frombuffer(row[3], dtype="float32") for row in rows]) @ vector
+        best = int(np.argmax(similarities))
+        return rows[best] if similarities[best] >= self.match_threshold else None
+
+    def put(self, namespace: str, query: str, plan: str, latency: float = 0.0) -> None:
+        """
+        Сохраняет сгенерированный план как вариант для профиля запроса.
+        latency — сколько заняла генерация (для метрики сэкономленного времени).
+        """
+        profile = self.extractor.extract(query)
+        if not profile.cacheable or not plan.strip():
+            return
+
+        key = self.profile_key(namespace, profile)
+        vector = self._vector(query)
+        now = time()
+        with self._lock:
+            # Повторная генерация для того же запроса заменяет прежний вариант
+            for row_id, old_query in self._conn.execute(
+                "SELECT id, query FROM plans WHERE namespace = ? AND profile_key = ?", (namespace, key)
+            ).fetchall():
+                if normalize_prompt(old_query) == normalize_prompt(query):
+                    self._conn.execute("DELETE FROM plans WHERE id = ?", (row_id,))
+
+            self._conn.execute(
+                "INSERT INTO plans (namespace, profile_key, query, profile, plan, embedding, created_at, latency) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    namespace, key, query, json.dumps(profile.to_dict(), ensure_ascii=False), plan,
+                    vector.astype("float32").tobytes() if vector is not None else None,
+                    now, latency
+                )
+            )
+            self._conn.execute(
+                "DELETE FROM plans WHERE id IN (SELECT id FROM plans WHERE namespace = ? AND profile_key = ? "
+                "ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                (namespace, key, self.max_variants)
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    # ------------------------------------------------------------------
+    # Вытеснение и инвалидация
+    # ------------------------------------------------------------------
+
+    def _evict(self, now: float) -> None:
+        self._conn.execute("DELETE FROM plans WHERE created_at < ?", (now - self.ttl_seconds,))
+        self._conn.execute(
+            "DELETE FROM plans WHERE id IN (SELECT id FROM plans ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    def invalidate(self, profile_key: Optional[str] = None, namespace: Optional[str] = None) -> int:
+        """
+        Удаляет планы одного профиля, одного пространства имён или все.
+        Например, после изменения промпта агента или базы знаний.
+
+        Возвращает:
+            Число удалённых планов.
+        """
+        conditions, params = [], []
+        if profile_key is not None:
+            conditions.append("profile_key = ?")
+            params.append(profile_key)
+        if namespace is not None:
+            conditions.append("namespace = ?")
+            params.append(namespace)
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+
+        with self._lock:
+            removed = self._conn.execute("DELETE FROM plans" + where, params).rowcount
+            self._conn.commit()
+            self._stats["invalidated"] += removed
+        logger.info("Кэш планов: удалено %d планов (%s)", removed, where.strip() or "все")
+        return removed
+
+    def profiles(self) -> List[dict]:
+        """
+        Профили в кэше: варианты, попадания и возраст самого старого плана.
+        """
+        now = time()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT namespace, profile_key, COUNT(*), SUM(hits), MIN(created_at) FROM plans "
+                "GROUP BY namespace, profile_key ORDER BY SUM(hits) DESC, namespace, profile_key"
+            ).fetchall()
+        return [
+            {
+                "namespace": namespace,
+                "profile": key,
+                "variants": variants,
+                "hits": hits,
+                "age_hours": round((now - created_at) / 3600, 1),
+                "stale": now - created_at > self.ttl_seconds,
+            }
+            for namespace, key, variants, hits, created_at in rows
+        ]
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"], stats["profiles"] = self._conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT namespace || ':' || profile_key) FROM plans"
+            ).fetchone()
+        lookups = stats["hits"] + stats["misses"] + stats["stale"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        stats["latency_saved_seconds"] = round(stats["latency_saved_seconds"], 2)
+        return stats
+
+
+# ----------------------------------------------------------------------
+# Обёртки агентов, как cached_agent* в response_cache.py
+# ----------------------------------------------------------------------
+
+def plan_cached_agent(agent_fn, store: PlanStore, namespace: str):
+    """
+    Оборачивает агента (llm, user_prompt, retriever=None) -> str кэшем
+    планов по профилю: генерация только при промахе.
+    """
+    def wrapper(llm, user_prompt: str, retriever=None, **kwargs) -> str:
+        cached = store.get(namespace, user_prompt)
+        if cached is not None:
+            return cached
+
+        start = perf_counter()
+        response = agent_fn(llm, user_prompt, retriever=retriever, **kwargs)
+        store.put(namespace, user_prompt, response, latency=perf_counter() - start)
+        return response
+
+    return wrapper
+
+
+def plan_cached_agent_stream(agent_stream_fn, store: PlanStore, namespace: str):
+    """
+    То же для потоковых агентов: при попадании план отдаётся одним фрагментом.
+    """
+    def wrapper(llm, user_prompt: str, retriever=None, **kwargs) -> Iterator[str]:
+        cached = store.get(namespace, user_prompt)
+        if cached is not None:
+            yield cached
+            return
+
+        start = perf_counter()
+        parts = []
+        for chunk in agent_stream_fn(llm, user_prompt, retriever=retriever, **kwargs):
+            parts.append(chunk)
+            yield chunk
+        store.put(namespace, user_prompt, "".join(parts), latency=perf_counter() - start)
+
+    return wrapper
+
+
+def plan_cached_agent_async_stream(agent_stream_fn, store: PlanStore, namespace: str):
+    """
+    plan_cached_agent_stream для асинхронных агентов (agents/async_agents.py).
+    """
+    async def wrapper(llm, user_prompt: str, retriever=None, **kwargs) -> AsyncIterator[str]:
+        cached = await asyncio.to_thread(store.get, namespace, user_prompt)
+        if cached is not None:
+            yield cached
+            return
+
+        start = perf_counter()
+        parts = []
+        async for chunk in agent_stream_fn(llm, user_prompt, retriever=retriever, **kwargs):
+            parts.append(chunk)
+            yield chunk
+        await asyncio.to_thread(store.put, namespace, user_prompt, "".join(parts), perf_counter() - start)
+
+    return wrapper
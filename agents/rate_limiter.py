@@ -0,0 +1,275 @@
+# rate_limiter.py
+
+import os
+import random
+import asyncio
+import threading
+from time import monotonic, sleep
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from agents.tracing import current_span
+
+
+T = TypeVar("T")
+
+# Коды ответов, при которых запрос к LLM имеет смысл повторить
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Грубая оценка количества токенов в тексте (≈ 4 символа на токен).
+    Используется, пока реальный usage от API ещё не известен.
+    """
+    return max(1, len(text) // 4)
+
+
+def _status_code(exc: Exception) -> Optional[int]:
+    """
+    Достаёт HTTP-код из исключения клиента (mistralai SDKError, httpx и т.п.).
+    """
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        response = getattr(exc, "response", None)
+        status = getattr(response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def _is_transport_error(exc: Exception) -> bool:
+    """
+    Сетевые сбои до получения ответа: обрыв переиспользованного keep-alive
+    соединения (ReadError, RemoteProtocolError), ошибка соединения, таймаут.
+    """
+    try:
+        import httpx
+    except ImportError:
+        return False
+    return isinstance(exc, (httpx.NetworkError, httpx.RemoteProtocolError, httpx.TimeoutException))
+
+
+class TokenBucket:
+    """
+    Потокобезопасный token bucket.
+
+    reserve() не спит сам, а сразу списывает запрошенное количество
+    (баланс может уйти в минус) и возвращает время ожидания до того момента,
+    когда бюджет на эту заявку восстановится. Это даёт FIFO-порядок между
+    конкурентными вызывающими и позволяет ждать как через time.sleep,
+    так и через asyncio.sleep.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        if rate <= 0 or capacity <= 0:
+            raise ValueError("rate и capacity должны быть положительными")
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float = 1.0) -> float:
+        # Заявка больше ёмкости никогда бы не выполнилась — ограничиваем её
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill(monotonic())
+            self._tokens -= amount
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def adjust(self, delta: float) -> None:
+        """
+        Корректирует баланс задним числом (например, когда реальный
+        расход токенов оказался больше или меньше оценки).
+        """
+        with self._lock:
+            self._refill(monotonic())
+            self._tokens = min(self.capacity, self._tokens + delta)
+
+
+class LLMScheduler:
+    """
+    Общий на процесс планировщик вызовов LLM.
+
+    - ограничивает частоту запросов (requests/s) и расход токенов (tokens/min);
+    - ждёт только тогда, когда бюджет действительно исчерпан;
+    - повторяет ответы 429/5xx и сетевые сбои с экспоненциальной задержкой и джиттером;
+    - считает время в очереди, время «в полёте» и время на backoff.
+    """
+
+    def __init__(
+        self,
+        requests_per_second: float = 1.0,
+        tokens_per_minute: Optional[float] = None,
+        burst: Optional[float] = None,
+        max_retries: int = 4,
+        base_delay: float = 1.0,
+        max_delay: float = 30.0,
+    ):
+        self.request_bucket = TokenBucket(requests_per_second, burst or max(1.0, requests_per_second))
+        self.token_bucket = (
+            TokenBucket(tokens_per_minute / 60.0, tokens_per_minute) if tokens_per_minute else None
+        )
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._lock = threading.Lock()
+        self._counters = {
+            "calls": 0,
+            "attempts": 0,
+            "retries": 0,
+            "errors": 0,
+            "queued_seconds": 0.0,
+            "in_flight_seconds": 0.0,
+            "backoff_seconds": 0.0,
+        }
+
+    def _add(self, **values) -> None:
+        with self._lock:
+            for name, value in values.items():
+                self._counters[name] += value
+
+    def reserve(self, estimated_tokens: int = 0) -> float:
+        """
+        Резервирует бюджет на один запрос и возвращает, сколько нужно подождать.
+        """
+        wait = self.request_bucket.reserve(1)
+        if self.token_bucket and estimated_tokens:
+            wait = max(wait, self.token_bucket.reserve(estimated_tokens))
+        return wait
+
+    def backoff_delay(self, attempt: int) -> float:
+        """
+        Экспоненциальная задержка с «полным» джиттером.
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def should_retry(self, exc: Exception, attempt: int) -> bool:
+        if attempt >= self.max_retries:
+            return False
+        return _status_code(exc) in RETRYABLE_STATUS_CODES or _is_transport_error(exc)
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: Optional[int]) -> None:
+        """
+        Списывает разницу между оценкой и реальным расходом токенов.
+        """
+        if self.token_bucket and actual_tokens is not None:
+            self.token_bucket.adjust(estimated_tokens - actual_tokens)
+
+    def call(self, fn: Callable[[], T], estimated_tokens: int = 0) -> T:
+        """
+        Выполняет fn() с учётом лимитов и повторов.
+
+        Аргументы:
+            fn: функция без аргументов, делающая один запрос к API
+            estimated_tokens: оценка числа токенов запроса (для лимита tokens/min)
+
+        Возвращает:
+            Результат fn().
+        """
+        self._add(calls=1)
+        current = current_span()
+        attempt = 0
+        while True:
+            # Токены резервируются один раз на вызов: неудачная попытка их почти не тратит,
+            # а повторное списание при шторме 429 многократно опустошало бы бюджет
+            wait = self.reserve(estimated_tokens if attempt == 0 else 0)
+            if wait > 0:
+                sleep(wait)
+                current.add("queued_seconds", wait)
+            self._add(attempts=1, queued_seconds=wait)
+
+            start = monotonic()
+            try:
+                result = fn()
+            except Exception as exc:
+                self._add(in_flight_seconds=monotonic() - start)
+                if not self.should_retry(exc, attempt):
+                    self._add(errors=1)
+                    raise
+                delay = self.backoff_delay(attempt)
+                self._add(retries=1, backoff_seconds=delay)
+                current.add("retries", 1)
+                sleep(delay)
+                attempt += 1
+                continue
+
+            self._add(in_flight_seconds=monotonic() - start)
+            return result
+
+    async def acall(self, fn: Callable[[], Awaitable[T]], estimated_tokens: int = 0) -> T:
+        """
+        Асинхронный вариант call: те же бюджеты и повторы, но ожидание
+        через asyncio.sleep, так что ждущий вызов не занимает поток.
+
+        Аргументы:
+            fn: функция без аргументов, возвращающая корутину одного запроса к API
+            estimated_tokens: оценка числа токенов запроса (для лимита tokens/min)
+        """
+        self._add(calls=1)
+        current = current_span()
+        attempt = 0
+        while True:
+            # Как и в call: бюджет токенов списывается только за первую попытку
+            wait = self.reserve(estimated_tokens if attempt == 0 else 0)
+            if wait > 0:
+                await asyncio.sleep(wait)
+                current.add("queued_seconds", wait)
+            self._add(attempts=1, queued_seconds=wait)
+
+            start = monotonic()
+            try:
+                result = await fn()
+            except Exception as exc:
+                self._add(in_flight_seconds=monotonic() - start)
+                if not self.should_retry(exc, attempt):
+                    self._add(errors=1)
+                    raise
+                delay = self.backoff_delay(attempt)
+                self._add(retries=1, backoff_seconds=delay)
+                current.add("retries", 1)
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+
+            self._add(in_flight_seconds=monotonic() - start)
+            return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counters)
+
+
+_scheduler: Optional[LLMScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> LLMScheduler:
+    """
+    Возвращает общий на процесс планировщик. Лимиты берутся из переменных
+    окружения LLM_REQUESTS_PER_SECOND и LLM_TOKENS_PER_MINUTE.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            tokens_per_minute = os.environ.get("LLM_TOKENS_PER_MINUTE")
+            _scheduler = LLMScheduler(
+                requests_per_second=float(os.environ.get("LLM_REQUESTS_PER_SECOND", "1")),
+                tokens_per_minute=float(tokens_per_minute) if tokens_per_minute else None,
+            )
+        return _scheduler
+
+
+def configure_scheduler(**kwargs) -> LLMScheduler:
+    """
+    Заменяет общий планировщик новым с заданными параметрами.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = LLMScheduler(**kwargs)
+        return _scheduler
@@ -0,0 +1,175 @@
+# request_queue.py
+
+import asyncio
+import threading
+from collections import OrderedDict, deque
+from time import perf_counter
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, TypeVar
+
+from agents.tracing import current_span, percentile
+
+
+T = TypeVar("T")
+
+# Сколько последних ожиданий хранить для перцентилей
+WAIT_WINDOW = 1000
+
+
+class QueueFullError(Exception):
+    """
+    Очередь переполнена (вся или для конкретного пользователя):
+    запрос отклоняется сразу, а не копится без ограничений.
+    """
+
+    def __init__(self, user_id: str, reason: str):
+        super().__init__(f"Очередь запросов переполнена ({reason})")
+        self.user_id = user_id
+        self.reason = reason
+
+
+class FairRequestQueue:
+    """
+    Ограниченная очередь запросов с честностью между пользователями.
+
+    - одновременно выполняется не больше max_concurrency запросов;
+    - ждать может не больше max_queue запросов, у одного пользователя —
+      не больше max_per_user (вместе с выполняемыми); сверх этого
+      QueueFullError, и всплеск нагрузки не копит корутины и память;
+    - освободившийся слот получает следующий пользователь по кругу,
+      поэтому один пользователь с пачкой запросов не блокирует остальных;
+    - считаются глубина очереди и время ожидания слота.
+
+    Работает внутри одного event loop (см. agents/async_runtime.py).
+    """
+
+    def __init__(self, max_concurrency: int = 16, max_queue: int = 64, max_per_user: int = 2):
+        if max_concurrency < 1 or max_queue < 0 or max_per_user < 1:
+            raise ValueError("max_concurrency и max_per_user должны быть >= 1, max_queue >= 0")
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_per_user = max_per_user
+
+        self._waiting: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self._per_user: Dict[str, int] = {}
+        self._active = 0
+        self._depth = 0
+
+        # Статистику читают из других потоков (боковая панель Streamlit)
+        self._stats_lock = threading.Lock()
+        self._waits: Deque[float] = deque(maxlen=WAIT_WINDOW)
+        self._counters = {"submitted": 0, "completed": 0, "rejected": 0, "cancelled": 0, "max_depth": 0}
+
+    def _count(self, name: str, value: int = 1) -> None:
+        with self._stats_lock:
+            self._counters[name] += value
+
+    def _dispatch(self) -> None:
+        # Слоты раздаются по кругу: пользователь после обслуживания уходит в конец
+        while self._active < self.max_concurrency and self._waiting:
+            user_id, waiters = next(iter(self._waiting.items()))
+            waiter = waiters.popleft()
+            if waiters:
+                self._waiting.move_to_end(user_id)
+            else:
+                del self._waiting[user_id]
+            self._depth -= 1
+            if waiter.done():
+                continue
+            self._active += 1
+            waiter.set_result(None)
+
+    def _release(self, user_id: str) -> None:
+        self._active -= 1
+        self._per_user[user_id] -= 1
+        if not self._per_user[user_id]:
+            del self._per_user[user_id]
+        self._dispatch()
+
+    def _reject(self, user_id: str, reason: str) -> QueueFullError:
+        self._count("rejected")
+        return QueueFullError(user_id, reason)
+
+    async def _acquire(self, user_id: str) -> float:
+        if self._per_user.get(user_id, 0) >= self.max_per_user:
+            raise self._reject(user_id, "слишком много запросов пользователя")
+
+        if self._active < self.max_concurrency and not self._waiting:
+            self._count("submitted")
+            self._active += 1
+            self._per_user[user_id] = self._per_user.get(user_id, 0) + 1
+            return 0.0
+
+        if self._depth >= self.max_queue:
+            raise self._reject(user_id, "очередь заполнена")
+
+        self._count("submitted")
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(user_id, deque()).append(waiter)
+        self._per_user[user_id] = self._per_user.get(user_id, 0) + 1
+        self._depth += 1
+        with self._stats_lock:
+            self._counters["max_depth"] = max(self._counters["max_depth"], self._depth)
+
+        start = perf_counter()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            self._count("cancelled")
+            if waiter.done() and not waiter.cancelled():
+                # Слот уже выдан, но забрать его некому — отдаём следующему
+                self._release(user_id)
+                raise
+            waiters = self._waiting.get(user_id)
+            if waiters is not None and waiter in waiters:
+                waiters.remove(waiter)
+                self._depth -= 1
+                if not waiters:
+                    del self._waiting[user_id]
+            self._per_user[user_id] -= 1
+            if not self._per_user[user_id]:
+                del self._per_user[user_id]
+            raise
+        return perf_counter() - start
+
+    def _record_wait(self, wait: float) -> None:
+        with self._stats_lock:
+            self._waits.append(wait)
+        current_span().set(queue_wait_ms=round(wait * 1000, 1))
+
+    async def run(self, user_id: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Выполняет fn() (корутину запроса), когда освободится слот.
+        """
+        wait = await self._acquire(user_id)
+        self._record_wait(wait)
+        try:
+            return await fn()
+        finally:
+            self._count("completed")
+            self._release(user_id)
+
+    async def stream(self, user_id: str, fn: Callable[[], AsyncIterator[T]]) -> AsyncIterator[T]:
+        """
+        То же для потокового ответа: слот занят, пока поток не дочитан или закрыт.
+        """
+        wait = await self._acquire(user_id)
+        self._record_wait(wait)
+        try:
+            async for item in fn():
+                yield item
+        finally:
+            self._count("completed")
+            self._release(user_id)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            waits = list(self._waits)
+            stats = dict(self._counters)
+        stats.update(
+            active=self._active,
+            depth=self._depth,
+            users_waiting=len(self._waiting),
+            wait_ms_p50=round(percentile(waits, 50) * 1000, 1),
+            wait_ms_p95=round(percentile(waits, 95) * 1000, 1),
+        )
+        return stats
@@ -0,0 +1,429 @@
+# resources.py
+
+import os
+import logging
+import threading
+from pathlib import Path
+from time import monotonic, perf_counter
+from typing import Callable, Dict, List, Optional
+
+from agents.llm import SimpleLLM
+from agents.async_runtime import AsyncRuntime
+from agents.request_queue import FairRequestQueue
+from agents.rate_limiter import get_scheduler
+from agents.router import LocalRouter
+from agents.response_cache import ResponseCache
+from agents.plan_cache import PlanStore, ProfileExtractor
+from agents.nutrition_retriever import CachingArxivRetriever
+from agents.context import ContextAssembler, budget_for_model
+from agents.onnx_embeddings import ONNX_MODEL_FILE
+from agents.exercise_links import EXERCISE_LINKS_FILE, ExerciseLinkIndex, extract_exercise_links
+from agents.vector_store import CHUNKS_FILE, INDEX_FILE, STORE_FILE, MmapVectorStore
+
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+TRAINER_DB_PATH = PROJECT_ROOT / "db" / "trainer_vectordb"
+# Компактное хранилище (helpers/migrate_vectordb.py); если оно не старше pickle-базы, используется вместо неё
+TRAINER_STORE_PATH = PROJECT_ROOT / "db" / "trainer_store"
+NUTRITION_DB_PATH = PROJECT_ROOT / "db" / "nutrition_vectordb"
+# PDF базы знаний тренера: из них строится индекс ссылок, если его нет в базе
+TRAINER_SOURCE_PATH = PROJECT_ROOT / "data" / "knowledge"
+KEY_PATH = PROJECT_ROOT / "app" / "keys" / "mistral_key.txt"
+
+EMBEDDINGS_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+# Та же модель, экспортированная в ONNX (helpers/export_onnx_embeddings.py)
+ONNX_EMBEDDINGS_PATH = PROJECT_ROOT / "models" / "all-MiniLM-L6-v2-onnx"
+# LLM_MODEL = "mistral-medium-latest"
+# LLM_MODEL = "mistral-medium"
+LLM_MODEL = "mistral-small-latest"
+
+# Как часто (в секундах) проверять, не изменились ли файлы индекса на диске
+RELOAD_CHECK_INTERVAL = 5.0
+
+
+def read_api_key(key_path: Path = KEY_PATH) -> str:
+    """
+    Читает ключ Mistral: сначала из переменной MISTRAL_API_KEY, затем из файла.
+    """
+    api_key = os.environ.get("MISTRAL_API_KEY", "")
+    if not api_key and key_path.exists():
+        api_key = key_path.read_text(encoding="utf-8").strip()
+    return api_key
+
+
+def current_rss_mb() -> Optional[float]:
+    """
+    Текущий резидентный объём памяти процесса в МБ (None, если не удалось узнать).
+    """
+    try:
+        with open("/proc/self/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        # На Linux ru_maxrss в КБ, это пиковое значение, а не текущее
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except (ImportError, OSError):
+        return None
+
+
+class RegistryRetriever:
+    """
+    Ретривер, который при каждом вызове берёт актуальный индекс из реестра.
+    Благодаря этому горячая перезагрузка индекса видна всем сессиям сразу.
+    """
+
+    def __init__(self, registry: "ResourceRegistry", k: int = 4):
+        self.registry = registry
+        self.k = k
+
+    def invoke(self, query: str) -> List:
+        # VectorStore.as_retriever берёт k только из search_kwargs, лишние аргументы молча игнорирует
+        return self.registry.vectordb().as_retriever(search_kwargs={"k": self.k}).invoke(query)
+
+
+class ResourceRegistry:
+    """
+    Общий на процесс потокобезопасный реестр тяжёлых объектов:
+    модель эмбеддингов, FAISS-индекс тренера, индекс ссылок на видео,
+    Mistral-клиент с пулом HTTP-соединений и ретривер нутрициолога.
+
+    Объекты создаются лениво при первом обращении и переиспользуются всеми
+    сессиями Streamlit. Индекс перезагружается, если его файлы изменились.
+    """
+
+    def __init__(
+        self,
+        db_path: Path = TRAINER_DB_PATH,
+        key_path: Path = KEY_PATH,
+        model: str = LLM_MODEL,
+        store_path: Path = TRAINER_STORE_PATH,
+        nutrition_path: Path = NUTRITION_DB_PATH
+    ):
+        self.db_path = Path(db_path)
+        self.store_path = Path(store_path)
+        self.nutrition_path = Path(nutrition_path)
+        self.key_path = Path(key_path)
+        self.model = model
+
+        self._resources: Dict[str, object] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._load_seconds: Dict[str, float] = {}
+        self._reloads = 0
+
+        self._index_signature = None
+        self._last_reload_check = 0.0
+
+    def _lock_for(self, name: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(name, threading.Lock())
+
+    def _get(self, name: str, loader: Callable[[], object]) -> object:
+        # Быстрый путь без блокировки: объект уже загружен
+        resource = self._resources.get(name)
+        if resource is not None:
+            return resource
+
+        with self._lock_for(name):
+            resource = self._resources.get(name)
+            if resource is None:
+                resource = self._load(name, loader)
+        return resource
+
+    def _load(self, name: str, loader: Callable[[], object]) -> object:
+        start = perf_counter()
+        resource = loader()
+        self._load_seconds[name] = perf_counter() - start
+        self._resources[name] = resource
+        logger.info("Ресурс '%s' загружен за %.2f с", name, self._load_seconds[name])
+        return resource
+
+    # ------------------------------------------------------------------
+    # Загрузчики
+    # ------------------------------------------------------------------
+
+    def _embeddings_backend(self) -> str:
+        """
+        Бэкенд эмбеддингов по EMBEDDINGS_BACKEND:
+        onnx — ONNX Runtime (без torch, быстрый старт),
+        huggingface — sentence-transformers на torch, как раньше,
+        auto — onnx, если модель экспортирована, иначе huggingface (по умолчанию).
+        """
+        backend = os.environ.get("EMBEDDINGS_BACKEND", "auto")
+        if backend == "auto":
+            model_dir = Path(os.environ.get("ONNX_EMBEDDINGS_PATH", ONNX_EMBEDDINGS_PATH))
+            backend = "onnx" if (model_dir / ONNX_MODEL_FILE).exists() else "huggingface"
+        return backend
+
+    def _load_embeddings(self):
+        if self._embeddings_backend() == "onnx":
+            from agents.onnx_embeddings import OnnxEmbeddings
+
+            return OnnxEmbeddings(os.environ.get("ONNX_EMBEDDINGS_PATH", ONNX_EMBEDDINGS_PATH))
+
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+
+        return HuggingFaceEmbeddings(model_name=EMBEDDINGS_MODEL)
+
+    def _use_compact_store(self) -> bool:
+        """
+        Компактное хранилище используется, если оно не старше pickle-базы:
+        после пересборки helpers/creating_db.py без миграции берётся pickle-база.
+        """
+        store_file = self.store_path / STORE_FILE
+        legacy_file = self.db_path / "index.faiss"
+        if not store_file.exists():
+            return False
+        if not legacy_file.exists():
+            return True
+        if legacy_file.stat().st_mtime_ns > store_file.stat().st_mtime_ns:
+            logger.warning("База %s новее компактного хранилища %s, используем её", self.db_path, self.store_path)
+            return False
+        return True
+
+    def _load_vectordb(self):
+        signature = self._read_index_signature()
+        if self._use_compact_store():
+            vectordb = MmapVectorStore(self.store_path, self.embeddings())
+            self._index_signature = signature
+            return vectordb
+
+        from langchain_community.vectorstores import FAISS
+
+        vectordb = FAISS.load_local(
+            str(self.db_path),
+            self.embeddings(),
+            allow_dangerous_deserialization=True
+        )
+        self._index_signature = signature
+        return vectordb
+
+    def _load_llm(self):
+        import httpx
+        from mistralai import Mistral
+
+        # Один пул соединений на процесс вместо клиента на каждую сессию
+        http_client = httpx.Client(
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+            timeout=httpx.Timeout(120.0, connect=10.0)
+        )
+        client = Mistral(
+            api_key=read_api_key(self.key_path),
+            server_url=os.environ.get("MISTRAL_SERVER_URL") or None,
+            client=http_client
+        )
+        return SimpleLLM(client, self.model, scheduler=get_scheduler())
+
+    def _load_async_llm(self):
+        from agents.async_llm import AsyncLLM, create_async_client
+
+        # Клиент и его пул соединений живут в event loop из async_runtime()
+        client = create_async_client(
+            read_api_key(self.key_path),
+            server_url=os.environ.get("MISTRAL_SERVER_URL") or None,
+            max_connections=int(os.environ.get("LLM_MAX_CONNECTIONS", "50"))
+        )
+        return AsyncLLM(client, self.model, scheduler=get_scheduler())
+
+    def _load_request_queue(self):
+        return FairRequestQueue(
+            max_concurrency=int(os.environ.get("REQUEST_QUEUE_CONCURRENCY", "16")),
+            max_queue=int(os.environ.get("REQUEST_QUEUE_SIZE", "64")),
+            max_per_user=int(os.environ.get("REQUEST_QUEUE_PER_USER", "2"))
+        )
+
+    def _load_router(self):
+        return LocalRouter(self.embeddings())
+
+    def _load_response_cache(self):
+        # По умолчанию только точные совпадения (см. ResponseCache)
+        threshold = os.environ.get("RESPONSE_CACHE_THRESHOLD", "")
+        return ResponseCache(
+            embeddings=self.embeddings(),
+            semantic_threshold=float(threshold) if threshold else None,
+            ttl_seconds=float(os.environ.get("RESPONSE_CACHE_TTL", 7 * 24 * 3600)),
+            max_entries=int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", 5000))
+        )
+
+    def _load_plan_store(self):
+        return PlanStore(
+            extractor=ProfileExtractor(self.embeddings()),
+            ttl_seconds=float(os.environ.get("PLAN_CACHE_TTL", 3 * 24 * 3600)),
+            match_threshold=float(os.environ.get("PLAN_CACHE_MATCH_THRESHOLD", "0.9")),
+            max_entries=int(os.environ.get("PLAN_CACHE_MAX_ENTRIES", 2000))
+        )
+
+    def _load_link_index(self):
+        """
+        Индекс «упражнение -> видео» из базы тренера (helpers/creating_db.py).
+        Если база собрана без него, индекс извлекается из PDF при запуске.
+        """
+        links_path = self.db_path / EXERCISE_LINKS_FILE
+        if links_path.exists():
+            return ExerciseLinkIndex.load(links_path)
+
+        from PyPDF2 import PdfReader
+
+        entries = []
+        for pdf_path in sorted(TRAINER_SOURCE_PATH.glob("*.pdf")):
+            text = "\n".join(page.extract_text() or "" for page in PdfReader(str(pdf_path)).pages)
+            entries.extend(extract_exercise_links(text, source=pdf_path.name))
+        logger.info("Индекс ссылок на упражнения собран из PDF: %d записей", len(entries))
+        return ExerciseLinkIndex(entries)
+
+    def _load_context_assembler(self):
+        return ContextAssembler(
+            embeddings=self.embeddings(),
+            token_budget=budget_for_model(self.model),
+            extract_sentences=os.environ.get("CONTEXT_EXTRACT_SENTENCES") == "1"
+        )
+
+    def _load_nutritionist_retriever(self):
+        """
+        Выбирает ретривер нутрициолога по NUTRITION_RETRIEVER:
+        local — локальный индекс db/nutrition_vectordb (по умолчанию, если он есть),
+        cached — arXiv с read-through кэшем на диске (по умолчанию иначе),
+        offline — только кэш arXiv без сети,
+        arxiv — живой ArxivRetriever, как раньше.
+        """
+        mode = os.environ.get("NUTRITION_RETRIEVER") or (
+            "local" if (self.nutrition_path / "index.faiss").exists() else "cached"
+        )
+
+        if mode == "local":
+            from langchain_community.vectorstores import FAISS
+
+            vectordb = FAISS.load_local(
+                str(self.nutrition_path),
+                self.embeddings(),
+                allow_dangerous_deserialization=True
+            )
+            return vectordb.as_retriever(search_kwargs={"k": 5})
+
+        if mode == "arxiv":
+            from langchain_community.retrievers import ArxivRetriever
+
+            return ArxivRetriever(load_max_docs=5)
+
+        return CachingArxivRetriever(offline=(mode == "offline"))
+
+    # ------------------------------------------------------------------
+    # Публичный интерфейс
+    # ------------------------------------------------------------------
+
+    def embeddings(self):
+        return self._get("embeddings", self._load_embeddings)
+
+    def llm(self) -> SimpleLLM:
+        return self._get("llm", self._load_llm)
+
+    def async_llm(self):
+        return self._get("async_llm", self._load_async_llm)
+
+    def async_runtime(self) -> AsyncRuntime:
+        return self._get("async_runtime", AsyncRuntime)
+
+    def request_queue(self) -> FairRequestQueue:
+        return self._get("request_queue", self._load_request_queue)
+
+    def vectordb(self):
+        self._maybe_reload_vectordb()
+        return self._get("vectordb", self._load_vectordb)
+
+    def router(self) -> LocalRouter:
+        return self._get("router", self._load_router)
+
+    def response_cache(self) -> ResponseCache:
+        return self._get("response_cache", self._load_response_cache)
+
+    def plan_store(self) -> PlanStore:
+        return self._get("plan_store", self._load_plan_store)
+
+    def coach_retriever(self, k: int = 15) -> RegistryRetriever:
+        return RegistryRetriever(self, k=k)
+
+    def link_index(self) -> ExerciseLinkIndex:
+        return self._get("link_index", self._load_link_index)
+
+    def context_assembler(self) -> ContextAssembler:
+        return self._get("context_assembler", self._load_context_assembler)
+
+    def nutritionist_retriever(self):
+        return self._get("nutritionist_retriever", self._load_nutritionist_retriever)
+
+    def _read_index_signature(self):
+        # Следим за обоими форматами: пересборка любого из них меняет выбор в _use_compact_store
+        files = [
+            self.store_path / INDEX_FILE, self.store_path / CHUNKS_FILE, self.store_path / STORE_FILE,
+            self.db_path / "index.faiss", self.db_path / "index.pkl"
+        ]
+        return tuple((f.stat().st_mtime_ns, f.stat().st_size) for f in files if f.exists())
+
+    def _maybe_reload_vectordb(self) -> None:
+        """
+        Перезагружает индекс, если его файлы изменились на диске.
+        Пока новый индекс строится, запросы обслуживает старый.
+        """
+        now = monotonic()
+        if "vectordb" not in self._resources or now - self._last_reload_check < RELOAD_CHECK_INTERVAL:
+            return
+        self._last_reload_check = now
+
+        try:
+            signature = self._read_index_signature()
+        except OSError:
+            return
+        if signature == self._index_signature:
+            return
+
+        with self._lock_for("vectordb"):
+            if signature == self._index_signature:
+                return
+            logger.info("Файлы индекса тренера изменились, перезагружаем")
+            self._load("vectordb", self._load_vectordb)
+            self._reloads += 1
+
+    def stats(self) -> dict:
+        rss = current_rss_mb()
+        stats = {
+            "loaded": sorted(self._resources),
+            "load_seconds": {name: round(sec, 3) for name, sec in self._load_seconds.items()},
+            "vectordb_reloads": self._reloads,
+            "rss_mb": round(rss, 1) if rss is not None else None,
+        }
+        if "embeddings" in self._resources:
+            stats["embeddings_backend"] = type(self._resources["embeddings"]).__name__
+        if "router" in self._resources:
+            stats["router"] = self._resources["router"].stats()
+        if "response_cache" in self._resources:
+            stats["response_cache"] = self._resources["response_cache"].stats()
+        if "plan_store" in self._resources:
+            stats["plan_cache"] = self._resources["plan_store"].stats()
+        if "context_assembler" in self._resources:
+            stats["context"] = self._resources["context_assembler"].stats()
+        if "request_queue" in self._resources:
+            stats["request_queue"] = self._resources["request_queue"].stats()
+        if "link_index" in self._resources:
+            stats["exercise_links"] = len(self._resources["link_index"])
+        return stats
+
+
+_registry: Optional[ResourceRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> ResourceRegistry:
+    """
+    Возвращает общий на процесс реестр ресурсов.
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ResourceRegistry()
+        return _registry
@@ -0,0 +1,380 @@
+# response_cache.py
+
+import re
+import asyncio
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from time import perf_counter, time
+from typing import AsyncIterator, Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+from agents.tracing import span
+
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+CACHE_PATH = PROJECT_ROOT / "db" / "response_cache.sqlite3"
+# Сколько ближайших записей проверять при семантическом поиске
+SEMANTIC_CANDIDATES = 5
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    query TEXT NOT NULL,
+    response TEXT NOT NULL,
+    embedding BLOB,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    latency REAL NOT NULL DEFAULT 0,
+    UNIQUE (namespace, key)
+)
+"""
+
+
+def normalize_prompt(text: str) -> str:
+    """
+    Нормализует запрос для точного совпадения: регистр, «ё», пробелы,
+    пунктуация по краям.
+    """
+    text = text.lower().replace("ё", "е")
+    text = re.sub(r"\s+", " ", text)
+    return text.strip(" \t\n.,!?;:")
+
+
+def prompt_key(text: str) -> str:
+    return hashlib.sha256(normalize_prompt(text).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Кэш ответов LLM и агентов с хранением в SQLite.
+
+    - точное совпадение: по хэшу нормализованного запроса;
+    - семантическое совпадение: по косинусному сходству эмбеддингов
+      прошлых запросов (FAISS-индекс в памяти, строится из SQLite);
+    - вытеснение: TTL и LRU при превышении max_entries;
+    - пространства имён: у каждого агента свои записи;
+    - метрики: попадания, промахи и сэкономленное время генерации.
+
+    Аргументы:
+        path: путь к файлу SQLite (":memory:" — без сохранения на диск)
+        embeddings: модель эмбеддингов с embed_query; без неё только точные совпадения
+        semantic_threshold: минимальное сходство для семантического попадания;
+            None (по умолчанию) — только точные совпадения: планы агентов
+            персональные, и запросы, различающиеся только возрастом, весом или
+            ограничениями, для модели эмбеддингов почти одинаковы
+        ttl_seconds: время жизни записи
+        max_entries: максимальное число записей во всех пространствах имён
+    """
+
+    def __init__(
+        self,
+        path=CACHE_PATH,
+        embeddings=None,
+        semantic_threshold: Optional[float] = None,
+        ttl_seconds: float = 7 * 24 * 3600,
+        max_entries: int = 5000
+    ):
+        self.path = str(path)
+        self.embeddings = embeddings
+        self.semantic_threshold = semantic_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(_SCHEMA)
+        self._conn.commit()
+        self._lock = threading.RLock()
+
+        self._indexes: Dict[str, object] = {}
+        self._vectors: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0, "latency_saved_seconds": 0.0}
+
+    # ------------------------------------------------------------------
+    # Эмбеддинги и семантический индекс
+    # ------------------------------------------------------------------
+
+    def _embed(self, query: str) -> np.ndarray:
+        # Запрос эмбеддится при промахе в get() и ещё раз в put() — запоминаем последние
+        normalized = normalize_prompt(query)
+        with self._lock:
+            vector = self._vectors.get(normalized)
+            if vector is not None:
+                self._vectors.move_to_end(normalized)
+                return vector
+
+        vector = np.asarray(self.embeddings.embed_query(normalized), dtype="float32")
+        vector /= max(float(np.linalg.norm(vector)), 1e-12)
+
+        with self._lock:
+            self._vectors[normalized] = vector
+            if len(self._vectors) > 256:
+                self._vectors.popitem(last=False)
+        return vector
+
+    def _index_for(self, namespace: str, dim: int):
+        index = self._indexes.get(namespace)
+        if index is None:
+            import faiss
+
+            index = faiss.IndexIDMap(faiss.IndexFlatIP(dim))
+            rows = self._conn.execute(
+                "SELECT id, embedding FROM entries WHERE namespace = ? AND embedding IS NOT NULL",
+                (namespace,)
+            ).fetchall()
+            if rows:
+                ids = np.array([row[0] for row in rows], dtype="int64")
+                vectors = np.stack([np.frombuffer(row[1], dtype="float32") for row in rows])
+                index.add_with_ids(vectors, ids)
+            self._indexes[namespace] = index
+        return index
+
+    # ------------------------------------------------------------------
+    # Чтение и запись
+    # ------------------------------------------------------------------
+
+    def get(self, namespace: str, query: str, semantic: bool = True) -> Optional[str]:
+        """
+        Ищет ответ в кэше: сначала точное совпадение, затем семантическое.
+
+        Возвращает:
+            Сохранённый ответ или None при промахе.
+        """
+        with span("cache.get", activate=False, namespace=namespace) as current:
+            response, hit = self._lookup(namespace, query, semantic)
+            current.set(cache_hit=response is not None, hit=hit.replace("_hits", ""))
+            return response
+
+    def _lookup(self, namespace: str, query: str, semantic: bool) -> Tuple[Optional[str], str]:
+        vector = None
+        if semantic and self.embeddings is not None and self.semantic_threshold is not None:
+            vector = self._embed(query)
+
+        now = time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, response, created_at, latency FROM entries WHERE namespace = ? AND key = ?",
+                (namespace, prompt_key(query))
+            ).fetchone()
+            hit = "exact_hits"
+
+            # Устаревшая точная запись не должна закрывать семантический поиск
+            if row is not None and now - row[2] > self.ttl_seconds:
+                row = None
+            if row is None and vector is not None:
+                row, hit = self._semantic_lookup(namespace, vector, now), "semantic_hits"
+
+            if row is None or now - row[2] > self.ttl_seconds:
+                self._stats["misses"] += 1
+                return None, "miss"
+
+            self._conn.execute("UPDATE entries SET accessed_at = ? WHERE id = ?", (now, row[0]))
+            self._conn.commit()
+            self._stats[hit] += 1
+            self._stats["latency_saved_seconds"] += row[3]
+            return row[1], hit
+
+    def _semantic_lookup(self, namespace: str, vector: np.ndarray, now: float):
+        index = self._index_for(namespace, vector.shape[0])
+        if index.ntotal == 0:
+            return None
+        # Несколько ближайших: устаревшие записи пропускаются, а не дают промах
+        scores, ids = index.search(vector.reshape(1, -1), min(SEMANTIC_CANDIDATES, index.ntotal))
+        for score, row_id in zip(scores[0], ids[0]):
+            if row_id < 0 or score < self.semantic_threshold:
+                break
+            row = self._conn.execute(
+                "SELECT id, response, created_at, latency FROM entries WHERE id = ?",
+                (int(row_id),)
+            ).fetchone()
+            if row is not None and now - row[2] <= self.ttl_seconds:
+                return row
+        return None
+
+    def put(self, namespace: str, query: str, response: str, latency: float = 0.0, semantic: bool = True) -> None:
+        """
+        Сохраняет ответ. latency — сколько заняла генерация (для метрики
+        сэкономленного времени).
+        """
+        vector = None
+        if semantic and self.embeddings is not None and self.semantic_threshold is not None:
+            vector = self._embed(query)
+
+        now = time()
+        with self._lock:
+            old = self._conn.execute(
+                "SELECT id FROM entries WHERE namespace = ? AND key = ?",
+                (namespace, prompt_key(query))
+            ).fetchone()
+            if old is not None:
+                self._delete_ids([old[0]])
+
+            cursor = self._conn.execute(
+                "INSERT INTO entries (namespace, key, query, response, embedding, created_at, accessed_at, latency) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    namespace, prompt_key(query), query, response,
+                    vector.tobytes() if vector is not None else None,
+                    now, now, latency
+                )
+            )
+            if vector is not None and namespace in self._indexes:
+                self._indexes[namespace].add_with_ids(
+                    vector.reshape(1, -1), np.array([cursor.lastrowid], dtype="int64")
+                )
+            self._evict(now)
+            self._conn.commit()
+
+    # ------------------------------------------------------------------
+    # Вытеснение
+    # ------------------------------------------------------------------
+
+    def _delete_ids(self, ids) -> None:
+        if not ids:
+            return
+        self._conn.executemany("DELETE FROM entries WHERE id = ?", [(i,) for i in ids])
+        id_array = np.array(ids, dtype="int64")
+        for index in self._indexes.values():
+            index.remove_ids(id_array)
+
+    def _evict(self, now: float) -> None:
+        expired = [row[0] for row in self._conn.execute(
+            "SELECT id FROM entries WHERE created_at < ?", (now - self.ttl_seconds,)
+        )]
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+        excess = count - len(expired) - self.max_entries
+        lru = []
+        if excess > 0:
+            lru = [row[0] for row in self._conn.execute(
+                "SELECT id FROM entries WHERE created_at >= ? ORDER BY accessed_at LIMIT ?",
+                (now - self.ttl_seconds, excess)
+            )]
+        self._delete_ids(expired + lru)
+        self._stats["evictions"] += len(expired) + len(lru)
+
+    def invalidate(self, namespace: Optional[str] = None) -> None:
+        """
+        Очищает одно пространство имён или весь кэш.
+        """
+        with self._lock:
+            if namespace is None:
+                self._conn.execute("DELETE FROM entries")
+                self._indexes.clear()
+            else:
+                self._conn.execute("DELETE FROM entries WHERE namespace = ?", (namespace,))
+                self._indexes.pop(namespace, None)
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        lookups = stats["exact_hits"] + stats["semantic_hits"] + stats["misses"]
+        stats["hit_rate"] = round((lookups - stats["misses"]) / lookups, 3) if lookups else 0.0
+        stats["latency_saved_seconds"] = round(stats["latency_saved_seconds"], 2)
+        return stats
+
+
+class CachedLLM:
+    """
+    Обёртка над LLM с кэшем точных совпадений промптов (семантический поиск
+    по длинным промптам с системными инструкциями бесполезен).
+    """
+
+    def __init__(self, llm, cache: ResponseCache, namespace: str = "llm"):
+        self.llm = llm
+        self.cache = cache
+        self.namespace = namespace
+
+    def chat(self, prompt: str) -> str:
+        cached = self.cache.get(self.namespace, prompt, semantic=False)
+        if cached is not None:
+            return cached
+
+        start = perf_counter()
+        response = self.llm.chat(prompt)
+        self.cache.put(self.namespace, prompt, response, latency=perf_counter() - start, semantic=False)
+        return response
+
+    def chat_stream(self, prompt: str) -> Iterator[str]:
+        cached = self.cache.get(self.namespace, prompt, semantic=False)
+        if cached is not None:
+            yield cached
+            return
+
+        start = perf_counter()
+        parts = []
+        for chunk in self.llm.chat_stream(prompt):
+            parts.append(chunk)
+            yield chunk
+        self.cache.put(self.namespace, prompt, "".join(parts), latency=perf_counter() - start, semantic=False)
+
+
+def cached_agent(agent_fn, cache: ResponseCache, namespace: str):
+    """
+    Оборачивает агента (llm, user_prompt, retriever=None) -> str кэшем
+    по запросу пользователя, включая семантические совпадения.
+    """
+    def wrapper(llm, user_prompt: str, retriever=None, **kwargs) -> str:
+        cached = cache.get(namespace, user_prompt)
+        if cached is not None:
+            return cached
+
+        start = perf_counter()
+        response = agent_fn(llm, user_prompt, retriever=retriever, **kwargs)
+        cache.put(namespace, user_prompt, response, latency=perf_counter() - start)
+        return response
+
+    return wrapper
+
+
+def cached_agent_stream(agent_stream_fn, cache: ResponseCache, namespace: str):
+    """
+    То же, что cached_agent, для потоковых агентов: при попадании ответ
+    отдаётся одним фрагментом, при промахе поток сохраняется целиком.
+    """
+    def wrapper(llm, user_prompt: str, retriever=None, **kwargs) -> Iterator[str]:
+        cached = cache.get(namespace, user_prompt)
+        if cached is not None:
+            yield cached
+            return
+
+        start = perf_counter()
+        parts = []
+        for chunk in agent_stream_fn(llm, user_prompt, retriever=retriever, **kwargs):
+            parts.append(chunk)
+            yield chunk
+        cache.put(namespace, user_prompt, "".join(parts), latency=perf_counter() - start)
+
+    return wrapper
+
+
+def cached_agent_async_stream(agent_stream_fn, cache: ResponseCache, namespace: str):
+    """
+    cached_agent_stream для асинхронных агентов (agents/async_agents.py).
+    Поиск в кэше считает эмбеддинг, поэтому идёт в пуле, а не в event loop.
+    """
+    async def wrapper(llm, user_prompt: str, retriever=None, **kwargs) -> AsyncIterator[str]:
+        cached = await asyncio.to_thread(cache.get, namespace, user_prompt)
+        if cached is not None:
+            yield cached
+            return
+
+        start = perf_counter()
+        parts = []
+        async for chunk in agent_stream_fn(llm, user_prompt, retriever=retriever, **kwargs):
+            parts.append(chunk)
+            yield chunk
+        await asyncio.to_thread(cache.put, namespace, user_prompt, "".join(parts), perf_counter() - start)
+
+    return wrapper
@@ -0,0 +1,115 @@
+# retrieval.py
+
+import os
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from typing import Dict, List, Optional, Tuple
+
+from agents.tracing import bind, span
+
+
+logger = logging.getLogger(__name__)
+
+# Сколько ещё ждать ретривер после того, как первая стадия LLM уже готова
+DEFAULT_RETRIEVAL_TIMEOUT = float(os.environ.get("RETRIEVAL_TIMEOUT", "15"))
+
+# Сколько вызовов одного вида ретривера может выполняться одновременно
+MAX_IN_FLIGHT_PER_RETRIEVER = int(os.environ.get("RETRIEVAL_MAX_IN_FLIGHT", "4"))
+
+# Пулы живут дольше запроса: зависший ретривер не должен блокировать его
+# завершение (как было бы с with-блоком). У каждого вида ретривера свой пул
+# и свой лимит, поэтому зависшие запросы к arXiv не занимают потоки
+# локального поиска по FAISS
+_pools: Dict[str, Tuple[ThreadPoolExecutor, threading.BoundedSemaphore]] = {}
+_pools_lock = threading.Lock()
+
+
+def _pool(kind: str) -> Tuple[ThreadPoolExecutor, threading.BoundedSemaphore]:
+    with _pools_lock:
+        if kind not in _pools:
+            _pools[kind] = (
+                ThreadPoolExecutor(max_workers=MAX_IN_FLIGHT_PER_RETRIEVER, thread_name_prefix=f"retrieval-{kind}"),
+                threading.BoundedSemaphore(MAX_IN_FLIGHT_PER_RETRIEVER)
+            )
+        return _pools[kind]
+
+
+def start_retrieval(retriever, query: str) -> Optional[Future]:
+    """
+    Запускает retriever.invoke(query) в фоне, чтобы поиск шёл параллельно
+    с первой стадией генерации. Возвращает None, если ретривера нет
+    или все слоты этого вида ретривера заняты (например, зависшими
+    запросами к arXiv): ждать их бессмысленно, агент ответит по первой стадии.
+    """
+    if not retriever:
+        return None
+    kind = type(retriever).__name__
+    executor, slots = _pool(kind)
+    if not slots.acquire(blocking=False):
+        logger.warning("Все слоты ретривера %s (%d) заняты, поиск пропущен", kind, MAX_IN_FLIGHT_PER_RETRIEVER)
+        return None
+    try:
+        future = executor.submit(bind(_invoke), retriever, query)
+    except BaseException:
+        slots.release()
+        raise
+    # Слот освобождается, только когда вызов действительно завершился:
+    # join_retrieval по таймауту перестаёт ждать, но поток ещё занят
+    future.add_done_callback(lambda _: slots.release())
+    return future
+
+
+def _invoke(retriever, query: str) -> List:
+    with span("retrieval", retriever=type(retriever).__name__) as current:
+        documents = retriever.invoke(query)
+        current.set(documents=len(documents))
+        return documents
+
+
+def join_retrieval(future: Optional[Future], timeout: Optional[float] = DEFAULT_RETRIEVAL_TIMEOUT) -> Optional[List]:
+    """
+    Дожидается результата поиска не дольше timeout секунд.
+
+    Возвращает:
+        Список документов или None, если ретривера нет, он не успел
+        или завершился с ошибкой. Для None и пустого списка агент отдаёт
+        ответ первой стадии без второго запроса к LLM.
+    """
+    if future is None:
+        return None
+    with span("retrieval.wait") as current:
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            future.cancel()
+            current.set(timed_out=True)
+            logger.warning("Ретривер не ответил за %.1f с, используем ответ первой стадии", timeout)
+        except Exception:
+            current.set(failed=True)
+            logger.exception("Ретривер завершился с ошибкой, используем ответ первой стадии")
+        return None
+
+
+async def join_retrieval_async(
+    future: Optional[Future],
+    timeout: Optional[float] = DEFAULT_RETRIEVAL_TIMEOUT
+) -> Optional[List]:
+    """
+    Асинхронный вариант join_retrieval для агентов из agents/async_agents.py:
+    ожидание не занимает поток event loop.
+    """
+    if future is None:
+        return None
+    with span("retrieval.wait") as current:
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            future.cancel()
+            current.set(timed_out=True)
+            logger.warning("Ретривер не ответил за %.1f с, используем ответ первой стадии", timeout)
+        except Exception:
+            current.set(failed=True)
+            logger.exception("Ретривер завершился с ошибкой, используем ответ первой стадии")
+        return None
@@ -0,0 +1,454 @@
+# tracing.py
+
+import os
+import json
+import uuid
+import inspect
+import functools
+import logging
+import threading
+import contextvars
+from collections import defaultdict
+from pathlib import Path
+from time import perf_counter, time
+from typing import Callable, Dict, List, Optional, Sequence
+
+
+logger = logging.getLogger(__name__)
+
+# Текущий активный спан запроса; в потоки пула передаётся через bind()
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+# Границы гистограммы длительностей для Prometheus, секунды
+DURATION_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Span:
+    """
+    Один этап обработки запроса: длительность, атрибуты (токены,
+    попадания в кэш, источник роутинга и т.п.) и ошибка, если была.
+    """
+
+    __slots__ = (
+        "name", "trace_id", "span_id", "parent_id", "attributes", "error",
+        "start_time", "duration", "_start", "_trace", "_token", "_activate",
+    )
+
+    def __init__(self, name: str, trace: "_Trace", parent: Optional["Span"], attributes: dict, activate: bool = True):
+        self.name = name
+        self.trace_id = trace.trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+        self.start_time = 0.0
+        self.duration = 0.0
+        self._start = 0.0
+        self._trace = trace
+        self._token = None
+        self._activate = activate
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def add(self, key: str, value: float) -> None:
+        self.attributes[key] = self.attributes.get(key, 0) + value
+
+    def __enter__(self) -> "Span":
+        self.start_time = time()
+        self._start = perf_counter()
+        if self._activate:
+            self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.duration = perf_counter() - self._start
+        if exc_type is not None and exc_type is not GeneratorExit:
+            self.error = f"{exc_type.__name__}: {exc}"
+        if self._token is not None:
+            try:
+                _current_span.reset(self._token)
+            except ValueError:
+                # Генератор закрыт из другого контекста — просто снимаем спан
+                _current_span.set(None)
+        self._trace.finish(self)
+        return False
+
+    @property
+    def spans(self) -> List["Span"]:
+        """
+        Все завершённые спаны запроса, к которому относится этот спан.
+        """
+        return list(self._trace.spans)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_time": round(self.start_time, 6),
+            "duration": round(self.duration, 6),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class _NoopSpan:
+    """
+    Заглушка, когда трассировка выключена: все операции ничего не делают.
+    """
+
+    __slots__ = ()
+
+    def set(self, **attributes) -> None:
+        pass
+
+    def add(self, key: str, value: float) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class _Trace:
+    """
+    Спаны одного запроса. Корневой спан закрывается последним
+    и отдаёт весь запрос экспортёрам.
+    """
+
+    def __init__(self, tracer: "Tracer"):
+        self.tracer = tracer
+        self.trace_id = uuid.uuid4().hex
+        self.spans: List[Span] = []
+        self.root: Optional[Span] = None
+        self._lock = threading.Lock()
+
+    def finish(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+        if span is self.root:
+            self.tracer.export(self.spans)
+
+
+class Tracer:
+    """
+    Лёгкая трассировка пайплайна агентов.
+
+    trace() открывает корневой спан запроса, span() — вложенный этап.
+    Вне активного запроса span() возвращает заглушку, поэтому выключенная
+    трассировка стоит одно чтение contextvar на этап.
+
+    Аргументы:
+        exporters: куда отдавать завершённые запросы (JsonlExporter,
+            InMemoryExporter, PrometheusExporter)
+        enabled: создавать ли трассы для каждого запроса
+    """
+
+    def __init__(self, exporters: Sequence = (), enabled: bool = True):
+        self.exporters = list(exporters)
+        self.enabled = enabled and bool(self.exporters)
+
+    def trace(self, name: str, force: bool = False, **attributes):
+        """
+        Корневой спан запроса. Если трасса уже идёт (например, её открыло
+        приложение), становится вложенным спаном. force=True включает
+        трассировку для одного запроса, даже если она выключена глобально.
+        """
+        parent = _current_span.get()
+        if parent is not None:
+            return Span(name, parent._trace, parent, attributes)
+        if not (self.enabled or force):
+            return NOOP_SPAN
+        trace = _Trace(self)
+        trace.root = Span(name, trace, None, attributes)
+        return trace.root
+
+    def export(self, spans: List[Span]) -> None:
+        for exporter in self.exporters:
+            try:
+                exporter.export(spans)
+            except Exception:
+                logger.exception("Экспортёр трасс %s завершился с ошибкой", type(exporter).__name__)
+
+
+def span(name: str, activate: bool = True, **attributes):
+    """
+    Вложенный спан этапа. activate=False — для листовых спанов внутри
+    генераторов, чтобы между yield они не становились родителем чужих этапов.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return NOOP_SPAN
+    return Span(name, parent._trace, parent, attributes, activate=activate)
+
+
+def current_span():
+    return _current_span.get() or NOOP_SPAN
+
+
+def bind(fn: Callable) -> Callable:
+    """
+    Привязывает функцию к текущему контексту трассировки, чтобы спаны,
+    созданные в потоке пула, попали в трассу запроса.
+    """
+    if _current_span.get() is None:
+        return fn
+    context = contextvars.copy_context()
+
+    def bound(*args, **kwargs):
+        return context.run(fn, *args, **kwargs)
+
+    return bound
+
+
+def traced(name: str, root: bool = False):
+    """
+    Декоратор: оборачивает функцию, генератор, корутину или асинхронный
+    генератор в спан. root=True — в корневой спан запроса (см. Tracer.trace).
+    """
+    def open_span():
+        return get_tracer().trace(name) if root else span(name)
+
+    def decorator(fn):
+        if inspect.isasyncgenfunction(fn):
+            @functools.wraps(fn)
+            async def async_generator_wrapper(*args, **kwargs):
+                with open_span():
+                    async for item in fn(*args, **kwargs):
+                        yield item
+            return async_generator_wrapper
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def coroutine_wrapper(*args, **kwargs):
+                with open_span():
+                    return await fn(*args, **kwargs)
+            return coroutine_wrapper
+
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def generator_wrapper(*args, **kwargs):
+                with open_span():
+                    yield from fn(*args, **kwargs)
+            return generator_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with open_span():
+                return fn(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """
+    Перцентиль q (0..100) по ближайшему рангу; для пустого списка — 0.
+    Общий для статистики очереди и отчётов в helpers/.
+    """
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def breakdown(spans: Sequence[Span]) -> List[dict]:
+    """
+    Плоская таблица этапов запроса: дерево спанов в порядке начала,
+    вложенность показана отступом.
+    """
+    by_id = {s.span_id: s for s in spans}
+    children: Dict[Optional[str], List[Span]] = defaultdict(list)
+    for s in sorted(spans, key=lambda s: s.start_time):
+        children[s.parent_id if s.parent_id in by_id else None].append(s)
+
+    rows = []
+
+    def walk(parent_id: Optional[str], depth: int) -> None:
+        for s in children.get(parent_id, ()):
+            rows.append(dict(
+                stage="  " * depth + s.name,
+                ms=round(s.duration * 1000, 1),
+                error=s.error,
+                **{k: v for k, v in s.attributes.items() if isinstance(v, (int, float, str, bool))}
+            ))
+            walk(s.span_id, depth + 1)
+
+    walk(None, 0)
+    return rows
+
+
+# ----------------------------------------------------------------------
+# Экспортёры
+# ----------------------------------------------------------------------
+
+class InMemoryExporter:
+    """
+    Складывает завершённые запросы в память (для тестов и UI).
+    """
+
+    def __init__(self, max_traces: int = 1000):
+        self.max_traces = max_traces
+        self.traces: List[List[Span]] = []
+        self._lock = threading.Lock()
+
+    def export(self, spans: List[Span]) -> None:
+        with self._lock:
+            self.traces.append(list(spans))
+            del self.traces[:-self.max_traces]
+
+    def clear(self) -> None:
+        with self._lock:
+            self.traces.clear()
+
+
+class JsonlExporter:
+    """
+    Дописывает каждый запрос отдельной строкой JSON со всеми спанами.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def export(self, spans: List[Span]) -> None:
+        record = {"trace_id": spans[0].trace_id, "spans": [s.to_dict() for s in spans]}
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+class PrometheusExporter:
+    """
+    Агрегирует спаны в метрики Prometheus: гистограмма длительностей,
+    ошибки, токены и попадания в кэш по имени этапа.
+    render() отдаёт текстовый формат, serve() — HTTP-эндпоинт /metrics.
+    """
+
+    def __init__(self, prefix: str = "fitness", buckets: Sequence[float] = DURATION_BUCKETS):
+        self.prefix = prefix
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._count: Dict[str, int] = defaultdict(int)
+        self._sum: Dict[str, float] = defaultdict(float)
+        self._buckets: Dict[str, List[int]] = defaultdict(lambda: [0] * len(self.buckets))
+        self._errors: Dict[str, int] = defaultdict(int)
+        self._tokens: Dict[tuple, int] = defaultdict(int)
+        self._cache_hits: Dict[str, int] = defaultdict(int)
+
+    def export(self, spans: List[Span]) -> None:
+        with self._lock:
+            for s in spans:
+                self._count[s.name] += 1
+                self._sum[s.name] += s.duration
+                counts = self._buckets[s.name]
+                for i, bound in enumerate(self.buckets):
+                    if s.duration <= bound:
+                        counts[i] += 1
+                if s.error:
+                    self._errors[s.name] += 1
+                for kind in ("prompt_tokens", "completion_tokens"):
+                    value = s.attributes.get(kind)
+                    if isinstance(value, int):
+                        self._tokens[(s.name, kind.split("_")[0])] += value
+                if s.attributes.get("cache_hit"):
+                    self._cache_hits[s.name] += 1
+
+    def render(self) -> str:
+        p = self.prefix
+        lines = [
+            f"# HELP {p}_stage_duration_seconds Длительность этапов обработки запроса",
+            f"# TYPE {p}_stage_duration_seconds histogram",
+        ]
+        with self._lock:
+            for name in sorted(self._count):
+                for bound, count in zip(self.buckets, self._buckets[name]):
+                    lines.append(f'{p}_stage_duration_seconds_bucket{{stage="{name}",le="{bound}"}} {count}')
+                lines.append(f'{p}_stage_duration_seconds_bucket{{stage="{name}",le="+Inf"}} {self._count[name]}')
+                lines.append(f'{p}_stage_duration_seconds_sum{{stage="{name}"}} {self._sum[name]:.6f}')
+                lines.append(f'{p}_stage_duration_seconds_count{{stage="{name}"}} {self._count[name]}')
+
+            lines += [f"# HELP {p}_stage_errors_total Ошибки этапов", f"# TYPE {p}_stage_errors_total counter"]
+            lines += [f'{p}_stage_errors_total{{stage="{n}"}} {v}' for n, v in sorted(self._errors.items())]
+
+            lines += [f"# HELP {p}_llm_tokens_total Токены LLM по этапам", f"# TYPE {p}_llm_tokens_total counter"]
+            lines += [
+                f'{p}_llm_tokens_total{{stage="{n}",kind="{k}"}} {v}' for (n, k), v in sorted(self._tokens.items())
+            ]
+
+            lines += [f"# HELP {p}_cache_hits_total Попадания в кэш", f"# TYPE {p}_cache_hits_total counter"]
+            lines += [f'{p}_cache_hits_total{{stage="{n}"}} {v}' for n, v in sorted(self._cache_hits.items())]
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int, host: str = "0.0.0.0"):
+        """
+        Запускает HTTP-эндпоинт /metrics в фоновом потоке.
+        """
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") != "/metrics":
+                    self.send_error(404)
+                    return
+                body = exporter.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+        return server
+
+
+_tracer: Optional[Tracer] = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer() -> Tracer:
+    """
+    Общий на процесс трассировщик. Настраивается переменными окружения:
+    TRACE_FILE — писать запросы в JSONL, METRICS_PORT — поднять /metrics.
+    Если ни одна не задана, трассировка выключена.
+    """
+    global _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            exporters = []
+            if os.environ.get("TRACE_FILE"):
+                exporters.append(JsonlExporter(os.environ["TRACE_FILE"]))
+            if os.environ.get("METRICS_PORT"):
+                metrics = PrometheusExporter()
+                metrics.serve(int(os.environ["METRICS_PORT"]))
+                exporters.append(metrics)
+            _tracer = Tracer(exporters)
+        return _tracer
+
+
+def configure_tracing(exporters: Sequence = (), enabled: bool = True) -> Tracer:
+    """
+    Заменяет общий трассировщик (например, InMemoryExporter в тестах).
+    """
+    global _tracer
+    with _tracer_lock:
+        _tracer = Tracer(exporters, enabled=enabled)
+        return _tracer
+
+
+def trace(name: str, force: bool = False, **attributes):
+    return get_tracer().trace(name, force=force, **attributes)
@@ -0,0 +1,169 @@
+# vector_store.py
+
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+
+
+INDEX_FILE = "index.faiss"
+CHUNKS_FILE = "chunks.sqlite3"
+STORE_FILE = "store.json"
+
+# flat  — точный поиск, как у текущего индекса;
+# sq8   — скалярное квантование 8 бит (≈4x меньше памяти, почти без потери качества);
+# ivf   — инвертированные списки, поиск только по nprobe ближайшим кластерам;
+# ivfpq — IVF + product quantization для больших корпусов
+INDEX_TYPES = ("flat", "sq8", "ivf", "ivfpq")
+
+
+def build_faiss_index(vectors: np.ndarray, index_type: str = "flat", nlist: Optional[int] = None, pq_m: int = 8):
+    """
+    Строит FAISS-индекс выбранного типа (метрика L2, как у LangChain FAISS).
+    """
+    import faiss
+
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Неизвестный тип индекса: {index_type}, доступны {INDEX_TYPES}")
+
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    count, dim = vectors.shape
+    nlist = nlist or max(1, int(np.sqrt(count)))
+
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif index_type == "sq8":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit)
+    elif index_type == "ivf":
+        index = faiss.IndexIVFFlat(faiss.IndexFlatL2(dim), dim, nlist)
+    else:
+        if dim % pq_m:
+            raise ValueError(f"Размерность {dim} должна делиться на pq_m={pq_m}")
+        # 8 бит на код требуют ≥256 точек для обучения — на маленьких корпусах меньше
+        nbits = max(1, min(8, int(np.log2(count))))
+        index = faiss.IndexIVFPQ(faiss.IndexFlatL2(dim), dim, nlist, pq_m, nbits)
+
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    return index
+
+
+def write_store(
+    path,
+    vectors,
+    texts: Sequence[str],
+    metadatas: Sequence[dict],
+    index_type: str = "flat",
+    nlist: Optional[int] = None,
+    pq_m: int = 8
+) -> None:
+    """
+    Сохраняет хранилище: FAISS-индекс, тексты и метаданные фрагментов
+    в SQLite (id фрагмента = позиция вектора в индексе) и описание store.json.
+    """
+    import faiss
+
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    vectors = np.asarray(vectors, dtype="float32")
+
+    index = build_faiss_index(vectors, index_type, nlist=nlist, pq_m=pq_m)
+    faiss.write_index(index, str(path / INDEX_FILE))
+
+    chunks_path = path / CHUNKS_FILE
+    if chunks_path.exists():
+        chunks_path.unlink()
+    conn = sqlite3.connect(str(chunks_path))
+    conn.execute("CREATE TABLE chunks (id INTEGER PRIMARY KEY, text TEXT NOT NULL, metadata TEXT NOT NULL)")
+    conn.executemany(
+        "INSERT INTO chunks (id, text, metadata) VALUES (?, ?, ?)",
+        ((i, text, json.dumps(meta, ensure_ascii=False)) for i, (text, meta) in enumerate(zip(texts, metadatas)))
+    )
+    conn.commit()
+    conn.close()
+
+    with open(path / STORE_FILE, "w", encoding="utf-8") as f:
+        json.dump({"index_type": index_type, "dim": vectors.shape[1], "count": len(texts)}, f)
+
+
+class _StoreRetriever:
+    def __init__(self, store: "MmapVectorStore", k: int):
+        self.store = store
+        self.k = k
+
+    def invoke(self, query: str) -> List[Document]:
+        return self.store.similarity_search(query, k=self.k)
+
+
+class MmapVectorStore:
+    """
+    Компактное хранилище фрагментов без pickle.
+
+    FAISS-индекс открывается через mmap (страницы общие для всех воркеров
+    на машине), тексты и метаданные читаются из SQLite по запросу, а не
+    распаковываются целиком в память каждого процесса.
+
+    Аргументы:
+        path: папка хранилища (см. write_store и helpers/migrate_vectordb.py)
+        embeddings: модель эмбеддингов с embed_query
+        nprobe: число просматриваемых кластеров для IVF-индексов
+        mmap: открывать индекс через mmap (если тип индекса это поддерживает)
+    """
+
+    def __init__(self, path, embeddings, nprobe: int = 8, mmap: bool = True):
+        import faiss
+
+        self.path = Path(path)
+        self.embeddings = embeddings
+        with open(self.path / STORE_FILE, encoding="utf-8") as f:
+            self.info = json.load(f)
+
+        index_path = str(self.path / INDEX_FILE)
+        self.index = None
+        if mmap:
+            try:
+                self.index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+            except RuntimeError:
+                # Не все типы индексов умеют mmap — читаем обычным способом
+                self.index = None
+        if self.index is None:
+            self.index = faiss.read_index(index_path)
+        if hasattr(self.index, "nprobe"):
+            self.index.nprobe = nprobe
+
+        self._conn = sqlite3.connect(
+            f"file:{self.path / CHUNKS_FILE}?mode=ro", uri=True, check_same_thread=False
+        )
+        self._lock = threading.Lock()
+
+    def _fetch(self, ids: Sequence[int]) -> List[Document]:
+        ids = [int(i) for i in ids if i >= 0]
+        if not ids:
+            return []
+        placeholders = ",".join("?" * len(ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, text, metadata FROM chunks WHERE id IN ({placeholders})", ids
+            ).fetchall()
+        by_id = {row[0]: Document(page_content=row[1], metadata=json.loads(row[2])) for row in rows}
+        return [by_id[i] for i in ids if i in by_id]
+
+    def search_ids(self, vectors, k: int = 4):
+        vectors = np.ascontiguousarray(np.atleast_2d(vectors), dtype="float32")
+        return self.index.search(vectors, k)
+
+    def similarity_search_by_vector(self, vector, k: int = 4) -> List[Document]:
+        _, ids = self.search_ids(vector, k)
+        return self._fetch(ids[0])
+
+    def similarity_search(self, query: str, k: int = 4) -> List[Document]:
+        return self.similarity_search_by_vector(self.embeddings.embed_query(query), k=k)
+
+    def as_retriever(self, search_kwargs: Optional[dict] = None, **_) -> _StoreRetriever:
+        # Как и VectorStore.as_retriever в LangChain: k берётся только из search_kwargs
+        return _StoreRetriever(self, k=(search_kwargs or {}).get("k", 4))
@@ -1,21 +1,23 @@
 import os
 import sys
-from pathlib import Path
+import uuid
+from functools import partial
 
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 sys.path.append(PROJECT_ROOT)
 
 import streamlit as st
 
-from time import sleep
-from mistralai import Mistral
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain_community.retrievers import ArxivRetriever
-
-from agents.coach_agent import trainer_agent
-from agents.nutritionist_agent import nutritionist_agent
-from agents.manager_agent import manager_agent
+from agents.coach_agent import trainer_agent_stream
+from agents.nutritionist_agent import nutritionist_agent_stream
+from agents.manager_agent import manager_agent_stream
+from agents.rate_limiter import get_scheduler
+from agents.async_agents import manager_agent_async_stream, nutritionist_agent_async_stream, trainer_agent_async_stream
+from agents.request_queue import QueueFullError
+from agents.plan_cache import plan_cached_agent_async_stream, plan_cached_agent_stream
+from agents.response_cache import CachedLLM, cached_agent_async_stream, cached_agent_stream
+from agents.resources import get_registry, read_api_key
+from agents.tracing import breakdown, trace
 
 
 ###########################################################################
@@ -39,72 +41,15 @@ st.write("""
 
 
 ###########################################################################
-# 2. Инициализация объектов один раз
+# 2. Общие ресурсы процесса
 ###########################################################################
 
-def init_objects():
-
-    # Инициализация LLM
-    key_path = Path(__file__).parent / "keys" / "mistral_key.txt"
-    with open(key_path, "r", encoding="utf-8") as f:
-        api_key = f.read().strip()
-
-    if (api_key == ""):
-        st.write("Положите Mistral ключ в app/keys/mistral_key.txt")
-
-    client = Mistral(api_key=api_key)
-    # model = "mistral-medium-latest"
-    # model = "mistral-medium"
-    model = "mistral-small-latest"
-
-    class SimpleLLM:
-        def __init__(self, client, model):
-            self.client = client
-            self.model = model
-
-        def chat(self, prompt: str) -> str:
-            response = self.client.chat.complete(
-                model=self.model,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            return response.choices[0].message.content
-
-    llm = SimpleLLM(client, model)
-
-    # Векторная база тренера
-    CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
-    DB_PATH = os.path.join(CURRENT_DIR, "..", "db", "trainer_vectordb")
-
-    embeddings = HuggingFaceEmbeddings(
-        model_name="sentence-transformers/all-MiniLM-L6-v2"
-    )
-
-    vectordb = FAISS.load_local(
-        DB_PATH,
-        embeddings, 
-        allow_dangerous_deserialization=True
-    )
-
-    coach_retriever = vectordb.as_retriever(k=15)
+# Модель эмбеддингов, FAISS-индекс и Mistral-клиент загружаются один раз
+# на процесс и переиспользуются всеми сессиями (см. agents/resources.py)
+registry = get_registry()
 
-    # Ретривер нутрициолога (ArXiv)
-    nutritionist_retriever = ArxivRetriever(load_max_docs=5)
-
-    return llm, coach_retriever, nutritionist_retriever
-
-
-# Создаем объекты только один раз в сессии
-if "initialized" not in st.session_state:
-
-    (
-        st.session_state.llm,
-        st.session_state.coach_retriever,
-        st.session_state.nutritionist_retriever
-    ) = init_objects()
-
-    st.session_state.initialized = True
+if not read_api_key():
+    st.write("Положите Mistral ключ в app/keys/mistral_key.txt")
 
 
 ###########################################################################
@@ -112,23 +57,86 @@ if "initialized" not in st.session_state:
 ###########################################################################
 
 user_query = st.text_area("Ваш запрос:")
+show_timings = st.sidebar.checkbox("Показывать время по этапам")
+
+# LLM_BACKEND=async: все сессии делят один event loop и пул соединений,
+# а запросы проходят через очередь с ограничением и честностью по сессиям
+async_backend = os.environ.get("LLM_BACKEND") == "async"
+session_id = st.session_state.setdefault("session_id", uuid.uuid4().hex)
 
 if st.button("Сгенерировать программу") and user_query.strip():
 
-    llm = st.session_state.llm
-    coach_ret = st.session_state.coach_retriever
-    nutr_ret = st.session_state.nutritionist_retriever
+    # Повторяющиеся запросы обслуживаются из кэша без вызовов LLM
+    cache = registry.response_cache()
+    # Найденные документы дедуплицируются, переранжируются и обрезаются
+    # по бюджету токенов модели перед вторым запросом (agents/context.py)
+    context = registry.context_assembler()
+    # Ссылки на видео ставятся локально по индексу упражнений; второй запрос
+    # к LLM с фрагментами базы — только при TRAINER_LLM_ILLUSTRATION=1
+    trainer_options = dict(
+        link_index=registry.link_index(),
+        llm_illustration=os.environ.get("TRAINER_LLM_ILLUSTRATION") == "1",
+        context=context
+    )
+    # Запросы с типовым профилем (цель, пол, возраст, вес, спорт, дни) получают
+    # сохранённый план с подстройкой чисел без генерации (agents/plan_cache.py)
+    plans = registry.plan_store() if os.environ.get("PLAN_CACHE") != "0" else None
+    coach_ret = registry.coach_retriever(k=15)
+    nutr_ret = registry.nutritionist_retriever()
 
-    with st.spinner("Генерирую ответ..."):
+    st.write("### Результат:")
+
+    # Ответ выводится по мере генерации: время до первого токена
+    # определяется роутингом и первой стадией агента, а не всем пайплайном.
+    # Трасса запроса пишется экспортёрам из TRACE_FILE / METRICS_PORT;
+    # для таблицы этапов включается принудительно только для этого запроса
+    with trace("request", force=show_timings) as request_span:
+        if async_backend:
+            trainer_fn = partial(trainer_agent_async_stream, **trainer_options)
+            nutritionist_fn = partial(nutritionist_agent_async_stream, context=context)
+            if plans is not None:
+                trainer_fn = plan_cached_agent_async_stream(trainer_fn, plans, "trainer")
+                nutritionist_fn = plan_cached_agent_async_stream(nutritionist_fn, plans, "nutritionist")
+            stream = registry.async_runtime().iterate(
+                registry.request_queue().stream(
+                    session_id,
+                    lambda: manager_agent_async_stream(
+                        llm=registry.async_llm(),
+                        user_query=user_query,
+                        trainer_agent_fn=cached_agent_async_stream(trainer_fn, cache, "trainer"),
+                        nutritionist_agent_fn=cached_agent_async_stream(nutritionist_fn, cache, "nutritionist"),
+                        coach_retriever=coach_ret,
+                        nutritionist_retriever=nutr_ret,
+                        router=registry.router()
+                    )
+                )
+            )
+        else:
+            trainer_fn = partial(trainer_agent_stream, **trainer_options)
+            nutritionist_fn = partial(nutritionist_agent_stream, context=context)
+            if plans is not None:
+                trainer_fn = plan_cached_agent_stream(trainer_fn, plans, "trainer")
+                nutritionist_fn = plan_cached_agent_stream(nutritionist_fn, plans, "nutritionist")
+            stream = manager_agent_stream(
+                llm=CachedLLM(registry.llm(), cache),
+                user_query=user_query,
+                trainer_agent_fn=cached_agent_stream(trainer_fn, cache, "trainer"),
+                nutritionist_agent_fn=cached_agent_stream(nutritionist_fn, cache, "nutritionist"),
+                coach_retriever=coach_ret,
+                nutritionist_retriever=nutr_ret,
+                router=registry.router()
+            )
+        try:
+            st.write_stream(stream)
+        except QueueFullError:
+            st.warning("Сейчас слишком много запросов, попробуйте через минуту.")
 
-        final_answer = manager_agent(
-            llm=llm,
-            user_query=user_query,
-            trainer_agent_fn=trainer_agent,
-            nutritionist_agent_fn=nutritionist_agent,
-            coach_retriever=coach_ret,
-            nutritionist_retriever=nutr_ret
-        )
+    if show_timings:
+        with st.expander("Время по этапам", expanded=True):
+            st.dataframe(breakdown(request_span.spans))
 
-    st.write("### Результат:")
-    st.write(final_answer)
+with st.sidebar.expander("Статистика LLM"):
+    st.json(get_scheduler().stats())
+
+with st.sidebar.expander("Ресурсы процесса"):
+    st.json(registry.stats())
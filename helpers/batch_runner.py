@@ -0,0 +1,246 @@
+import os
+import sys
+import json
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from time import perf_counter
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(PROJECT_ROOT)
+
+from agents.coach_agent import trainer_agent
+from agents.nutritionist_agent import nutritionist_agent
+from agents.manager_agent import manager_agent
+from agents.rate_limiter import estimate_tokens, get_scheduler
+from agents.response_cache import normalize_prompt
+from agents.router import LocalRouter
+
+# Поля входной записи, из которых берутся id и текст запроса
+ID_FIELDS = ("id", "request_id", "user_id")
+QUERY_FIELDS = ("query", "body", "text", "prompt")
+
+
+class _CountingLLM:
+    """
+    Обёртка над общим LLM, считающая вызовы и токены промптов одного запроса.
+    """
+
+    def __init__(self, llm):
+        self.llm = llm
+        self.calls = 0
+        self.prompt_tokens = 0
+        self._lock = threading.Lock()
+
+    def _count(self, prompt):
+        # Агенты одного запроса могут работать параллельно
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += estimate_tokens(prompt)
+
+    def chat(self, prompt):
+        self._count(prompt)
+        return self.llm.chat(prompt)
+
+    def chat_stream(self, prompt):
+        self._count(prompt)
+        return self.llm.chat_stream(prompt)
+
+
+def iter_requests(path):
+    """
+    Построчно читает входной JSONL, не загружая файл целиком.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            request_id = next((record[k] for k in ID_FIELDS if k in record), f"line-{line_no}")
+            query = next((record[k] for k in QUERY_FIELDS if record.get(k)), "")
+            yield str(request_id), query
+
+
+def load_completed(output_path):
+    """
+    id уже обработанных запросов из прошлого (возможно, упавшего) прогона.
+    Оборванная последняя строка пропускается, запросы с ошибкой
+    повторяются.
+    """
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                if "error" not in record:
+                    completed.add(str(record["id"]))
+            except (json.JSONDecodeError, KeyError, TypeError):
+                continue
+    return completed
+
+
+class BatchRunner:
+    """
+    Пакетная обработка запросов через manager_agent.
+
+    - пул из workers потоков, очередь ограничена 2 * workers задачами;
+    - все потоки делят один LLM и его LLMScheduler (общий лимит запросов);
+    - результаты дописываются в JSONL по мере готовности, так что после
+      падения прогон продолжается с уже обработанных id;
+    - одинаковые (после нормализации) запросы, пока первый из них ещё
+      выполняется, считаются один раз.
+    """
+
+    def __init__(
+        self,
+        llm,
+        workers=4,
+        coach_retriever=None,
+        nutritionist_retriever=None,
+        router=None,
+        link_index=None,
+        context=None
+    ):
+        self.llm = llm
+        self.workers = workers
+        self.coach_retriever = coach_retriever
+        self.nutritionist_retriever = nutritionist_retriever
+        self.router = router
+        self.trainer_agent_fn = partial(trainer_agent, link_index=link_index, context=context)
+        self.nutritionist_agent_fn = partial(nutritionist_agent, context=context)
+
+        self._write_lock = threading.Lock()
+        self._stats = {"processed": 0, "deduplicated": 0, "skipped": 0, "errors": 0, "llm_calls": 0}
+
+    def _process(self, query):
+        llm = _CountingLLM(self.llm)
+        start = perf_counter()
+        answer = manager_agent(
+            llm=llm,
+            user_query=query,
+            trainer_agent_fn=self.trainer_agent_fn,
+            nutritionist_agent_fn=self.nutritionist_agent_fn,
+            coach_retriever=self.coach_retriever,
+            nutritionist_retriever=self.nutritionist_retriever,
+            router=self.router
+        )
+        return answer, llm.calls, perf_counter() - start
+
+    def _write(self, out, request_id, query, deduplicated, future):
+        record = {"id": request_id, "query": query, "deduplicated": deduplicated}
+        try:
+            answer, llm_calls, seconds = future.result()
+            record.update(answer=answer, llm_calls=0 if deduplicated else llm_calls, seconds=round(seconds, 3))
+        except Exception as exc:
+            record.update(answer=None, error=repr(exc))
+
+        with self._write_lock:
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            self._stats["processed"] += 1
+            self._stats["errors"] += "error" in record
+            self._stats["llm_calls"] += record.get("llm_calls", 0)
+
+    def _count(self, name):
+        with self._write_lock:
+            self._stats[name] += 1
+
+    def run(self, input_path, output_path):
+        completed = load_completed(output_path)
+        # Если прошлый прогон упал посреди строки — начинаем с новой
+        if os.path.exists(output_path) and os.path.getsize(output_path):
+            with open(output_path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                needs_newline = f.read(1) != b"\n"
+        else:
+            needs_newline = False
+
+        slots = threading.BoundedSemaphore(2 * self.workers)
+        # Только выполняющиеся и ещё не записанные запросы: после записи
+        # future удаляется, чтобы не держать все ответы пакета в памяти
+        inflight = {}
+        inflight_lock = threading.Lock()
+
+        def forget(key, future):
+            with inflight_lock:
+                if inflight.get(key) is future:
+                    del inflight[key]
+        start = perf_counter()
+
+        with open(output_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(self.workers) as executor:
+            if needs_newline:
+                out.write("\n")
+
+            for request_id, query in iter_requests(input_path):
+                if request_id in completed:
+                    self._count("skipped")
+                    continue
+
+                key = normalize_prompt(query)
+                with inflight_lock:
+                    future = inflight.get(key)
+                deduplicated = future is not None
+                if deduplicated:
+                    self._count("deduplicated")
+                    future.add_done_callback(partial(self._write, out, request_id, query, deduplicated))
+                    continue
+
+                slots.acquire()
+                future = executor.submit(self._process, query)
+                with inflight_lock:
+                    inflight[key] = future
+                # Колбэки выполняются по порядку: слот, запись, удаление из inflight
+                future.add_done_callback(lambda _: slots.release())
+                future.add_done_callback(partial(self._write, out, request_id, query, deduplicated))
+                future.add_done_callback(partial(forget, key))
+
+        return self.report(perf_counter() - start)
+
+    def report(self, elapsed):
+        stats = dict(self._stats)
+        unique = stats["processed"] - stats["deduplicated"]
+        stats["elapsed_seconds"] = round(elapsed, 2)
+        stats["requests_per_minute"] = round(stats["processed"] / max(elapsed, 1e-9) * 60, 1)
+        stats["llm_calls_per_request"] = round(stats["llm_calls"] / max(unique, 1), 2)
+        stats["scheduler"] = get_scheduler().stats()
+        return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пакетная генерация планов по JSONL-файлу запросов")
+    parser.add_argument("--input", required=True, help="JSONL с полями id и query")
+    parser.add_argument("--output", required=True, help="JSONL с результатами (дописывается)")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--mock", action="store_true", help="использовать локальный MockLLM вместо Mistral")
+    parser.add_argument("--mock-latency", type=float, default=0.0)
+    parser.add_argument("--no-retrievers", action="store_true", help="без второй стадии агентов")
+    args = parser.parse_args()
+
+    if args.mock:
+        from helpers.mock_llm import MockLLM
+
+        llm = MockLLM(latency=args.mock_latency, scheduler=get_scheduler())
+        runner = BatchRunner(llm, workers=args.workers, router=LocalRouter())
+    else:
+        from agents.resources import get_registry
+
+        registry = get_registry()
+        runner = BatchRunner(
+            registry.llm(),
+            workers=args.workers,
+            coach_retriever=None if args.no_retrievers else registry.coach_retriever(k=15),
+            nutritionist_retriever=None if args.no_retrievers else registry.nutritionist_retriever(),
+            router=registry.router(),
+            link_index=registry.link_index(),
+            context=registry.context_assembler()
+        )
+
+    report = runner.run(args.input, args.output)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
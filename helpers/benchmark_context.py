@@ -0,0 +1,131 @@
+import os
+import sys
+import json
+import argparse
+from time import perf_counter
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(PROJECT_ROOT)
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from agents import coach_agent, nutritionist_agent
+from agents.context import ContextAssembler, DEFAULT_CONTEXT_TOKEN_BUDGET, _stems
+from agents.rate_limiter import estimate_tokens
+from agents.tracing import percentile
+from helpers.creating_db import TRAINER_FILE, read_pdf
+from helpers.creating_nutrition_db import NUTRITION_SOURCE_DIR, load_corpus
+from helpers.mock_llm import MockLLM
+from helpers.router_report import LABELED_QUERIES, load_labeled_queries
+
+
+def trainer_chunks():
+    # Те же параметры нарезки, что и при сборке базы тренера
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=20)
+    return splitter.split_text(read_pdf(TRAINER_FILE))
+
+
+def lexical_retrieve(query, texts, k):
+    """
+    Замена векторного ретривера для офлайн-бенчмарка: top-k по пересечению основ слов.
+    """
+    query_stems = _stems(query)
+    ranked = sorted(texts, key=lambda text: len(_stems(text) & query_stems), reverse=True)
+    return ranked[:k]
+
+
+def run_case(agent, query, texts, k, assembler, llm, real_llm=None):
+    first_prompt = f"{agent.SYSTEM_PROMPT}\n\nЗапрос пользователя:\n{query}"
+    first_response = llm.chat(first_prompt)
+    # Тренер подбирает контекст к плану, нутрициолог — к запросу (как в агентах)
+    context_query = first_response if agent is coach_agent else query
+    docs = lexical_retrieve(context_query, texts, k)
+
+    raw_prompt = agent._build_second_prompt("\n".join(docs), first_response)
+    start = perf_counter()
+    assembled = assembler.assemble(context_query, docs)
+    assemble_ms = (perf_counter() - start) * 1000
+    new_prompt = agent._build_second_prompt(assembled, first_response)
+
+    row = {
+        "query": query,
+        "raw_tokens": estimate_tokens(raw_prompt),
+        "assembled_tokens": estimate_tokens(new_prompt),
+        "assemble_ms": round(assemble_ms, 2),
+    }
+    if real_llm is not None:
+        for name, prompt in (("raw", raw_prompt), ("assembled", new_prompt)):
+            start = perf_counter()
+            real_llm.chat(prompt)
+            row[f"{name}_llm_seconds"] = round(perf_counter() - start, 2)
+    return row
+
+
+def summarize(rows):
+    summary = {
+        "requests": len(rows),
+        "raw_tokens_mean": round(sum(r["raw_tokens"] for r in rows) / max(len(rows), 1), 1),
+        "assembled_tokens_mean": round(sum(r["assembled_tokens"] for r in rows) / max(len(rows), 1), 1),
+        "assemble_ms_p50": percentile([r["assemble_ms"] for r in rows], 50),
+        "assemble_ms_p95": percentile([r["assemble_ms"] for r in rows], 95),
+    }
+    summary["tokens_saved_pct"] = round(
+        100 * (1 - summary["assembled_tokens_mean"] / max(summary["raw_tokens_mean"], 1)), 1
+    )
+    for name in ("raw", "assembled"):
+        latencies = [r[f"{name}_llm_seconds"] for r in rows if f"{name}_llm_seconds" in r]
+        if latencies:
+            summary[f"{name}_llm_seconds_p50"] = percentile(latencies, 50)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Размер второго промпта агентов до и после сборки контекста")
+    parser.add_argument("--queries", default=LABELED_QUERIES)
+    parser.add_argument("--budget", type=int, default=DEFAULT_CONTEXT_TOKEN_BUDGET, help="бюджет контекста в токенах")
+    parser.add_argument("--trainer-k", type=int, default=15)
+    parser.add_argument("--nutrition-k", type=int, default=5)
+    parser.add_argument("--extract-sentences", action="store_true")
+    parser.add_argument("--with-embeddings", action="store_true", help="MMR на эмбеддингах из реестра ресурсов")
+    parser.add_argument("--with-llm", action="store_true", help="замерить второй запрос к Mistral до и после")
+    parser.add_argument("--output", help="куда сохранить отчёт в JSON")
+    args = parser.parse_args()
+
+    registry = None
+    if args.with_embeddings or args.with_llm:
+        from agents.resources import get_registry
+
+        registry = get_registry()
+
+    assembler = ContextAssembler(
+        embeddings=registry.embeddings() if args.with_embeddings else None,
+        token_budget=args.budget,
+        extract_sentences=args.extract_sentences
+    )
+    llm = MockLLM()
+    real_llm = registry.llm() if args.with_llm else None
+
+    samples = load_labeled_queries(args.queries)
+    trainer_texts = trainer_chunks()
+    nutrition_texts = [doc.page_content for doc in load_corpus(NUTRITION_SOURCE_DIR)]
+
+    report = {}
+    for name, agent, option, texts, k in (
+        ("trainer", coach_agent, 1, trainer_texts, args.trainer_k),
+        ("nutritionist", nutritionist_agent, 2, nutrition_texts, args.nutrition_k),
+    ):
+        rows = [
+            run_case(agent, s["query"], texts, k, assembler, llm, real_llm)
+            for s in samples if option in s["label"]
+        ]
+        report[name] = summarize(rows)
+    report["context"] = assembler.stats()
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
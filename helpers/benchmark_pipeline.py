@@ -0,0 +1,265 @@
+import os
+import sys
+import json
+import argparse
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import cycle, islice
+from time import perf_counter
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(PROJECT_ROOT)
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from agents.coach_agent import trainer_agent
+from agents.context import ContextAssembler
+from agents.exercise_links import ExerciseLinkIndex, extract_exercise_links
+from agents.manager_agent import FAILED_AGENT_MESSAGE, manager_agent
+from agents.nutritionist_agent import nutritionist_agent
+from agents.plan_cache import PlanStore, plan_cached_agent
+from agents.rate_limiter import LLMScheduler
+from agents.router import LocalRouter
+from agents.tracing import percentile, trace
+from helpers.batch_runner import _CountingLLM
+from helpers.creating_db import TRAINER_FILE, read_pdf
+from helpers.creating_nutrition_db import NUTRITION_SOURCE_DIR, load_corpus
+from helpers.mock_llm import FakeRetriever, MockLLM
+from helpers.router_report import LABELED_QUERIES, load_labeled_queries
+
+TARGETS = ("manager", "trainer", "nutritionist")
+
+# Метрики, по которым прогон сравнивается с эталоном: True — больше значит хуже.
+# p99 только печатается: на нескольких десятках запросов это почти максимум, он шумит
+CHECKED_METRICS = {
+    "latency_ms_p50": True,
+    "latency_ms_p95": True,
+    "throughput_rps": False,
+    "llm_calls_per_request": True,
+    "prompt_tokens_per_request": True,
+    "failed_requests": True,
+}
+# Метрики времени зависят от загрузки машины, поэтому у них свой, более широкий допуск
+TIMING_METRICS = {"latency_ms_p50", "latency_ms_p95", "throughput_rps"}
+
+
+def build_pipeline(args, plan_store=None):
+    """
+    Агенты и ретриверы в той же конфигурации, что и в приложении,
+    но с MockLLM и FakeRetriever вместо Mistral и FAISS.
+    plan_store — кэш планов по профилю перед агентами (--plan-cache).
+    """
+    trainer_text = read_pdf(TRAINER_FILE)
+    # Те же параметры нарезки, что и при сборке базы тренера
+    trainer_texts = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=20).split_text(trainer_text)
+    nutrition_texts = [doc.page_content for doc in load_corpus(NUTRITION_SOURCE_DIR)]
+
+    coach_retriever = FakeRetriever(trainer_texts, k=15, delay=args.retriever_latency, seed=args.seed)
+    nutritionist_retriever = FakeRetriever(nutrition_texts, k=5, delay=args.retriever_latency, seed=args.seed + 1)
+    link_index = None if args.no_links else ExerciseLinkIndex(extract_exercise_links(trainer_text))
+    context = ContextAssembler(token_budget=args.context_budget)
+
+    trainer_fn = partial(trainer_agent, link_index=link_index, context=context)
+    nutritionist_fn = partial(nutritionist_agent, context=context)
+    if plan_store is not None:
+        trainer_fn = plan_cached_agent(trainer_fn, plan_store, "trainer")
+        nutritionist_fn = plan_cached_agent(nutritionist_fn, plan_store, "nutritionist")
+
+    return {
+        "trainer_agent_fn": trainer_fn,
+        "nutritionist_agent_fn": nutritionist_fn,
+        "coach_retriever": coach_retriever,
+        "nutritionist_retriever": nutritionist_retriever,
+        "router": None if args.llm_routing else LocalRouter(),
+    }
+
+
+def make_request(target, pipeline):
+    """
+    Функция (llm, query) -> ответ для выбранной точки входа.
+    """
+    if target == "manager":
+        return lambda llm, query: manager_agent(llm=llm, user_query=query, **pipeline)
+    if target == "trainer":
+        return lambda llm, query: pipeline["trainer_agent_fn"](llm, query, retriever=pipeline["coach_retriever"])
+    return lambda llm, query: pipeline["nutritionist_agent_fn"](
+        llm, query, retriever=pipeline["nutritionist_retriever"]
+    )
+
+
+def query_mix(samples, target, count):
+    """
+    Повторяет размеченные запросы по кругу до count штук. Агентам напрямую
+    отдаются только запросы с их меткой, менеджеру — весь набор, включая оффтоп.
+    """
+    option = {"trainer": 1, "nutritionist": 2}.get(target)
+    queries = [s["query"] for s in samples if option is None or option in s["label"]]
+    return list(islice(cycle(queries), count))
+
+
+def _timed(request, llm, query):
+    counting = _CountingLLM(llm)
+    start = perf_counter()
+    with trace("benchmark", force=True) as root:
+        try:
+            answer = request(counting, query)
+            failed = FAILED_AGENT_MESSAGE in answer
+        except Exception:
+            failed = True
+    return {
+        "seconds": perf_counter() - start,
+        "llm_calls": counting.calls,
+        "prompt_tokens": counting.prompt_tokens,
+        "failed": failed,
+        "spans": [(s.name, s.duration) for s in root.spans if s is not root],
+    }
+
+
+def run_level(target, pipeline, queries, concurrency, args):
+    """
+    Прогоняет запросы через target при заданном числе параллельных клиентов.
+    """
+    scheduler = LLMScheduler(requests_per_second=args.rps, burst=args.rps, base_delay=0.05, max_delay=1.0)
+    llm = MockLLM(
+        latency=args.llm_latency,
+        scheduler=scheduler,
+        failure_rate=args.failure_rate,
+        failure_status=args.failure_status,
+        completion_tokens=args.completion_tokens,
+        seed=args.seed
+    )
+    request = make_request(target, pipeline)
+
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        rows = list(executor.map(lambda q: _timed(request, llm, q), queries))
+    elapsed = perf_counter() - start
+
+    latencies = [r["seconds"] * 1000 for r in rows]
+    stages = defaultdict(list)
+    for r in rows:
+        for name, duration in r["spans"]:
+            stages[name].append(duration * 1000)
+
+    count = max(len(rows), 1)
+    return {
+        "requests": len(rows),
+        "concurrency": concurrency,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(len(rows) / max(elapsed, 1e-9), 2),
+        "latency_ms_p50": round(percentile(latencies, 50), 1),
+        "latency_ms_p95": round(percentile(latencies, 95), 1),
+        "latency_ms_p99": round(percentile(latencies, 99), 1),
+        "llm_calls_per_request": round(sum(r["llm_calls"] for r in rows) / count, 2),
+        "prompt_tokens_per_request": round(sum(r["prompt_tokens"] for r in rows) / count, 1),
+        "completion_tokens_per_request": round(llm.stats()["completion_tokens"] / count, 1),
+        "failed_requests": sum(r["failed"] for r in rows),
+        "retries": scheduler.stats()["retries"],
+        "stages_ms_p50": {name: round(percentile(values, 50), 1) for name, values in sorted(stages.items())},
+    }
+
+
+def compare(report, baseline, tolerance, timing_tolerance, min_delta_ms):
+    """
+    Сравнивает отчёт с эталоном и возвращает список регрессий.
+
+    Регрессия — ухудшение метрики больше чем на tolerance (доля от эталона);
+    для метрик времени — больше чем на timing_tolerance, а для задержек ещё
+    и больше чем на min_delta_ms в абсолютных единицах.
+    """
+    regressions = []
+    for target, levels in report["results"].items():
+        for level, metrics in levels.items():
+            expected = baseline.get("results", {}).get(target, {}).get(level)
+            if expected is None:
+                continue
+            for name, higher_is_worse in CHECKED_METRICS.items():
+                if name not in expected:
+                    continue
+                old, new = expected[name], metrics[name]
+                delta = new - old if higher_is_worse else old - new
+                if name in TIMING_METRICS:
+                    slack = abs(old) * timing_tolerance
+                    if name.startswith("latency"):
+                        slack = max(slack, min_delta_ms)
+                else:
+                    slack = abs(old) * tolerance
+                if delta > slack:
+                    regressions.append(
+                        f"{target} x{level}: {name} {old} -> {new} (допуск {round(slack, 3)})"
+                    )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк пайплайна агентов на MockLLM и фейковых ретриверах")
+    parser.add_argument("--queries", default=LABELED_QUERIES)
+    parser.add_argument("--target", choices=TARGETS + ("all",), default="all")
+    parser.add_argument("--requests", type=int, default=48, help="запросов на каждый уровень параллельности")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--llm-latency", default="lognormal:0.05,0.3",
+                        help="задержка LLM: секунды или kind:mean,spread[,per_token] (fixed/uniform/normal/lognormal)")
+    parser.add_argument("--retriever-latency", default="uniform:0.02,0.01")
+    parser.add_argument("--completion-tokens", type=int, default=300)
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="доля вызовов LLM с ошибкой API")
+    parser.add_argument("--failure-status", type=int, default=503)
+    parser.add_argument("--rps", type=float, default=1000.0, help="лимит LLMScheduler, запросов в секунду")
+    parser.add_argument("--context-budget", type=int, default=2000)
+    parser.add_argument("--llm-routing", action="store_true", help="роутинг только через LLM, без LocalRouter")
+    parser.add_argument("--no-links", action="store_true", help="без локального индекса ссылок на видео")
+    parser.add_argument("--plan-cache", action="store_true",
+                        help="кэш планов по профилю перед агентами (в памяти, без эмбеддингов: "
+                             "попадания только на повторы запросов)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="куда сохранить отчёт в JSON")
+    parser.add_argument("--save-baseline", help="сохранить отчёт как эталон")
+    parser.add_argument("--baseline", help="эталон для сравнения; при регрессии код выхода 1")
+    parser.add_argument("--tolerance", type=float, default=0.05,
+                        help="допустимое ухудшение вызовов, токенов и ошибок, доля от эталона")
+    parser.add_argument("--timing-tolerance", type=float, default=0.5,
+                        help="допустимое ухудшение задержек и пропускной способности")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0, help="абсолютный допуск для задержек")
+    args = parser.parse_args()
+
+    samples = load_labeled_queries(args.queries)
+    plan_store = PlanStore(":memory:") if args.plan_cache else None
+    pipeline = build_pipeline(args, plan_store)
+    targets = TARGETS if args.target == "all" else (args.target,)
+
+    config = {k: v for k, v in vars(args).items() if k not in ("output", "save_baseline", "baseline")}
+    # Эталон коммитится в репозиторий, поэтому путь — относительно его корня
+    config["queries"] = os.path.relpath(os.path.abspath(args.queries), PROJECT_ROOT)
+    report = {"config": config, "results": {}}
+    for target in targets:
+        queries = query_mix(samples, target, args.requests)
+        report["results"][target] = {
+            str(concurrency): run_level(target, pipeline, queries, concurrency, args)
+            for concurrency in args.concurrency
+        }
+
+    if plan_store is not None:
+        report["plan_cache"] = plan_store.stats()
+
+    print(json.dumps(report["results"], ensure_ascii=False, indent=2))
+    if plan_store is not None:
+        print(json.dumps({"plan_cache": report["plan_cache"]}, ensure_ascii=False, indent=2))
+    for path in (args.output, args.save_baseline):
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance, args.timing_tolerance, args.min_delta_ms)
+        for line in regressions:
+            print(f"РЕГРЕССИЯ: {line}")
+        if regressions:
+            sys.exit(1)
+        print("Регрессий относительно эталона нет")
+
+
+if __name__ == "__main__":
+    main()
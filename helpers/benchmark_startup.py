@@ -0,0 +1,122 @@
+import os
+import sys
+import json
+import argparse
+import subprocess
+from statistics import median
+from time import perf_counter
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(PROJECT_ROOT)
+
+# Модули, которые импортирует app/streamlit_app.py (кроме самого streamlit)
+APP_MODULES = (
+    "agents.coach_agent",
+    "agents.nutritionist_agent",
+    "agents.manager_agent",
+    "agents.rate_limiter",
+    "agents.response_cache",
+    "agents.resources",
+    "agents.tracing",
+)
+# Тяжёлые зависимости, которые не должны грузиться при импорте приложения
+HEAVY_MODULES = ("torch", "sentence_transformers", "transformers", "langchain_community", "mistralai", "onnxruntime")
+STAGES = ("import", "embeddings", "ready")
+BACKENDS = ("onnx", "huggingface")
+
+
+def _rss_mb():
+    from agents.resources import current_rss_mb
+
+    rss = current_rss_mb()
+    return round(rss, 1) if rss is not None else None
+
+
+def run_stage(stage):
+    """
+    Выполняется в чистом дочернем процессе. Стадии накопительные:
+    import — импорт модулей приложения;
+    embeddings — плюс загрузка модели эмбеддингов и первый embed_query;
+    ready — плюс индекс тренера, локальный роутер и первый поиск,
+    то есть всё, что нужно до ответа на первый запрос.
+    """
+    timings = {}
+    start = perf_counter()
+    for module in APP_MODULES:
+        __import__(module)
+    timings["import_seconds"] = perf_counter() - start
+    loaded = [m for m in HEAVY_MODULES if m in sys.modules]
+
+    if stage in ("embeddings", "ready"):
+        from agents.resources import get_registry
+
+        registry = get_registry()
+        mark = perf_counter()
+        registry.embeddings().embed_query("план тренировок для набора массы")
+        timings["embeddings_seconds"] = perf_counter() - mark
+
+        if stage == "ready":
+            mark = perf_counter()
+            registry.router().classify("Составь план тренировок на неделю")
+            registry.coach_retriever(k=15).invoke("жим штанги лёжа")
+            timings["index_seconds"] = perf_counter() - mark
+
+    result = {name: round(value, 3) for name, value in timings.items()}
+    result["total_seconds"] = round(perf_counter() - start, 3)
+    result["rss_mb"] = _rss_mb()
+    result["heavy_modules_at_import"] = loaded
+    return result
+
+
+def measure(stage, backend, repeat):
+    """
+    Запускает стадию repeat раз в новых процессах и берёт медианы.
+    """
+    env = dict(os.environ, EMBEDDINGS_BACKEND=backend)
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", stage],
+            env=env, capture_output=True, text=True, check=True
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+
+    summary = {
+        key: round(median(run[key] for run in runs), 3)
+        for key, value in runs[0].items() if isinstance(value, (int, float))
+    }
+    summary["heavy_modules_at_import"] = runs[0]["heavy_modules_at_import"]
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время холодного старта и RSS приложения по стадиям")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="куда сохранить отчёт в JSON")
+    parser.add_argument("--child", choices=STAGES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_stage(args.child)))
+        return
+
+    report = {}
+    for stage in args.stages:
+        # Импорт не зависит от бэкенда эмбеддингов
+        for backend in (args.backends[:1] if stage == "import" else args.backends):
+            name = stage if stage == "import" else f"{stage}:{backend}"
+            try:
+                report[name] = measure(stage, backend, args.repeat)
+            except subprocess.CalledProcessError as exc:
+                report[name] = {"error": (exc.stderr or "").strip().splitlines()[-1:]}
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import os
+import sys
+import json
+import argparse
+import subprocess
+import tempfile
+from time import perf_counter
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(PROJECT_ROOT)
+
+import numpy as np
+
+from agents.resources import current_rss_mb
+from agents.vector_store import INDEX_TYPES, MmapVectorStore, write_store
+
+LEGACY_DB_PATH = os.path.join(PROJECT_ROOT, "db", "trainer_vectordb")
+
+
+def _load_in_child(kind, path):
+    """
+    Загружает хранилище в текущем (свежем) процессе и печатает время и RSS.
+    """
+    rss_before = current_rss_mb()
+    start = perf_counter()
+    if kind == "legacy":
+        from helpers.migrate_vectordb import _NoEmbeddings
+        from langchain_community.vectorstores import FAISS
+
+        FAISS.load_local(path, _NoEmbeddings(), allow_dangerous_deserialization=True)
+    else:
+        MmapVectorStore(path, embeddings=None)
+    load_seconds = perf_counter() - start
+    print(json.dumps({"load_seconds": load_seconds, "rss_delta_mb": current_rss_mb() - rss_before}))
+
+
+def measure_load(kind, path, repeats):
+    runs = []
+    for _ in range(repeats):
+        output = subprocess.run(
+            [sys.executable, __file__, "--child", kind, "--path", path],
+            check=True, capture_output=True, text=True
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    return {
+        "load_seconds": round(float(np.median([r["load_seconds"] for r in runs])), 4),
+        "rss_delta_mb": round(float(np.median([r["rss_delta_mb"] for r in runs])), 2),
+    }
+
+
+def recall_at_k(vectors, store, k, queries):
+    """
+    recall@k относительно точного поиска по исходным векторам.
+    Запросы — зашумлённые векторы самих фрагментов.
+    """
+    rng = np.random.default_rng(0)
+    sample = vectors[rng.choice(len(vectors), size=min(queries, len(vectors)), replace=False)]
+    sample = sample + rng.normal(scale=0.05, size=sample.shape).astype("float32")
+
+    distances = ((sample[:, None, :] - vectors[None, :, :]) ** 2).sum(axis=-1)
+    truth = np.argsort(distances, axis=1)[:, :k]
+
+    start = perf_counter()
+    _, found = store.search_ids(sample, k)
+    search_ms = (perf_counter() - start) * 1000 / len(sample)
+
+    hits = sum(len(set(t) & set(f)) for t, f in zip(truth, found))
+    return hits / (len(sample) * k), search_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение старого FAISS+pickle и компактного хранилища")
+    parser.add_argument("--legacy", default=LEGACY_DB_PATH)
+    parser.add_argument("--index-types", nargs="+", default=["flat", "sq8", "ivf"], choices=INDEX_TYPES)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", help="куда сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    from helpers.migrate_vectordb import load_legacy
+
+    vectors, texts, metadatas = load_legacy(args.legacy)
+    vectors = np.asarray(vectors, dtype="float32")
+    results = {"chunks": len(texts), "legacy": measure_load("legacy", args.legacy, args.repeats)}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for index_type in args.index_types:
+            path = os.path.join(tmp, index_type)
+            write_store(path, vectors, texts, metadatas, index_type=index_type)
+            recall, search_ms = recall_at_k(vectors, MmapVectorStore(path, embeddings=None), args.k, args.queries)
+            results[index_type] = dict(
+                measure_load("compact", path, args.repeats),
+                recall_at_k=round(recall, 3),
+                search_ms=round(search_ms, 3),
+                size_kb=round(sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path)) / 1024, 1),
+            )
+
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    if "--child" in sys.argv:
+        child = argparse.ArgumentParser()
+        child.add_argument("--child", choices=["legacy", "compact"])
+        child.add_argument("--path")
+        child_args = child.parse_args()
+        _load_in_child(child_args.child, child_args.path)
+    else:
+        main()
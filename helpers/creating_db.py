@@ -1,53 +1,241 @@
 import os
-from langchain_community.document_loaders import PyPDFLoader
+import sys
+import json
+import hashlib
+import argparse
+from time import perf_counter
+from concurrent.futures import ProcessPoolExecutor
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from PyPDF2 import PdfReader
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from agents.exercise_links import EXERCISE_LINKS_FILE, ExerciseLinkIndex, extract_exercise_links
+from agents.vector_store import STORE_FILE
+
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
-TRAINER_FILE = os.path.join(CURRENT_DIR, "../data/knowledge/TrainerData.pdf")
+TRAINER_SOURCE_DIR = os.path.join(CURRENT_DIR, "../data/knowledge")
+TRAINER_FILE = os.path.join(TRAINER_SOURCE_DIR, "TrainerData.pdf")
 TRAINER_DB_PATH = os.path.join(CURRENT_DIR, "../db/trainer_vectordb")
+TRAINER_STORE_PATH = os.path.join(CURRENT_DIR, "../db/trainer_store")
 
-def read_pdf(file_path):
+# Соответствие «хэш содержимого фрагмента -> id в docstore» для инкрементальных обновлений
+MANIFEST_FILE = "manifest.json"
+# Сколько страниц PDF извлекает один процесс за задачу
+PAGES_PER_TASK = 8
+
+
+def _extract_pages(task):
+    file_path, start, end = task
     reader = PdfReader(file_path)
-    text = ""
-    for page in reader.pages:
-        page_text = page.extract_text()
-        if page_text:
-            text += page_text + "\n"
-    return text
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]
 
-def build_trainer_vectordb(file_path, db_path, embeddings_model):
-    if os.path.exists(db_path):
-        print(f"Загружаем существующую базу тренера: {db_path}")
-        return FAISS.load_local(db_path, embeddings_model)
 
-    text = read_pdf(file_path)
+def read_pdf(file_path):
+    # Страницы собираются в список и склеиваются один раз, без квадратичного text +=
+    return "\n".join(_extract_pages((file_path, 0, len(PdfReader(file_path).pages))))
 
-    text_splitter = RecursiveCharacterTextSplitter(
+
+def list_pdfs(source):
+    if os.path.isfile(source):
+        return [source]
+    return sorted(
+        os.path.join(source, name) for name in os.listdir(source) if name.lower().endswith(".pdf")
+    )
+
+
+def extract_documents(file_paths, workers=None):
+    """
+    Извлекает текст всех PDF в пуле процессов. Каждый файл режется на
+    диапазоны по PAGES_PER_TASK страниц, результаты собираются по порядку.
+
+    Возвращает:
+        ({путь: текст}, число страниц)
+    """
+    tasks = []
+    for file_path in file_paths:
+        page_count = len(PdfReader(file_path).pages)
+        tasks.extend(
+            (file_path, start, min(start + PAGES_PER_TASK, page_count))
+            for start in range(0, page_count, PAGES_PER_TASK)
+        )
+
+    if workers == 1 or len(tasks) <= 1:
+        results = list(map(_extract_pages, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_extract_pages, tasks))
+
+    pages = {file_path: [] for file_path in file_paths}
+    for (file_path, _, _), page_texts in zip(tasks, results):
+        pages[file_path].extend(page_texts)
+
+    page_count = sum(len(texts) for texts in pages.values())
+    return {file_path: "\n".join(texts) for file_path, texts in pages.items()}, page_count
+
+
+def chunk_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def load_manifest(db_path, vectordb):
+    """
+    Читает манифест базы. Для баз, собранных до появления манифеста,
+    восстанавливает его по содержимому docstore.
+    """
+    manifest_path = os.path.join(db_path, MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    manifest = {}
+    for doc_id in vectordb.index_to_docstore_id.values():
+        manifest[chunk_hash(vectordb.docstore.search(doc_id).page_content)] = doc_id
+    return manifest
+
+
+def save_manifest(db_path, manifest):
+    with open(os.path.join(db_path, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+
+
+def build_trainer_vectordb(
+    source,
+    db_path,
+    embeddings_model,
+    batch_size=64,
+    workers=None,
     chunk_size=1000,
     chunk_overlap=20,
-    length_function=len,
-    is_separator_regex=False,
-)
+):
+    """
+    Инкрементально строит базу тренера из PDF-файла или папки с PDF.
+
+    Фрагменты идентифицируются хэшем содержимого: эмбеддятся и добавляются
+    только новые/изменённые, а фрагменты, которых больше нет в источниках,
+    удаляются из индекса. База отражает текущее содержимое source.
+    """
+    start = perf_counter()
+    texts, page_count = extract_documents(list_pdfs(source), workers=workers)
+    extract_seconds = perf_counter() - start
+
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len,
+        is_separator_regex=False,
+    )
+
+    # Позиция фрагмента в файле не хранится: после правок она бы устарела у неизменённых фрагментов
+    chunks = {}
+    for file_path, text in texts.items():
+        for chunk in text_splitter.split_text(text):
+            chunks.setdefault(chunk_hash(chunk), (chunk, {"source": os.path.basename(file_path)}))
+
+    vectordb = None
+    manifest = {}
+    if os.path.exists(os.path.join(db_path, "index.faiss")):
+        print(f"Обновляем существующую базу тренера: {db_path}")
+        vectordb = FAISS.load_local(db_path, embeddings_model, allow_dangerous_deserialization=True)
+        manifest = load_manifest(db_path, vectordb)
+
+    new_hashes = [h for h in chunks if h not in manifest]
+    stale_hashes = [h for h in manifest if h not in chunks]
+
+    if stale_hashes:
+        vectordb.delete([manifest.pop(h) for h in stale_hashes])
 
-    # splitter = CharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-    chunks = text_splitter.split_text(text)
+    # Фрагмент мог переехать в другой файл: обновляем метаданные без повторного эмбеддинга
+    refreshed = 0
+    for h, doc_id in manifest.items():
+        document = vectordb.docstore.search(doc_id)
+        if document.metadata != chunks[h][1]:
+            document.metadata = dict(chunks[h][1])
+            refreshed += 1
 
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+    start = perf_counter()
+    for i in range(0, len(new_hashes), batch_size):
+        batch = new_hashes[i:i + batch_size]
+        batch_texts = [chunks[h][0] for h in batch]
+        text_embeddings = list(zip(batch_texts, embeddings_model.embed_documents(batch_texts)))
+        metadatas = [chunks[h][1] for h in batch]
 
-    vectordb = FAISS.from_texts(chunks, embeddings)
+        if vectordb is None:
+            vectordb = FAISS.from_embeddings(text_embeddings, embeddings_model, metadatas=metadatas, ids=batch)
+        else:
+            vectordb.add_embeddings(text_embeddings, metadatas=metadatas, ids=batch)
+        manifest.update({h: h for h in batch})
+    embed_seconds = perf_counter() - start
 
-    os.makedirs(db_path, exist_ok=True)
-    vectordb.save_local(db_path)
-    print(f"База тренера сохранена: {db_path}")
+    if vectordb is None:
+        raise ValueError(f"В {source} не найдено PDF с текстом")
+
+    # Индекс «упражнение -> видео» дешёвый, поэтому пересобирается при каждом запуске
+    link_entries = []
+    for file_path, text in texts.items():
+        link_entries.extend(extract_exercise_links(text, source=os.path.basename(file_path)))
+    ExerciseLinkIndex(link_entries).save(os.path.join(db_path, EXERCISE_LINKS_FILE))
+
+    if new_hashes or stale_hashes or refreshed or not os.path.exists(os.path.join(db_path, MANIFEST_FILE)):
+        os.makedirs(db_path, exist_ok=True)
+        vectordb.save_local(db_path)
+        save_manifest(db_path, manifest)
+        print(f"База тренера сохранена: {db_path}")
+    else:
+        print(f"База тренера актуальна: {db_path}")
+
+    print(
+        f"Страниц: {page_count} ({page_count / max(extract_seconds, 1e-9):.1f} стр/с), "
+        f"фрагментов: {len(chunks)}, новых: {len(new_hashes)}, удалено: {len(stale_hashes)}, "
+        f"обновлены метаданные: {refreshed}, "
+        f"эмбеддинги: {len(new_hashes) / max(embed_seconds, 1e-9):.1f} фрагм/с, "
+        f"ссылок на упражнения: {len(link_entries)}"
+    )
     return vectordb
 
-def setup_trainer_database():
+
+def refresh_compact_store(db_path, store_path):
+    """
+    Пересобирает компактное хранилище из обновлённой базы с тем же типом
+    индекса, если оно уже было создано helpers/migrate_vectordb.py.
+    """
+    store_file = os.path.join(store_path, STORE_FILE)
+    if not os.path.exists(store_file):
+        return
+    with open(store_file, encoding="utf-8") as f:
+        index_type = json.load(f).get("index_type", "flat")
+
+    from helpers.migrate_vectordb import migrate
+
+    migrate(db_path, store_path, index_type)
+
+
+def setup_trainer_database(source=TRAINER_SOURCE_DIR, db_path=TRAINER_DB_PATH, store_path=TRAINER_STORE_PATH, **kwargs):
     embeddings_model = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    trainer_db = build_trainer_vectordb(TRAINER_FILE, TRAINER_DB_PATH, embeddings_model)
+    trainer_db = build_trainer_vectordb(source, db_path, embeddings_model, **kwargs)
+    refresh_compact_store(db_path, store_path)
     return trainer_db
 
+
 if __name__ == "__main__":
-    setup_trainer_database()
+    parser = argparse.ArgumentParser(description="Инкрементальная сборка базы тренера из PDF")
+    parser.add_argument("--source", default=TRAINER_SOURCE_DIR, help="PDF-файл или папка с PDF")
+    parser.add_argument("--db", default=TRAINER_DB_PATH, help="папка FAISS-индекса")
+    parser.add_argument("--store", default=TRAINER_STORE_PATH, help="компактное хранилище; пересобирается, если существует")
+    parser.add_argument("--batch-size", type=int, default=64, help="размер батча эмбеддингов")
+    parser.add_argument("--workers", type=int, default=None, help="процессов для извлечения текста")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=20)
+    args = parser.parse_args()
+
+    setup_trainer_database(
+        args.source,
+        args.db,
+        args.store,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+    )
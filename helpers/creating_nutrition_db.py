@@ -0,0 +1,119 @@
+import os
+import json
+import argparse
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_community.vectorstores import FAISS
+from PyPDF2 import PdfReader
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+NUTRITION_SOURCE_DIR = os.path.join(CURRENT_DIR, "../data/nutrition")
+NUTRITION_DB_PATH = os.path.join(CURRENT_DIR, "../db/nutrition_vectordb")
+
+# Поля JSONL-записи, в которых может лежать текст статьи (выгрузки arXiv и т.п.)
+TEXT_FIELDS = ("text", "summary", "abstract", "page_content")
+
+
+def read_jsonl(file_path):
+    """
+    Читает выгрузку статей: одна JSON-запись на строку с заголовком
+    (title) и текстом (text/summary/abstract/page_content).
+    """
+    documents = []
+    with open(file_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            text = next((record[field] for field in TEXT_FIELDS if record.get(field)), "")
+            if not text:
+                continue
+            title = record.get("title", "")
+            documents.append(Document(
+                page_content=f"{title}\n{text}" if title else text,
+                metadata={
+                    "source": os.path.basename(file_path),
+                    "id": record.get("id", ""),
+                    "Title": title,
+                }
+            ))
+    return documents
+
+
+def read_pdf(file_path):
+    reader = PdfReader(file_path)
+    pages = [page.extract_text() or "" for page in reader.pages]
+    return [Document(
+        page_content="\n".join(pages),
+        metadata={"source": os.path.basename(file_path), "Title": os.path.splitext(os.path.basename(file_path))[0]}
+    )]
+
+
+def load_corpus(source_dir):
+    documents = []
+    for name in sorted(os.listdir(source_dir)):
+        path = os.path.join(source_dir, name)
+        if name.endswith(".jsonl"):
+            documents.extend(read_jsonl(path))
+        elif name.lower().endswith(".pdf"):
+            documents.extend(read_pdf(path))
+    return documents
+
+
+def build_nutrition_vectordb(source_dir, db_path, embeddings_model, chunk_size=1000):
+    """
+    Строит локальный индекс статей о питании из папки с JSONL/PDF.
+    Ретривер индекса (as_retriever) совместим с ArxivRetriever по интерфейсу
+    invoke(query) -> List[Document], поэтому агенту-нутрициологу не нужна сеть.
+    """
+    documents = load_corpus(source_dir)
+    if not documents:
+        raise ValueError(f"В {source_dir} нет JSONL или PDF с текстами статей")
+
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=100,
+        length_function=len,
+        is_separator_regex=False,
+    )
+    chunks = text_splitter.split_documents(documents)
+
+    vectordb = FAISS.from_documents(chunks, embeddings_model)
+
+    os.makedirs(db_path, exist_ok=True)
+    vectordb.save_local(db_path)
+    print(f"База нутрициолога сохранена: {db_path} ({len(documents)} документов, {len(chunks)} фрагментов)")
+    return vectordb
+
+
+def setup_nutrition_database(source_dir=NUTRITION_SOURCE_DIR, db_path=NUTRITION_DB_PATH, embeddings_model=None):
+    if embeddings_model is None:
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+
+        embeddings_model = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+    return build_nutrition_vectordb(source_dir, db_path, embeddings_model)
+
+
+def export_arxiv_cache(output_path):
+    """
+    Выгружает статьи, накопленные read-through кэшем arXiv, в JSONL для индексации.
+    """
+    import sys
+    sys.path.append(os.path.abspath(os.path.join(CURRENT_DIR, "..")))
+    from agents.nutrition_retriever import CachingArxivRetriever
+
+    count = CachingArxivRetriever(offline=True).export_corpus(output_path)
+    print(f"Выгружено статей из кэша arXiv: {count} -> {output_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Локальный индекс статей о питании")
+    parser.add_argument("--source", default=NUTRITION_SOURCE_DIR, help="папка с JSONL/PDF")
+    parser.add_argument("--db", default=NUTRITION_DB_PATH, help="куда сохранить FAISS-индекс")
+    parser.add_argument("--export-arxiv-cache", metavar="JSONL",
+                        help="сначала выгрузить кэш arXiv в этот файл (обычно внутри --source)")
+    args = parser.parse_args()
+
+    if args.export_arxiv_cache:
+        export_arxiv_cache(args.export_arxiv_cache)
+    setup_nutrition_database(args.source, args.db)
@@ -0,0 +1,111 @@
+import os
+import sys
+import argparse
+from time import perf_counter
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(PROJECT_ROOT)
+
+import numpy as np
+
+from agents.onnx_embeddings import ONNX_MODEL_FILE, OnnxEmbeddings
+from agents.resources import EMBEDDINGS_MODEL, ONNX_EMBEDDINGS_PATH
+from helpers.migrate_vectordb import LEGACY_DB_PATH, load_legacy
+
+
+def export(model_name, output_dir, opset=14):
+    """
+    Экспортирует трансформер модели в ONNX и сохраняет tokenizer.json.
+    torch и transformers нужны только здесь, приложению — нет.
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    tokenizer.save_pretrained(output_dir)
+
+    sample = tokenizer(["пример запроса", "example"], padding=True, return_tensors="pt")
+    names = ["input_ids", "attention_mask", "token_type_ids"]
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in names),
+            os.path.join(output_dir, ONNX_MODEL_FILE),
+            input_names=names,
+            output_names=["last_hidden_state"],
+            dynamic_axes={name: {0: "batch", 1: "sequence"} for name in names + ["last_hidden_state"]},
+            opset_version=opset,
+            do_constant_folding=True
+        )
+    print(f"Модель сохранена в {output_dir}")
+
+
+def quantize(output_dir):
+    """
+    Динамическая int8-квантизация весов: модель меньше и быстрее на CPU,
+    векторы немного расходятся с исходными (см. проверку совместимости).
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    path = os.path.join(output_dir, ONNX_MODEL_FILE)
+    fp32_path = path + ".fp32"
+    os.replace(path, fp32_path)
+    quantize_dynamic(fp32_path, path, weight_type=QuantType.QInt8)
+    os.remove(fp32_path)
+    print("Веса квантизованы в int8")
+
+
+def check_against_index(output_dir, db_path, samples):
+    """
+    Сравнивает ONNX-векторы фрагментов с векторами, уже лежащими в индексе
+    тренера (посчитанными через HuggingFaceEmbeddings).
+
+    Возвращает:
+        Минимальное косинусное сходство по проверенным фрагментам.
+    """
+    vectors, texts, _ = load_legacy(db_path)
+    step = max(1, len(texts) // samples)
+    ids = list(range(0, len(texts), step))[:samples]
+
+    embeddings = OnnxEmbeddings(output_dir)
+    start = perf_counter()
+    onnx_vectors = np.asarray(embeddings.embed_documents([texts[i] for i in ids]), dtype="float32")
+    seconds = perf_counter() - start
+
+    stored = vectors[ids]
+    stored = stored / np.linalg.norm(stored, axis=1, keepdims=True)
+    cosine = (onnx_vectors * stored).sum(axis=1)
+    print(
+        f"Проверено {len(ids)} фрагментов: косинус min {cosine.min():.5f}, mean {cosine.mean():.5f}; "
+        f"{seconds / len(ids) * 1000:.1f} мс на фрагмент"
+    )
+    return float(cosine.min())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Экспорт модели эмбеддингов в ONNX для EMBEDDINGS_BACKEND=onnx")
+    parser.add_argument("--model", default=EMBEDDINGS_MODEL)
+    parser.add_argument("--output", default=str(ONNX_EMBEDDINGS_PATH))
+    parser.add_argument("--opset", type=int, default=14)
+    parser.add_argument("--quantize", action="store_true", help="int8-квантизация весов")
+    parser.add_argument("--db-path", default=LEGACY_DB_PATH, help="индекс для проверки совместимости векторов")
+    parser.add_argument("--samples", type=int, default=50)
+    parser.add_argument("--min-cosine", type=float, default=0.99)
+    parser.add_argument("--skip-export", action="store_true", help="только проверить уже экспортированную модель")
+    args = parser.parse_args()
+
+    if not args.skip_export:
+        export(args.model, args.output, opset=args.opset)
+        if args.quantize:
+            quantize(args.output)
+
+    if os.path.exists(os.path.join(args.db_path, "index.faiss")):
+        if check_against_index(args.output, args.db_path, args.samples) < args.min_cosine:
+            print(f"Векторы расходятся с индексом сильнее порога {args.min_cosine}: пересоберите базу или не используйте ONNX")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import threading
+import subprocess
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from itertools import cycle
+from time import perf_counter
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(PROJECT_ROOT)
+
+from agents.async_agents import manager_agent_async, nutritionist_agent_async, trainer_agent_async
+from agents.async_llm import AsyncLLM, create_async_client
+from agents.coach_agent import trainer_agent
+from agents.llm import SimpleLLM
+from agents.manager_agent import FAILED_AGENT_MESSAGE, manager_agent
+from agents.nutritionist_agent import nutritionist_agent
+from agents.rate_limiter import LLMScheduler
+from agents.request_queue import FairRequestQueue, QueueFullError
+from agents.router import LocalRouter
+from agents.tracing import percentile
+from helpers.router_report import LABELED_QUERIES, load_labeled_queries
+
+
+class _ThreadSampler:
+    """
+    Фоново замеряет пиковое число потоков процесса.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def spawn_server(args):
+    """
+    Запускает заглушку отдельным процессом, чтобы её потоки
+    не смешивались с потоками клиента в замерах.
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    process = subprocess.Popen([
+        sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "mock_mistral_server.py"),
+        "--port", str(port), "--latency", args.latency, "--chunk-delay", "0",
+        "--failure-rate", str(args.failure_rate)
+    ], stdout=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(url + "/stats", timeout=1)
+            return process, url
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("Заглушка Mistral не запустилась")
+
+
+def server_stats(url):
+    with urllib.request.urlopen(url + "/stats", timeout=5) as response:
+        stats = json.load(response)
+    stats.pop("llm", None)
+    return stats
+
+
+def _summary(latencies, elapsed, rejected, failed):
+    # Задержки и пропускная способность — только по успешным ответам
+    return {
+        "completed": len(latencies),
+        "failed": failed,
+        "rejected": rejected,
+        "elapsed_seconds": round(elapsed, 2),
+        "throughput_rps": round(len(latencies) / max(elapsed, 1e-9), 2),
+        "latency_ms_p50": round(percentile(latencies, 50) * 1000, 1),
+        "latency_ms_p95": round(percentile(latencies, 95) * 1000, 1),
+    }
+
+
+async def run_async(server_url, workload, args):
+    """
+    Все пользователи в одном event loop: AsyncLLM с общим пулом соединений
+    и FairRequestQueue перед пайплайном.
+    """
+    scheduler = LLMScheduler(requests_per_second=args.rps, burst=args.rps, base_delay=0.05)
+    llm = AsyncLLM(create_async_client("mock", server_url=server_url), "mistral-small-latest", scheduler=scheduler)
+    queue = FairRequestQueue(args.concurrency, max_queue=args.queue_size, max_per_user=args.per_user)
+    router = LocalRouter()
+    latencies, rejected, failed = [], 0, 0
+
+    async def one(user_id, query):
+        nonlocal rejected, failed
+        start = perf_counter()
+        try:
+            answer = await queue.run(user_id, lambda: manager_agent_async(
+                llm, query, trainer_agent_async, nutritionist_agent_async, router=router
+            ))
+        except QueueFullError:
+            rejected += 1
+            return
+        except Exception:
+            failed += 1
+            return
+        if FAILED_AGENT_MESSAGE in answer:
+            failed += 1
+            return
+        latencies.append(perf_counter() - start)
+
+    async def user(user_id, queries):
+        # Пользователь отправляет запросы пачкой, не дожидаясь ответов
+        await asyncio.gather(*(one(user_id, q) for q in queries))
+
+    start = perf_counter()
+    with _ThreadSampler() as threads:
+        await asyncio.gather(*(user(user_id, queries) for user_id, queries in workload.items()))
+    result = _summary(latencies, perf_counter() - start, rejected, failed)
+    result.update(peak_threads=threads.peak, queue=queue.stats())
+    return result
+
+
+def run_sync(server_url, workload, args):
+    """
+    Прежняя схема: поток на запрос, SimpleLLM и синхронный manager_agent.
+    """
+    from mistralai import Mistral
+
+    scheduler = LLMScheduler(requests_per_second=args.rps, burst=args.rps, base_delay=0.05)
+    llm = SimpleLLM(Mistral(api_key="mock", server_url=server_url), "mistral-small-latest", scheduler=scheduler)
+    router = LocalRouter()
+    requests = [q for queries in workload.values() for q in queries]
+
+    def one(query):
+        start = perf_counter()
+        try:
+            answer = manager_agent(llm, query, trainer_agent, nutritionist_agent, router=router)
+        except Exception:
+            return None
+        if FAILED_AGENT_MESSAGE in answer:
+            return None
+        return perf_counter() - start
+
+    start = perf_counter()
+    with _ThreadSampler() as threads, ThreadPoolExecutor(max_workers=len(requests)) as executor:
+        results = list(executor.map(one, requests))
+    latencies = [seconds for seconds in results if seconds is not None]
+    result = _summary(latencies, perf_counter() - start, 0, len(results) - len(latencies))
+    result["peak_threads"] = threads.peak
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон async-пайплайна против заглушки API Mistral")
+    parser.add_argument("--queries", default=LABELED_QUERIES)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--requests-per-user", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=16, help="слотов FairRequestQueue")
+    parser.add_argument("--queue-size", type=int, default=64)
+    parser.add_argument("--per-user", type=int, default=2)
+    parser.add_argument("--rps", type=float, default=1000.0)
+    parser.add_argument("--latency", default="lognormal:0.3,0.3", help="задержка заглушки, см. LatencyModel.parse")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--server-url", help="уже запущенная заглушка (helpers/mock_mistral_server.py)")
+    parser.add_argument("--compare-sync", action="store_true", help="прогнать ту же нагрузку поток-на-запрос")
+    args = parser.parse_args()
+
+    process = None
+    server_url = args.server_url
+    if server_url is None:
+        process, server_url = spawn_server(args)
+
+    queries = cycle(s["query"] for s in load_labeled_queries(args.queries))
+    workload = {
+        f"user-{i}": [next(queries) for _ in range(args.requests_per_user)]
+        for i in range(args.users)
+    }
+
+    try:
+        report = {"async": asyncio.run(run_async(server_url, workload, args))}
+        report["async"]["server"] = server_stats(server_url)
+        if args.compare_sync:
+            report["sync"] = run_sync(server_url, workload, args)
+            # Счётчики заглушки накопительные: для sync — разница с async
+            after = server_stats(server_url)
+            report["sync"]["server"] = {k: after[k] - report["async"]["server"][k] for k in after}
+    finally:
+        if process is not None:
+            process.terminate()
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import os
+import sys
+import argparse
+from time import perf_counter
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(PROJECT_ROOT)
+
+from langchain_core.embeddings import Embeddings
+from langchain_community.vectorstores import FAISS
+
+from agents.vector_store import INDEX_TYPES, write_store
+
+LEGACY_DB_PATH = os.path.join(PROJECT_ROOT, "db", "trainer_vectordb")
+STORE_PATH = os.path.join(PROJECT_ROOT, "db", "trainer_store")
+
+
+class _NoEmbeddings(Embeddings):
+    # Для миграции векторы уже есть в индексе, модель эмбеддингов не нужна
+    def embed_documents(self, texts):
+        raise NotImplementedError
+
+    def embed_query(self, text):
+        raise NotImplementedError
+
+
+def load_legacy(db_path):
+    """
+    Загружает старую базу (index.faiss + pickle docstore) и возвращает
+    векторы, тексты и метаданные в порядке индекса.
+    """
+    vectordb = FAISS.load_local(db_path, _NoEmbeddings(), allow_dangerous_deserialization=True)
+    vectors = vectordb.index.reconstruct_n(0, vectordb.index.ntotal)
+
+    texts, metadatas = [], []
+    for i in range(vectordb.index.ntotal):
+        document = vectordb.docstore.search(vectordb.index_to_docstore_id[i])
+        texts.append(document.page_content)
+        metadatas.append(dict(document.metadata, docstore_id=vectordb.index_to_docstore_id[i]))
+    return vectors, texts, metadatas
+
+
+def migrate(src, dst, index_type="flat", nlist=None, pq_m=8):
+    start = perf_counter()
+    vectors, texts, metadatas = load_legacy(src)
+    write_store(dst, vectors, texts, metadatas, index_type=index_type, nlist=nlist, pq_m=pq_m)
+    print(f"Перенесено {len(texts)} фрагментов из {src} в {dst} ({index_type}) за {perf_counter() - start:.2f} с")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Перевод базы из index.faiss/index.pkl в компактный формат")
+    parser.add_argument("--src", default=LEGACY_DB_PATH)
+    parser.add_argument("--dst", default=STORE_PATH)
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat")
+    parser.add_argument("--nlist", type=int, default=None, help="число кластеров IVF (по умолчанию √N)")
+    parser.add_argument("--pq-m", type=int, default=8, help="число подвекторов PQ")
+    args = parser.parse_args()
+
+    migrate(args.src, args.dst, args.index_type, nlist=args.nlist, pq_m=args.pq_m)
@@ -0,0 +1,265 @@
+import os
+import sys
+import asyncio
+import hashlib
+import random
+import threading
+from time import sleep
+from typing import AsyncIterator, Iterator, List, Optional, Sequence, Union
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(PROJECT_ROOT)
+
+from langchain_core.documents import Document
+
+from agents.rate_limiter import LLMScheduler, estimate_tokens
+from agents.router import keyword_route
+
+# Маркер промпта агента-менеджера (см. ROUTING_PROMPT в agents/manager_agent.py)
+ROUTING_MARKER = "Ты агент-менеджер фитнес-ассистента"
+
+LATENCY_KINDS = ("fixed", "uniform", "normal", "lognormal")
+
+
+class LatencyModel:
+    """
+    Распределение задержки вызова в секундах.
+
+    fixed — всегда mean; uniform — mean ± spread; normal — N(mean, spread);
+    lognormal — с медианой mean и параметром формы spread (длинный хвост,
+    как у реального API). per_token добавляет время за каждый токен промпта.
+    """
+
+    def __init__(self, kind: str = "fixed", mean: float = 0.0, spread: float = 0.0, per_token: float = 0.0):
+        if kind not in LATENCY_KINDS:
+            raise ValueError(f"Неизвестное распределение: {kind}, доступны {LATENCY_KINDS}")
+        self.kind = kind
+        self.mean = mean
+        self.spread = spread
+        self.per_token = per_token
+
+    @classmethod
+    def parse(cls, spec: Union[str, float, "LatencyModel", None]) -> "LatencyModel":
+        """
+        Разбирает описание вида "0.5", "uniform:0.5,0.2", "lognormal:0.8,0.4,0.0001".
+        """
+        if isinstance(spec, LatencyModel):
+            return spec
+        if spec is None:
+            return cls()
+        if isinstance(spec, (int, float)):
+            return cls("fixed", float(spec))
+        kind, _, params = spec.partition(":") if ":" in spec else ("fixed", "", spec)
+        values = [float(v) for v in params.split(",") if v.strip()]
+        return cls(kind, *values)
+
+    def sample(self, rng: random.Random, tokens: int = 0) -> float:
+        if self.kind == "uniform":
+            value = rng.uniform(self.mean - self.spread, self.mean + self.spread)
+        elif self.kind == "normal":
+            value = rng.gauss(self.mean, self.spread)
+        elif self.kind == "lognormal":
+            value = self.mean * rng.lognormvariate(0.0, self.spread) if self.mean else 0.0
+        else:
+            value = self.mean
+        return max(0.0, value + self.per_token * tokens)
+
+    def __repr__(self) -> str:
+        return f"{self.kind}:{self.mean},{self.spread},{self.per_token}"
+
+
+class MockLLMError(Exception):
+    """
+    Имитация ошибки API с HTTP-кодом (как SDKError у mistralai),
+    чтобы LLMScheduler повторял 429/5xx так же, как в бою.
+    """
+
+    def __init__(self, status_code: int):
+        super().__init__(f"Mock API error {status_code}")
+        self.status_code = status_code
+
+
+class _Rng:
+    """
+    Генератор задержек и ошибок, не зависящий от порядка потоков:
+    n-й вызов с данным ключом (текстом промпта или запроса) всегда получает
+    одни и те же значения, поэтому прогоны с параллелизмом воспроизводимы.
+    """
+
+    def __init__(self, seed: int):
+        self.seed = seed
+        self._lock = threading.Lock()
+        self._seen = {}
+
+    def for_key(self, key: str) -> random.Random:
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+        with self._lock:
+            n = self._seen.get(digest, 0)
+            self._seen[digest] = n + 1
+        return random.Random(f"{self.seed}:{digest}:{n}")
+
+
+class MockLLM:
+    """
+    Детерминированная замена SimpleLLM для офлайн-прогонов без Mistral.
+
+    На промпт роутинга отвечает по правилам из agents/router.py, на прочие
+    промпты — шаблонным планом, зависящим только от текста промпта.
+
+    Аргументы:
+        latency: задержка одного вызова — число секунд, строка LatencyModel.parse
+            или LatencyModel
+        scheduler: опциональный LLMScheduler (чтобы прогон учитывал лимиты)
+        failure_rate: доля вызовов, завершающихся MockLLMError
+        failure_status: HTTP-код имитируемой ошибки (429/503 повторяются планировщиком)
+        completion_tokens: примерная длина ответа в токенах (план дополняется пунктами)
+        seed: зерно генератора задержек и ошибок
+    """
+
+    def __init__(
+        self,
+        latency: Union[float, str, LatencyModel] = 0.0,
+        scheduler: Optional[LLMScheduler] = None,
+        failure_rate: float = 0.0,
+        failure_status: int = 503,
+        completion_tokens: int = 0,
+        seed: int = 0
+    ):
+        self.latency = LatencyModel.parse(latency)
+        self.scheduler = scheduler
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.completion_tokens = completion_tokens
+        self._rng = _Rng(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+
+    def _start(self, prompt: str):
+        # Учёт вызова и розыгрыш задержки/ошибки; возвращает (задержка, ошибка ли)
+        tokens = estimate_tokens(prompt)
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += tokens
+        rng = self._rng.for_key(prompt)
+        return self.latency.sample(rng, tokens), rng.random() < self.failure_rate
+
+    def _finish(self, prompt: str, failed: bool) -> str:
+        if failed:
+            with self._lock:
+                self.failures += 1
+            raise MockLLMError(self.failure_status)
+
+        response = self._answer(prompt)
+        with self._lock:
+            self.output_tokens += estimate_tokens(response)
+        return response
+
+    def _respond(self, prompt: str) -> str:
+        delay, failed = self._start(prompt)
+        if delay:
+            sleep(delay)
+        return self._finish(prompt, failed)
+
+    async def _respond_async(self, prompt: str) -> str:
+        delay, failed = self._start(prompt)
+        if delay:
+            await asyncio.sleep(delay)
+        return self._finish(prompt, failed)
+
+    def _answer(self, prompt: str) -> str:
+        if ROUTING_MARKER in prompt:
+            query = prompt.rsplit("Запрос пользователя:", 1)[-1].strip()
+            options = keyword_route(query) or [0]
+            return "[" + ",".join(str(o) for o in options) + "]"
+
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8]
+        plan = (
+            f"День 1 – Грудь, спина ({digest}):\n"
+            "- Жим штанги лёжа – 3 подхода по 10 повторений\n"
+            "- Тяга верхнего блока к груди – 3 подхода по 10 повторений\n\n"
+            "Завтрак: овсянка с ягодами, 2 яйца\n"
+            "Обед: гречка, куриная грудка, салат\n"
+            "Ужин: рыба, овощи на пару"
+        )
+        day = 2
+        while estimate_tokens(plan) < self.completion_tokens:
+            plan += f"\n\nДень {day} – Ноги:\n- Жим ногами – 3 подхода по 12 повторений"
+            day += 1
+        return plan
+
+    def chat(self, prompt: str) -> str:
+        if self.scheduler is not None:
+            return self.scheduler.call(lambda: self._respond(prompt), estimated_tokens=estimate_tokens(prompt))
+        return self._respond(prompt)
+
+    def chat_stream(self, prompt: str) -> Iterator[str]:
+        for line in self.chat(prompt).splitlines(keepends=True):
+            yield line
+
+    async def achat(self, prompt: str) -> str:
+        # Интерфейс AsyncLLM (agents/async_llm.py)
+        if self.scheduler is not None:
+            return await self.scheduler.acall(
+                lambda: self._respond_async(prompt), estimated_tokens=estimate_tokens(prompt)
+            )
+        return await self._respond_async(prompt)
+
+    async def achat_stream(self, prompt: str) -> AsyncIterator[str]:
+        for line in (await self.achat(prompt)).splitlines(keepends=True):
+            yield line
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "failures": self.failures,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.output_tokens,
+            }
+
+
+class FakeRetriever:
+    """
+    Ретривер с тем же интерфейсом invoke(query) -> List[Document],
+    что у FAISS и ArxivRetriever, но без индекса и сети.
+
+    Документы выбираются детерминированно по хэшу запроса.
+
+    Аргументы:
+        texts: корпус фрагментов
+        k: сколько документов возвращать
+        delay: задержка поиска (как latency у MockLLM)
+        failure_rate: доля вызовов, завершающихся ошибкой
+        seed: зерно генератора задержек и ошибок
+    """
+
+    def __init__(
+        self,
+        texts: Sequence[str],
+        k: int = 4,
+        delay: Union[float, str, LatencyModel] = 0.0,
+        failure_rate: float = 0.0,
+        seed: int = 0
+    ):
+        if not texts:
+            raise ValueError("FakeRetriever нужен непустой корпус")
+        self.texts = list(texts)
+        self.k = k
+        self.delay = LatencyModel.parse(delay)
+        self.failure_rate = failure_rate
+        self._rng = _Rng(seed)
+
+    def invoke(self, query: str) -> List[Document]:
+        rng = self._rng.for_key(query)
+        delay = self.delay.sample(rng)
+        if delay:
+            sleep(delay)
+        if rng.random() < self.failure_rate:
+            raise RuntimeError("Mock retriever failure")
+
+        start = int(hashlib.sha256(query.encode("utf-8")).hexdigest(), 16) % len(self.texts)
+        picked = [self.texts[(start + i) % len(self.texts)] for i in range(min(self.k, len(self.texts)))]
+        return [Document(page_content=text, metadata={"fake": True}) for text in picked]
@@ -0,0 +1,184 @@
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(PROJECT_ROOT)
+
+from agents.rate_limiter import estimate_tokens
+from helpers.mock_llm import MockLLM, MockLLMError
+
+CHAT_PATH = "/v1/chat/completions"
+
+
+class MockMistralServer(ThreadingHTTPServer):
+    """
+    Локальная замена API Mistral для проверки SimpleLLM и AsyncLLM через
+    настоящий SDK и HTTP: POST /v1/chat/completions отвечает в формате
+    Mistral, при stream=true — SSE-событиями, как chat.stream.
+
+    Ответы генерирует MockLLM (роутинг, шаблонный план, задержки и ошибки).
+    GET /stats показывает число запросов и TCP-соединений — по нему видно,
+    переиспользует ли клиент пул соединений.
+    """
+
+    daemon_threads = True
+    # По умолчанию backlog 5: при сотнях одновременных подключений часть
+    # получила бы отказ в соединении ещё до обработчика
+    request_queue_size = 256
+
+    def __init__(self, address, llm: MockLLM, chunk_delay: float = 0.0):
+        super().__init__(address, _Handler)
+        self.llm = llm
+        self.chunk_delay = chunk_delay
+        self._lock = threading.Lock()
+        self.counters = {"requests": 0, "streams": 0, "errors": 0, "connections": 0}
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] += 1
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Keep-alive между запросами одного соединения, как у настоящего API
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.count("connections")
+
+    def _send_json(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._send_json(200, dict(self.server.counters, llm=self.server.llm.stats()))
+        else:
+            self._send_json(404, {"message": "Not found"})
+
+    def do_POST(self):
+        if self.path != CHAT_PATH:
+            self._send_json(404, {"message": "Not found"})
+            return
+
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        prompt = "\n".join(
+            m.get("content", "") for m in request.get("messages", []) if isinstance(m.get("content"), str)
+        )
+        self.server.count("requests")
+        try:
+            content = self.server.llm.chat(prompt)
+        except MockLLMError as exc:
+            self.server.count("errors")
+            self._send_json(exc.status_code, {"object": "error", "message": str(exc)})
+            return
+
+        model = request.get("model", "mock")
+        usage = {
+            "prompt_tokens": estimate_tokens(prompt),
+            "completion_tokens": estimate_tokens(content),
+            "total_tokens": estimate_tokens(prompt) + estimate_tokens(content),
+        }
+        completion_id = uuid.uuid4().hex
+        created = int(time.time())
+
+        if not request.get("stream"):
+            self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "model": model,
+                "created": created,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            })
+            return
+
+        self.server.count("streams")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        pieces = content.splitlines(keepends=True)
+        for i, piece in enumerate(pieces):
+            last = i == len(pieces) - 1
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "model": model,
+                "created": created,
+                "choices": [{
+                    "index": 0,
+                    "delta": {"role": "assistant", "content": piece},
+                    "finish_reason": "stop" if last else None,
+                }],
+            }
+            if last:
+                chunk["usage"] = usage
+            self._write_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            if self.server.chunk_delay:
+                time.sleep(self.server.chunk_delay)
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server(port: int = 0, host: str = "127.0.0.1", chunk_delay: float = 0.0, **llm_kwargs) -> MockMistralServer:
+    """
+    Запускает заглушку в фоновом потоке (port=0 — свободный порт).
+    llm_kwargs передаются в MockLLM: latency, failure_rate, failure_status и т.д.
+    """
+    server = MockMistralServer((host, port), MockLLM(**llm_kwargs), chunk_delay=chunk_delay)
+    threading.Thread(target=server.serve_forever, name="mock-mistral", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальная заглушка API Mistral (chat/completions, в том числе SSE)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", default="lognormal:0.8,0.4", help="задержка ответа, см. LatencyModel.parse")
+    parser.add_argument("--chunk-delay", type=float, default=0.02, help="пауза между SSE-фрагментами, с")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--failure-status", type=int, default=429)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    llm = MockLLM(
+        latency=args.latency,
+        failure_rate=args.failure_rate,
+        failure_status=args.failure_status,
+        seed=args.seed
+    )
+    server = MockMistralServer((args.host, args.port), llm, chunk_delay=args.chunk_delay)
+    print(f"Заглушка Mistral: {server.url}{CHAT_PATH} (MISTRAL_SERVER_URL={server.url})")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import os
+import sys
+import json
+import argparse
+from collections import Counter
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(PROJECT_ROOT)
+
+from agents.plan_cache import KEY_FIELDS, PLAN_CACHE_PATH, PlanStore, ProfileExtractor
+from helpers.router_report import LABELED_QUERIES, load_labeled_queries
+
+
+def make_extractor(args) -> ProfileExtractor:
+    # Цель без явных слов определяется по эмбеддингам, как в приложении
+    if args.embeddings:
+        from agents.resources import get_registry
+
+        return ProfileExtractor(get_registry().embeddings())
+    return ProfileExtractor()
+
+
+def cmd_profile(args):
+    """
+    Показывает профили и ключи запросов и сколько разных ключей они дают.
+    """
+    extractor = make_extractor(args)
+    queries = args.queries or [s["query"] for s in load_labeled_queries(args.labeled)]
+    fields = KEY_FIELDS[args.namespace]
+
+    keys = Counter()
+    for query in queries:
+        profile = extractor.extract(query)
+        key = profile.key(fields) if profile.cacheable else None
+        keys[key] += 1
+        row = {"query": query, "cacheable": profile.cacheable, "key": key, "profile": profile.to_dict()}
+        print(json.dumps(row, ensure_ascii=False))
+
+    cacheable = sum(count for key, count in keys.items() if key is not None)
+    print(json.dumps({
+        "queries": len(queries),
+        "cacheable": cacheable,
+        "distinct_keys": len([key for key in keys if key is not None]),
+    }, ensure_ascii=False))
+
+
+def cmd_list(args):
+    store = PlanStore(args.path)
+    for row in store.profiles():
+        print(json.dumps(row, ensure_ascii=False))
+    print(json.dumps(store.stats(), ensure_ascii=False))
+
+
+def cmd_invalidate(args):
+    store = PlanStore(args.path, extractor=make_extractor(args))
+    profile_key = args.profile
+    if args.query:
+        profile = store.extractor.extract(args.query)
+        profile_key = store.profile_key(args.namespace or "trainer", profile)
+    if profile_key is None and args.namespace is None and not args.all:
+        sys.exit("Укажите --profile, --query, --namespace или --all")
+    removed = store.invalidate(profile_key=profile_key, namespace=args.namespace)
+    print(json.dumps({"profile": profile_key, "namespace": args.namespace, "removed": removed}, ensure_ascii=False))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Кэш планов по профилю: ключи запросов, содержимое, инвалидация")
+    parser.add_argument("--path", default=str(PLAN_CACHE_PATH))
+    parser.add_argument("--embeddings", action="store_true", help="определять цель по эмбеддингам, как в приложении")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    profile = commands.add_parser("profile", help="профили и ключи для запросов")
+    profile.add_argument("queries", nargs="*", help="запросы; по умолчанию — размеченный набор")
+    profile.add_argument("--labeled", default=LABELED_QUERIES)
+    profile.add_argument("--namespace", choices=sorted(KEY_FIELDS), default="trainer")
+    profile.set_defaults(handler=cmd_profile)
+
+    listing = commands.add_parser("list", help="профили в кэше: варианты, попадания, возраст")
+    listing.set_defaults(handler=cmd_list)
+
+    invalidate = commands.add_parser("invalidate", help="удалить планы профиля, агента или все")
+    invalidate.add_argument("--profile", help="ключ профиля, как в выводе list")
+    invalidate.add_argument("--query", help="удалить планы профиля этого запроса")
+    invalidate.add_argument("--namespace", choices=sorted(KEY_FIELDS))
+    invalidate.add_argument("--all", action="store_true")
+    invalidate.set_defaults(handler=cmd_invalidate)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import os
+import sys
+import json
+import argparse
+from time import perf_counter
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(PROJECT_ROOT)
+
+from agents.router import LocalRouter
+from agents.manager_agent import route_query
+from agents.tracing import percentile
+
+LABELED_QUERIES = os.path.join(PROJECT_ROOT, "data", "routing", "labeled_queries.jsonl")
+
+
+def load_labeled_queries(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def build_report(router, samples, llm=None):
+    """
+    Прогоняет размеченные запросы через локальный роутер.
+    Если передан llm, неоднозначные запросы досылаются LLM-роутеру,
+    и считается точность всего пайплайна роутинга.
+    """
+    rows = []
+    for sample in samples:
+        expected = sorted(sample["label"])
+
+        start = perf_counter()
+        options, source, confidence = router.classify(sample["query"])
+        local_ms = (perf_counter() - start) * 1000
+
+        llm_ms = 0.0
+        if options is None and llm is not None:
+            start = perf_counter()
+            options = route_query(llm, sample["query"])
+            llm_ms = (perf_counter() - start) * 1000
+
+        rows.append({
+            "query": sample["query"],
+            "expected": expected,
+            "predicted": sorted(options) if options is not None else None,
+            "source": source,
+            "confidence": round(confidence, 3),
+            "local_ms": round(local_ms, 2),
+            "llm_ms": round(llm_ms, 2),
+        })
+
+    local_rows = [r for r in rows if r["source"] != "ambiguous"]
+    answered = [r for r in rows if r["predicted"] is not None]
+    local_latencies = [r["local_ms"] for r in rows]
+
+    summary = {
+        "queries": len(rows),
+        "decided_locally": len(local_rows),
+        "local_coverage": round(len(local_rows) / max(1, len(rows)), 3),
+        "local_accuracy": round(
+            sum(r["predicted"] == r["expected"] for r in local_rows) / max(1, len(local_rows)), 3
+        ),
+        "by_source": {s: sum(r["source"] == s for r in rows) for s in ("keyword", "embedding", "ambiguous")},
+        "local_latency_ms": {
+            "p50": percentile(local_latencies, 50),
+            "p95": percentile(local_latencies, 95),
+            "max": max(local_latencies, default=0.0),
+        },
+        "llm_calls_saved": len(local_rows),
+    }
+    if llm is not None:
+        summary["end_to_end_accuracy"] = round(
+            sum(r["predicted"] == r["expected"] for r in answered) / max(1, len(rows)), 3
+        )
+        summary["llm_latency_ms_total"] = round(sum(r["llm_ms"] for r in rows), 1)
+
+    return {"summary": summary, "rows": rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Отчёт о точности и задержке локального роутера")
+    parser.add_argument("--queries", default=LABELED_QUERIES, help="JSONL с полями query и label")
+    parser.add_argument("--threshold", type=float, default=0.6)
+    parser.add_argument("--margin", type=float, default=0.05)
+    parser.add_argument("--no-embeddings", action="store_true", help="только правила по ключевым словам")
+    parser.add_argument("--with-llm", action="store_true", help="досылать неоднозначные запросы в Mistral")
+    parser.add_argument("--output", help="куда сохранить полный отчёт в JSON")
+    args = parser.parse_args()
+
+    from agents.resources import get_registry
+
+    registry = get_registry()
+    embeddings = None if args.no_embeddings else registry.embeddings()
+    router = LocalRouter(embeddings, threshold=args.threshold, margin=args.margin)
+    llm = registry.llm() if args.with_llm else None
+
+    report = build_report(router, load_labeled_queries(args.queries), llm=llm)
+
+    for row in report["rows"]:
+        mark = "ok " if row["predicted"] == row["expected"] else "ERR"
+        print(f"{mark} {row['source']:<9} {str(row['predicted']):<8} ожидалось {str(row['expected']):<8} {row['query']}")
+    print(json.dumps(report["summary"], ensure_ascii=False, indent=2))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+import pytest
+
+from agents.coach_agent import trainer_agent
+from agents.nutritionist_agent import nutritionist_agent
+
+
+class RecordingLLM:
+    def __init__(self):
+        self.prompts = []
+
+    def chat(self, prompt):
+        self.prompts.append(prompt)
+        return f"ответ {len(self.prompts)}"
+
+
+class EmptyRetriever:
+    def invoke(self, query):
+        return []
+
+
+@pytest.mark.parametrize("agent", [trainer_agent, nutritionist_agent])
+def test_empty_retrieval_returns_first_stage_answer(agent):
+    llm = RecordingLLM()
+    assert agent(llm, "Составь план", retriever=EmptyRetriever()) == "ответ 1"
+    assert len(llm.prompts) == 1
@@ -0,0 +1,47 @@
+import json
+
+from agents.router import LocalRouter
+from helpers.batch_runner import BatchRunner, load_completed
+from helpers.mock_llm import MockLLM
+
+
+def _write_jsonl(path, records):
+    with open(path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def _read_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def test_load_completed_skips_errors_and_torn_lines(tmp_path):
+    output = tmp_path / "out.jsonl"
+    output.write_text(
+        '{"id": "a", "answer": "план"}\n'
+        '{"id": "b", "answer": null, "error": "SDKError(503)"}\n'
+        '{"id": "c", "answ',
+        encoding="utf-8"
+    )
+    assert load_completed(output) == {"a"}
+
+
+def test_resume_retries_failed_requests(tmp_path):
+    source, output = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    _write_jsonl(source, [
+        {"id": "1", "query": "Составь план тренировок"},
+        {"id": "2", "query": "Подбери мне питание для похудения"},
+        {"id": "3", "query": "подбери мне питание для похудения!"},
+    ])
+    _write_jsonl(output, [
+        {"id": "1", "answer": "готово"},
+        {"id": "2", "answer": None, "error": "SDKError(503)"},
+    ])
+
+    report = BatchRunner(MockLLM(), workers=2, router=LocalRouter()).run(source, output)
+
+    assert report["skipped"] == 1 and report["processed"] == 2 and report["errors"] == 0
+    retried = [r for r in _read_jsonl(output) if r["id"] in ("2", "3")]
+    assert all(r["answer"] for r in retried if "error" not in r)
+    assert load_completed(output) == {"1", "2", "3"}
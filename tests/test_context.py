@@ -0,0 +1,26 @@
+from agents.context import ContextAssembler, _cut_at_boundary
+
+
+def test_cut_prefers_sentence_end():
+    text = "Первое предложение про присед. Второе предложение про жим лёжа и технику."
+    assert _cut_at_boundary(text, 50) == "Первое предложение про присед."
+
+
+def test_cut_never_splits_url():
+    url = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+    text = "Присед со штангой " + url + " — смотрите технику"
+    for limit in range(len("Присед со штангой ") + 1, len("Присед со штангой ") + len(url)):
+        cut = _cut_at_boundary(text, limit)
+        assert url in cut or "https" not in cut
+    # Без пробелов до ссылки от неё ничего не остаётся, обрезка не оставляет полссылки
+    assert _cut_at_boundary(url + " техника", 20) == ""
+
+
+def test_trim_keeps_whole_words_and_links():
+    url = "https://youtu.be/abcdefghijk"
+    documents = ["а" * 396, "Подтягивания: " + "x " * 110 + url + " конец"]
+    kept = ContextAssembler(token_budget=220).trim(documents)
+
+    assert len(kept) == 2
+    assert "https" not in kept[1] or url in kept[1]
+    assert not kept[1].endswith(" ")
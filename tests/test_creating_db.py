@@ -0,0 +1,47 @@
+from langchain_core.embeddings import FakeEmbeddings
+
+from helpers import creating_db
+
+
+class CountingEmbeddings(FakeEmbeddings):
+    embedded: int = 0
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return super().embed_documents(texts)
+
+
+PARAGRAPHS = [f"Упражнение {i}: присед со штангой, {i} подходов по {i + 5} повторений." * 3 for i in range(6)]
+
+
+def build(monkeypatch, tmp_path, texts):
+    monkeypatch.setattr(creating_db, "list_pdfs", lambda source: sorted(texts))
+    monkeypatch.setattr(creating_db, "extract_documents", lambda paths, workers=None: (dict(texts), len(texts)))
+    embeddings = CountingEmbeddings(size=16)
+    vectordb = creating_db.build_trainer_vectordb(
+        "unused", str(tmp_path / "db"), embeddings, chunk_size=300, chunk_overlap=0
+    )
+    return vectordb, embeddings.embedded
+
+
+def contents(vectordb):
+    return {d.page_content: d.metadata for d in vectordb.docstore._dict.values()}
+
+
+def test_incremental_rebuild(monkeypatch, tmp_path):
+    texts = {"a.pdf": "\n\n".join(PARAGRAPHS[:4]), "b.pdf": "\n\n".join(PARAGRAPHS[4:])}
+    vectordb, embedded = build(monkeypatch, tmp_path, texts)
+    assert embedded == len(contents(vectordb)) == 6
+
+    # Повторная сборка без изменений ничего не эмбеддит
+    vectordb, embedded = build(monkeypatch, tmp_path, texts)
+    assert embedded == 0 and len(contents(vectordb)) == 6
+
+    # Абзац удалён из a.pdf и перенесён в b.pdf: удаление и новые метаданные без эмбеддинга
+    texts = {"a.pdf": "\n\n".join(PARAGRAPHS[:2]), "b.pdf": "\n\n".join(PARAGRAPHS[3:])}
+    vectordb, embedded = build(monkeypatch, tmp_path, texts)
+    docs = contents(vectordb)
+    assert embedded == 0
+    assert PARAGRAPHS[2] not in docs and len(docs) == 5
+    assert docs[PARAGRAPHS[3]] == {"source": "b.pdf"}
+    assert docs[PARAGRAPHS[0]] == {"source": "a.pdf"}
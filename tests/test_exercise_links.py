@@ -0,0 +1,69 @@
+import asyncio
+
+from agents.exercise_links import ExerciseLinkIndex, extract_exercise_links
+
+KNOWLEDGE = (
+    "1. Barbell Bench Press – Жим штанги лёжа Группа мышц: грудь "
+    "Ссылка: https://youtu.be/bench123 "
+    "2. Dumbbell Lateral Raise Название упражнения: Разведение гантелей в стороны "
+    "Группа мышц: плечи Ссылка: https://www.youtube.com/watch?v=raise456."
+)
+
+
+def make_index():
+    return ExerciseLinkIndex(extract_exercise_links(KNOWLEDGE, source="TrainerData.pdf"))
+
+
+def test_extract_exercise_links():
+    entries = extract_exercise_links(KNOWLEDGE, source="TrainerData.pdf")
+    assert [(e["name"], e["url"]) for e in entries] == [
+        ("Жим штанги лёжа", "https://youtu.be/bench123"),
+        ("Разведение гантелей в стороны", "https://www.youtube.com/watch?v=raise456"),
+    ]
+    assert "Barbell Bench Press" in entries[0]["aliases"]
+    assert entries[0]["source"] == "TrainerData.pdf"
+
+
+def test_match_exact_and_fuzzy():
+    index = make_index()
+
+    entry, score = index.match("жим штанги лежа")
+    assert (entry["url"], score) == ("https://youtu.be/bench123", 1.0)
+
+    entry, score = index.match("Разведения гантелями в сторону стоя")
+    assert entry["url"] == "https://www.youtube.com/watch?v=raise456"
+    assert index.threshold <= score < 1.0
+
+
+def test_match_below_threshold_does_not_invent_link():
+    index = make_index()
+    assert index.match("Становая тяга") is None
+    plan, added = index.annotate("- Становая тяга – 3 подхода по 5")
+    assert (plan, added) == ("- Становая тяга – 3 подхода по 5", 0)
+
+
+def test_annotate_stream_with_split_chunks():
+    index = make_index()
+    plan = (
+        "Понедельник:\n"
+        "- Жим штанги лёжа – 4x8\n"
+        "- Разведение гантелей в стороны – 3 подхода\n"
+        "- Жим штанги лёжа: см. https://youtu.be/bench123\n"
+        "- Планка"
+    )
+    # Строки и уже стоящая в плане ссылка приходят кусками по 3 символа
+    chunks = [plan[i:i + 3] for i in range(0, len(plan), 3)]
+
+    expected, added = index.annotate(plan)
+    assert added == 2
+    assert "".join(index.annotate_stream(chunks)) == expected
+    assert expected.count("https://youtu.be/bench123") == 2
+
+    async def agen():
+        for chunk in chunks:
+            yield chunk
+
+    async def collect():
+        return "".join([line async for line in index.annotate_stream_async(agen())])
+
+    assert asyncio.run(collect()) == expected
@@ -0,0 +1,51 @@
+from langchain_core.documents import Document
+
+from agents.nutrition_retriever import CachingArxivRetriever
+
+
+class ListFetcher:
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = 0
+
+    def invoke(self, query):
+        self.calls += 1
+        return self.results.pop(0)
+
+
+def test_empty_results_are_not_cached(tmp_path):
+    fetcher = ListFetcher([], [Document(page_content="Protein intake", metadata={"Title": "Protein"})])
+    retriever = CachingArxivRetriever(fetcher, cache_path=tmp_path / "arxiv.sqlite3")
+
+    assert retriever.invoke("protein for athletes") == []
+    assert [d.page_content for d in retriever.invoke("protein for athletes")] == ["Protein intake"]
+    assert [d.page_content for d in retriever.invoke("protein for athletes")] == ["Protein intake"]
+    assert fetcher.calls == 2
+
+
+def test_stale_results_are_refetched_but_served_offline(tmp_path):
+    cache_path = tmp_path / "arxiv.sqlite3"
+    fetcher = ListFetcher([Document(page_content="old", metadata={})], [Document(page_content="new", metadata={})])
+    retriever = CachingArxivRetriever(fetcher, cache_path=cache_path, max_age_seconds=60)
+    retriever.invoke("creatine")
+    retriever._conn.execute("UPDATE arxiv_results SET fetched_at = fetched_at - 120")
+    retriever._conn.commit()
+
+    offline = CachingArxivRetriever(cache_path=cache_path, offline=True, max_age_seconds=60)
+    assert [d.page_content for d in offline.invoke("creatine")] == ["old"]
+    assert [d.page_content for d in retriever.invoke("creatine")] == ["new"]
+
+
+def test_arxiv_error_document_is_not_cached_or_returned(tmp_path):
+    error = Document(page_content="Arxiv exception: HTTP 503")
+    article = Document(page_content="Creatine and strength", metadata={"Title": "Creatine"})
+    fetcher = ListFetcher([error], [Document(page_content="  ", metadata={}), article])
+    retriever = CachingArxivRetriever(fetcher, cache_path=tmp_path / "arxiv.sqlite3")
+
+    assert retriever.invoke("creatine") == []
+    assert retriever.stats()["fetch_errors"] == 1
+    assert [d.page_content for d in retriever.invoke("creatine")] == ["Creatine and strength"]
+
+    corpus = tmp_path / "corpus.jsonl"
+    assert retriever.export_corpus(corpus) == 1
+    assert "Arxiv exception" not in corpus.read_text(encoding="utf-8")
@@ -0,0 +1,175 @@
+import hashlib
+import time
+
+import numpy as np
+import pytest
+
+from agents.plan_cache import PlanProfile, PlanStore, ProfileExtractor, adjust_plan, resting_energy
+
+
+class HashEmbeddings:
+    """
+    Детерминированные «эмбеддинги» по основам слов — для проверки путей
+    с моделью без её загрузки.
+    """
+
+    def _vector(self, text):
+        vector = np.zeros(128)
+        for word in text.lower().split():
+            vector[int(hashlib.md5(word[:5].encode()).hexdigest(), 16) % 128] += 1
+        return vector.tolist()
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+    def embed_documents(self, texts):
+        return [self._vector(t) for t in texts]
+
+
+@pytest.fixture
+def extractor():
+    return ProfileExtractor()
+
+
+# ----------------------------------------------------------------------
+# ProfileExtractor.extract
+# ----------------------------------------------------------------------
+
+def test_extract_full_profile(extractor):
+    profile = extractor.extract("Мне 25 лет, вес 82 кг, хочу похудеть, 3 раза в неделю в зале")
+    assert (profile.goal, profile.age, profile.weight, profile.days, profile.place) == ("fat_loss", 25, 82, 3, "gym")
+    assert profile.cacheable
+    assert profile.key() == "goal=fat_loss|sex=-|age=18-29|weight=80-89|sport=-|days=3|place=gym|diet=-"
+
+
+def test_extract_female_diet_and_decimal_weight(extractor):
+    profile = extractor.extract("Девушка 34 года, 60,5 кг, веган без лактозы, рацион для набора массы")
+    assert (profile.sex, profile.age, profile.weight, profile.goal) == ("f", 34, 60.5, "mass")
+    assert profile.diet == ("lactose_free", "vegan")
+
+
+def test_extract_ignores_target_weight_and_experience(extractor):
+    profile = extractor.extract("Хочу похудеть на 10 кг, вешу 95")
+    assert profile.weight == 95
+
+    profile = extractor.extract("Тренируюсь 5 лет, мне 28, сплит на четыре дня для опытного, хочу массу")
+    assert (profile.age, profile.days, profile.level) == (28, 4, "advanced")
+
+
+def test_extract_level_beginner(extractor):
+    assert extractor.extract("Программа для зала 3 раза в неделю для новичка").level == "beginner"
+    assert extractor.extract("Я новичок, хочу похудеть, тренировки дома").level == "beginner"
+
+
+@pytest.mark.parametrize("query", [
+    "Составь программу тренировок на ноги",
+    "Составь программу тренировок на спину и бицепс",
+    "Хочу похудеть",
+])
+def test_extract_underspecified_is_not_cacheable(extractor, query):
+    assert not extractor.extract(query).cacheable
+
+
+@pytest.mark.parametrize("query", [
+    "Программа для мужчины 45 лет с больной спиной, хочу похудеть",
+    "План тренировок для похудения, мне 30 лет, болит колено",
+    "Хочу набрать массу, мне 20 лет, но ноет поясница",
+    "Мне 25 лет, хочу похудеть, упражнения без нагрузки на колени",
+    "Как правильно делать приседания, хочу массу, мне 20 лет",
+])
+def test_extract_health_and_questions_are_not_cacheable(extractor, query):
+    assert not extractor.extract(query).cacheable
+
+
+def test_extract_does_not_treat_bolshe_as_pain(extractor):
+    assert extractor.extract("Хочу похудеть и больше бегать, мне 30 лет, план").cacheable
+
+
+def test_extract_goal_by_embeddings():
+    extractor = ProfileExtractor(HashEmbeddings(), goal_threshold=0.3)
+    profile = extractor.extract("Хочу стать стройнее к лету, мне 30 лет, план")
+    assert profile.goal == "fat_loss"
+    assert profile.cacheable
+
+
+# ----------------------------------------------------------------------
+# adjust_plan
+# ----------------------------------------------------------------------
+
+def test_resting_energy_mifflin():
+    # 10 * 80 + 6.25 * 178 - 5 * 25 + 5
+    assert resting_energy(PlanProfile(sex="m", age=25, weight=80)) == pytest.approx(1792.5)
+    assert resting_energy(PlanProfile(sex="m", age=25)) is None
+
+
+def test_adjust_plan_scales_energy_and_rewrites_profile_numbers():
+    base = PlanProfile(sex="m", age=25, weight=80)
+    target = PlanProfile(sex="m", age=27, weight=86.5)
+    plan = "Для вас (25 лет, 80 кг): 2300–2500 ккал в день, 150 г белка. Белок 1,8 г/кг."
+    factor = resting_energy(target) / resting_energy(base)
+
+    adjusted, changed = adjust_plan(plan, base, target)
+
+    assert changed
+    assert f"{int(round(2300 * factor, -1))}–{int(round(2500 * factor, -1))} ккал" in adjusted
+    assert f"{int(round(150 * factor / 5) * 5)} г белка" in adjusted
+    assert "27 лет" in adjusted and "86,5 кг" in adjusted
+    # Норма на килограмм от веса не зависит
+    assert "1,8 г/кг" in adjusted
+
+
+def test_adjust_plan_shifts_sets_by_level():
+    plan = "- Жим лёжа – 3 подхода по 10\n- Присед 4x8\n- Тяга – 3–4 подхода\n- Планка 1 подход"
+
+    easier, _ = adjust_plan(plan, PlanProfile(), PlanProfile(level="beginner"))
+    assert easier == "- Жим лёжа – 2 подхода по 10\n- Присед 3x8\n- Тяга – 2–3 подхода\n- Планка 1 подход"
+
+    harder, _ = adjust_plan(plan, PlanProfile(), PlanProfile(level="advanced"))
+    assert harder == "- Жим лёжа – 4 подхода по 10\n- Присед 5x8\n- Тяга – 4–5 подходов\n- Планка 2 подхода"
+
+
+def test_adjust_plan_same_profile_is_unchanged():
+    profile = PlanProfile(sex="f", age=30, weight=60)
+    plan = "1800 ккал, 3 подхода"
+    assert adjust_plan(plan, profile, profile) == (plan, False)
+
+
+# ----------------------------------------------------------------------
+# PlanStore
+# ----------------------------------------------------------------------
+
+def test_store_without_embeddings_serves_only_same_query():
+    store = PlanStore(":memory:")
+    store.put("trainer", "Мне 20 лет, хочу набрать массу, тренировки на ноги", "ПЛАН НОГИ")
+
+    assert store.get("trainer", "мне 20 лет, хочу набрать массу, тренировки на ноги!") == "ПЛАН НОГИ"
+    assert store.get("trainer", "Мне 20 лет, хочу набрать массу, тренировки на спину") is None
+
+
+def test_store_with_embeddings_checks_similarity_and_adjusts():
+    store = PlanStore(":memory:", ProfileExtractor(HashEmbeddings()), match_threshold=0.7)
+    store.put("nutritionist", "Мне 25 лет, вес 80 кг, хочу похудеть, рацион", "25 лет, 80 кг: 2400 ккал")
+
+    adjusted = store.get("nutritionist", "Мне 27 лет, вес 84 кг, хочу похудеть, рацион")
+    assert adjusted is not None and "27 лет, 84 кг" in adjusted and "2400 ккал" not in adjusted
+    assert store.get("nutritionist", "Мне 27 лет, вес 84 кг, хочу похудеть, меню из трёх блюд без сахара") is None
+
+    stats = store.stats()
+    assert (stats["hits"], stats["adjusted"], stats["misses"]) == (1, 1, 1)
+
+
+def test_store_ttl_and_invalidation():
+    query = "Мне 20 лет, хочу набрать массу, тренировки в зале"
+    store = PlanStore(":memory:", ttl_seconds=0.05)
+    store.put("trainer", query, "план")
+    time.sleep(0.1)
+    assert store.get("trainer", query) is None
+    assert store.stats()["stale"] == 1
+
+    store = PlanStore(":memory:")
+    store.put("trainer", query, "план")
+    store.put("nutritionist", query, "рацион")
+    key = store.profile_key("trainer", store.extractor.extract(query))
+    assert store.invalidate(profile_key=key, namespace="trainer") == 1
+    assert store.get("trainer", query) is None
+    assert store.get("nutritionist", query) == "рацион"
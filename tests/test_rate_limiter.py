@@ -0,0 +1,87 @@
+import asyncio
+
+import httpx
+import pytest
+
+from agents.rate_limiter import LLMScheduler
+
+
+def _scheduler():
+    return LLMScheduler(requests_per_second=1000, max_retries=2, base_delay=0.001, max_delay=0.001)
+
+
+def test_acall_retries_dropped_keepalive_connection():
+    scheduler = _scheduler()
+    errors = [httpx.RemoteProtocolError("Server disconnected"), httpx.ReadError("Connection reset")]
+
+    async def request():
+        if errors:
+            raise errors.pop(0)
+        return "ответ"
+
+    assert asyncio.run(scheduler.acall(request)) == "ответ"
+    stats = scheduler.stats()
+    assert (stats["retries"], stats["errors"]) == (2, 0)
+
+
+def test_call_does_not_retry_client_errors():
+    scheduler = _scheduler()
+    calls = []
+
+    def request():
+        calls.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        scheduler.call(request)
+    assert len(calls) == 1
+
+
+def test_retries_do_not_reserve_tokens_again():
+    scheduler = LLMScheduler(
+        requests_per_second=1000, tokens_per_minute=10_000, max_retries=3, base_delay=0.001, max_delay=0.001
+    )
+    errors = [httpx.ReadError("reset")] * 3
+
+    def request():
+        if errors:
+            raise errors.pop()
+        return "ответ"
+
+    assert scheduler.call(request, estimated_tokens=4000) == "ответ"
+    # Три повтора не списали ещё 12 000 токенов: остаток ≈ 10 000 - 4 000
+    assert scheduler.token_bucket._tokens == pytest.approx(6000, abs=50)
+
+
+def test_chat_stream_records_usage_when_closed_early():
+    from types import SimpleNamespace
+
+    from agents.llm import SimpleLLM
+
+    def event(content, usage=None):
+        delta = SimpleNamespace(content=content)
+        return SimpleNamespace(data=SimpleNamespace(usage=usage, choices=[SimpleNamespace(delta=delta)]))
+
+    class Stream(list):
+        closed = False
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            Stream.closed = True
+
+    usage = SimpleNamespace(prompt_tokens=10, completion_tokens=5, total_tokens=15)
+    stream = Stream([event("Жим ", usage), event("лёжа"), event(" 3x10")])
+    client = SimpleNamespace(chat=SimpleNamespace(stream=lambda **kwargs: stream))
+
+    recorded = []
+    scheduler = _scheduler()
+    scheduler.record_usage = lambda estimated, actual: recorded.append(actual)
+
+    chunks = SimpleLLM(client, "mistral-small-latest", scheduler=scheduler).chat_stream("план")
+    assert next(chunks) == "Жим "
+    chunks.close()
+
+    assert recorded == [15]
+    assert Stream.closed
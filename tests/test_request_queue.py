@@ -0,0 +1,93 @@
+import asyncio
+import threading
+
+import pytest
+
+from agents.async_runtime import AsyncRuntime
+from agents.request_queue import FairRequestQueue, QueueFullError
+
+
+def test_slots_go_round_robin_between_users():
+    order = []
+
+    async def scenario():
+        queue = FairRequestQueue(max_concurrency=1, max_queue=10, max_per_user=3)
+        gate = asyncio.Event()
+
+        def job(name, first=False):
+            async def fn():
+                order.append(name)
+                if first:
+                    await gate.wait()
+            return fn
+
+        # a1 занимает единственный слот, остальные встают в очередь: сначала все a, потом b
+        tasks = [asyncio.create_task(queue.run("a", job("a1", first=True)))]
+        await asyncio.sleep(0)
+        for name in ("a2", "a3"):
+            tasks.append(asyncio.create_task(queue.run("a", job(name))))
+        for name in ("b1", "b2"):
+            tasks.append(asyncio.create_task(queue.run("b", job(name))))
+        await asyncio.sleep(0)
+        gate.set()
+        await asyncio.gather(*tasks)
+        return queue.stats()
+
+    stats = asyncio.run(scenario())
+    assert order == ["a1", "a2", "b1", "a3", "b2"]
+    assert (stats["completed"], stats["active"], stats["depth"]) == (5, 0, 0)
+
+
+def test_queue_rejects_at_capacity():
+    async def scenario():
+        queue = FairRequestQueue(max_concurrency=1, max_queue=1, max_per_user=2)
+        gate = asyncio.Event()
+
+        async def blocked():
+            await gate.wait()
+
+        running = asyncio.create_task(queue.run("a", blocked))
+        waiting = asyncio.create_task(queue.run("b", blocked))
+        await asyncio.sleep(0)
+
+        with pytest.raises(QueueFullError) as full:
+            await queue.run("c", blocked)
+        assert full.value.reason == "очередь заполнена"
+
+        queue.max_queue = 10
+        queue_task = asyncio.create_task(queue.run("a", blocked))
+        await asyncio.sleep(0)
+        with pytest.raises(QueueFullError) as per_user:
+            await queue.run("a", blocked)
+        assert per_user.value.user_id == "a"
+
+        gate.set()
+        await asyncio.gather(running, waiting, queue_task)
+        return queue.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["rejected"] == 2 and stats["completed"] == 3
+
+
+def test_abandoned_iterate_cancels_the_pump():
+    runtime = AsyncRuntime(name="test-runtime")
+    cancelled = threading.Event()
+
+    async def endless():
+        try:
+            i = 0
+            while True:
+                await asyncio.sleep(0.001)
+                i += 1
+                yield i
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    try:
+        items = runtime.iterate(endless())
+        assert [next(items), next(items)] == [1, 2]
+        items.close()
+        assert cancelled.wait(timeout=5)
+    finally:
+        runtime.close()
@@ -0,0 +1,55 @@
+import os
+
+from agents.resources import ResourceRegistry
+
+
+def _touch(path, mtime):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"x")
+    os.utime(path, (mtime, mtime))
+
+
+def test_registry_prefers_newer_trainer_store(tmp_path):
+    db_path, store_path = tmp_path / "trainer_vectordb", tmp_path / "trainer_store"
+    registry = ResourceRegistry(db_path=db_path, store_path=store_path)
+
+    _touch(db_path / "index.faiss", 1000)
+    assert not registry._use_compact_store()
+
+    _touch(store_path / "store.json", 2000)
+    assert registry._use_compact_store()
+    signature = registry._read_index_signature()
+
+    # Пересборка pickle-базы без миграции: берём её и замечаем изменение
+    _touch(db_path / "index.faiss", 3000)
+    assert not registry._use_compact_store()
+    assert registry._read_index_signature() != signature
+
+
+def test_local_nutrition_retriever_from_sample_abstracts(tmp_path, monkeypatch):
+    from langchain_core.embeddings import FakeEmbeddings
+
+    from helpers.creating_nutrition_db import NUTRITION_SOURCE_DIR, setup_nutrition_database
+
+    embeddings = FakeEmbeddings(size=32)
+    nutrition_path = tmp_path / "nutrition_vectordb"
+    setup_nutrition_database(NUTRITION_SOURCE_DIR, str(nutrition_path), embeddings_model=embeddings)
+
+    monkeypatch.delenv("NUTRITION_RETRIEVER", raising=False)
+    registry = ResourceRegistry(nutrition_path=nutrition_path)
+    registry._resources["embeddings"] = embeddings
+
+    documents = registry.nutritionist_retriever().invoke("protein intake for muscle gain")
+    assert len(documents) == 5
+    assert all(d.metadata["source"] == "sample_abstracts.jsonl" for d in documents)
+
+
+def test_coach_retriever_passes_k_to_the_index(tmp_path):
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.embeddings import FakeEmbeddings
+
+    registry = ResourceRegistry(db_path=tmp_path / "trainer_vectordb", store_path=tmp_path / "trainer_store")
+    registry._resources["vectordb"] = FAISS.from_texts([f"фрагмент {i}" for i in range(30)], FakeEmbeddings(size=16))
+    registry._index_signature = registry._read_index_signature()
+
+    assert len(registry.coach_retriever(k=15).invoke("жим лёжа")) == 15
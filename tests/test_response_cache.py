@@ -0,0 +1,32 @@
+from agents.response_cache import ResponseCache, cached_agent
+
+
+class FixedEmbeddings:
+    """
+    Все запросы получают один и тот же вектор — любое сравнение «похоже».
+    """
+
+    def embed_query(self, text):
+        return [1.0, 0.0, 0.0]
+
+
+def test_agent_cache_is_exact_only_by_default():
+    cache = ResponseCache(":memory:", embeddings=FixedEmbeddings())
+    calls = []
+    agent = cached_agent(lambda llm, prompt, retriever=None: calls.append(prompt) or f"план: {prompt}", cache, "trainer")
+
+    assert agent(None, "Мне 20 лет, вес 70 кг, хочу массу") == "план: Мне 20 лет, вес 70 кг, хочу массу"
+    assert agent(None, "Мне 45 лет, вес 95 кг, хочу массу") == "план: Мне 45 лет, вес 95 кг, хочу массу"
+    assert agent(None, "мне 20 лет, вес 70 кг, хочу массу!") == "план: Мне 20 лет, вес 70 кг, хочу массу"
+    assert len(calls) == 2
+
+
+def test_expired_exact_entry_falls_back_to_semantic_match():
+    cache = ResponseCache(":memory:", embeddings=FixedEmbeddings(), semantic_threshold=0.9, ttl_seconds=60)
+    cache.put("trainer", "старый запрос", "старый ответ")
+    cache.put("trainer", "свежий запрос", "свежий ответ")
+    # Запись устарела, но вытеснение её ещё не удалило
+    cache._conn.execute("UPDATE entries SET created_at = created_at - 120 WHERE query = 'старый запрос'")
+
+    assert cache.get("trainer", "старый запрос") == "свежий ответ"
+    assert cache.stats()["semantic_hits"] == 1
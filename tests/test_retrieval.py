@@ -0,0 +1,38 @@
+import threading
+
+from agents.retrieval import MAX_IN_FLIGHT_PER_RETRIEVER, join_retrieval, start_retrieval
+
+
+class HangingRetriever:
+    def __init__(self):
+        self.release = threading.Event()
+
+    def invoke(self, query):
+        self.release.wait(5)
+        return []
+
+
+class LocalRetriever:
+    def invoke(self, query):
+        return [query]
+
+
+def test_hung_retriever_does_not_block_other_kinds():
+    hanging = HangingRetriever()
+    try:
+        for _ in range(MAX_IN_FLIGHT_PER_RETRIEVER):
+            assert join_retrieval(start_retrieval(hanging, "белок"), timeout=0.01) is None
+
+        # Слоты зависшего вида заняты — новый поиск пропускается сразу
+        assert start_retrieval(hanging, "белок") is None
+        # Другой вид ретривера работает в своём пуле
+        assert join_retrieval(start_retrieval(LocalRetriever(), "жим"), timeout=1) == ["жим"]
+    finally:
+        hanging.release.set()
+
+
+def test_slots_are_released_when_calls_finish():
+    retriever = LocalRetriever()
+    for _ in range(MAX_IN_FLIGHT_PER_RETRIEVER * 3):
+        future = start_retrieval(retriever, "присед")
+        assert join_retrieval(future, timeout=1) == ["присед"]
@@ -0,0 +1,135 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from agents import tracing
+from agents.tracing import InMemoryExporter, JsonlExporter, PrometheusExporter, breakdown, configure_tracing, traced
+
+DELAY = 0.02
+
+
+@pytest.fixture
+def exporter():
+    previous = tracing._tracer
+    exporter = InMemoryExporter()
+    configure_tracing([exporter])
+    yield exporter
+    tracing._tracer = previous
+
+
+@traced("stage")
+def plain():
+    time.sleep(DELAY)
+    return "ok"
+
+
+@traced("stage")
+def generator():
+    for item in ("a", "b"):
+        time.sleep(DELAY / 2)
+        yield item
+
+
+@traced("stage")
+async def coroutine():
+    await asyncio.sleep(DELAY)
+    return "ok"
+
+
+@traced("stage")
+async def async_generator():
+    for item in ("a", "b"):
+        await asyncio.sleep(DELAY / 2)
+        yield item
+
+
+@traced("request", root=True)
+def request_plain():
+    return plain()
+
+
+@traced("request", root=True)
+def request_generator():
+    return list(generator())
+
+
+@traced("request", root=True)
+async def request_coroutine():
+    return await coroutine()
+
+
+@traced("request", root=True)
+async def request_async_generator():
+    return [item async for item in async_generator()]
+
+
+@pytest.mark.parametrize("run", [
+    request_plain,
+    request_generator,
+    lambda: asyncio.run(request_coroutine()),
+    lambda: asyncio.run(request_async_generator()),
+])
+def test_traced_nests_and_times_every_callable_kind(exporter, run):
+    run()
+
+    assert len(exporter.traces) == 1
+    spans = {s.name: s for s in exporter.traces[0]}
+    assert set(spans) == {"request", "stage"}
+    assert spans["stage"].parent_id == spans["request"].span_id
+    assert spans["stage"].trace_id == spans["request"].trace_id
+    assert spans["stage"].duration >= DELAY * 0.9
+    assert spans["request"].duration >= spans["stage"].duration
+
+
+def test_untraced_call_outside_request_records_nothing(exporter):
+    assert plain() == "ok"
+    assert exporter.traces == []
+
+
+def test_error_is_recorded_and_breakdown_is_indented(exporter):
+    @traced("failing")
+    def failing():
+        raise ValueError("boom")
+
+    @traced("request", root=True)
+    def request():
+        plain()
+        with pytest.raises(ValueError):
+            failing()
+
+    request()
+    rows = breakdown(exporter.traces[0])
+    assert [row["stage"] for row in rows] == ["request", "  stage", "  failing"]
+    assert rows[2]["error"] == "ValueError: boom"
+    assert rows[1]["ms"] >= DELAY * 1000 * 0.9
+
+
+def test_jsonl_exporter_writes_every_finished_span(tmp_path):
+    path = tmp_path / "traces" / "spans.jsonl"
+    previous = tracing._tracer
+    configure_tracing([JsonlExporter(path)])
+    try:
+        request_generator()
+        asyncio.run(request_coroutine())
+    finally:
+        tracing._tracer = previous
+
+    records = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert len(records) == 2
+    for record in records:
+        assert sorted(s["name"] for s in record["spans"]) == ["request", "stage"]
+        assert all(s["trace_id"] == record["trace_id"] for s in record["spans"])
+        assert len({s["span_id"] for s in record["spans"]}) == 2
+
+
+def test_prometheus_exporter_renders_histogram_and_counters(exporter):
+    metrics = PrometheusExporter(buckets=(0.001, 10.0))
+    request_plain()
+    metrics.export(exporter.traces[0])
+
+    text = metrics.render()
+    assert 'fitness_stage_duration_seconds_bucket{stage="stage",le="0.001"} 0' in text
+    assert 'fitness_stage_duration_seconds_bucket{stage="stage",le="10.0"} 1' in text
+    assert 'fitness_stage_duration_seconds_count{stage="request"} 1' in text